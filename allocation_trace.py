@@ -0,0 +1,90 @@
+"""
+Structured trace of an allocation run
+
+The engines record what they decide into an AllocationTrace instead of
+printing it, one event per decision:
+
+    {"n": 17, "level": "decision", "phase": "phase1", "event": "assigned",
+     "employee": "employee3", "shift": 12, "rank": 4}
+
+Levels, each including the ones before it:
+
+    phase      one event per phase (how many employees it took on)
+    decision   every assignment, backup assignment and failure
+    candidate  every shift tried and why it was passed over
+               (full, same_weekend, same_day)
+
+Events go into a ring buffer of `capacity`; once it's full the oldest are
+dropped (and counted). With sample below 1 only that fraction of employees
+is traced - picked by a hash of the username, so an employee's events are
+either all there or not at all. By default only phase events are kept;
+the app saves the last run's trace to data/allocation_trace.json (none
+when tracing is off).
+"""
+
+import os
+import zlib
+from collections import deque
+
+LEVELS = ('off', 'phase', 'decision', 'candidate')
+# Just the phase events unless asked for more (ALLOCATION_TRACE, or ?trace= on one run)
+DEFAULT_LEVEL = os.environ.get('ALLOCATION_TRACE', 'phase')
+DEFAULT_SAMPLE = float(os.environ.get('ALLOCATION_TRACE_SAMPLE', 1.0))
+DEFAULT_CAPACITY = 5000
+
+_DEPTH = {level: depth for depth, level in enumerate(LEVELS)}
+
+
+class AllocationTrace:
+    def __init__(self, level=DEFAULT_LEVEL, sample=DEFAULT_SAMPLE, capacity=DEFAULT_CAPACITY):
+        if level not in _DEPTH:
+            raise ValueError(f"Unknown trace level '{level}' (use {', '.join(LEVELS)})")
+        if not 0 <= sample <= 1:
+            raise ValueError('Trace sample must be between 0 and 1')
+        self.level = level
+        self.depth = _DEPTH[level]
+        self.sample = sample
+        self.events = deque(maxlen=capacity)
+        self.recorded = 0
+
+    def wants(self, level):
+        """Whether events of this level are kept - check before building costly ones"""
+        return self.depth >= _DEPTH[level]
+
+    def sampled(self, employee):
+        return self.sample >= 1 or zlib.crc32(employee.encode('utf-8')) < self.sample * 2 ** 32
+
+    def record(self, level, phase, event, employee=None, **fields):
+        if self.depth < _DEPTH[level] or (employee is not None and not self.sampled(employee)):
+            return
+        self.recorded += 1
+        self.events.append({'n': self.recorded, 'level': level, 'phase': phase, 'event': event,
+                            'employee': employee, **fields})
+
+    def to_dict(self):
+        return {
+            'level': self.level,
+            'sample': self.sample,
+            'capacity': self.events.maxlen,
+            'recorded': self.recorded,
+            'dropped': self.recorded - len(self.events),
+            'events': list(self.events)
+        }
+
+
+def record_assignments(trace, phase, assignments, preferences, employees=None):
+    """'assigned' decisions (with preference rank) for a finished allocation"""
+    if trace is None or not trace.wants('decision'):
+        return
+    for emp in assignments if employees is None else employees:
+        top_12 = (preferences.get(emp) or {}).get('top_12', [])
+        for shift_id in sorted(assignments.get(emp, [])):
+            rank = top_12.index(shift_id) + 1 if shift_id in top_12 else None
+            trace.record('decision', phase, 'assigned', emp, shift=shift_id, rank=rank)
+
+
+def filter_events(events, employee=None, phase=None, event=None):
+    return [e for e in events
+            if (employee is None or e['employee'] == employee)
+            and (phase is None or e['phase'] == phase)
+            and (event is None or e['event'] == event)]
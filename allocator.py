@@ -0,0 +1,629 @@
+"""
+Shift allocation engines
+
+greedy_allocate  - the original two-phase allocator: shuffled first pass,
+                   then second shifts in worst-off-first order
+multi_seed_allocate - greedy_allocate over many seeds in parallel, keeping
+                   the best-scoring run
+optimal_allocate - one min-cost flow over the employee x shift graph, so
+                   no one is stranded by an unlucky processing order
+repair_allocate  - patch an existing allocation after a few changes: only
+                   the freed slots and the employees short of shifts move
+
+All take the ShiftIndex, the non-manager employee list and the raw
+preferences dict, and return (assignments, shift_assignments, warnings)
+(repair_allocate also takes the current assignments, and returns who moved).
+"""
+
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from allocation_trace import AllocationTrace, record_assignments
+from min_cost_flow import MinCostFlow
+from rank_matrix import RankMatrix
+
+SHIFTS_PER_EMPLOYEE = 2
+DEFAULT_SEED = 42
+TOP_N = 12
+BOTTOM_N = 6
+
+# Min-cost flow edge costs. Ranked shifts cost rank^2 so one terrible shift
+# costs more than two mediocre ones; unranked (non-bottom-6) shifts always
+# cost more than any ranked shift, ordered by the general shift-type ranking.
+NEUTRAL_COST = (TOP_N + 1) ** 2 + 30
+NO_PREFERENCE_COST = NEUTRAL_COST + 10
+# Leaving a quota slot empty dwarfs any assignment cost; a second empty
+# slot costs double so the solver spreads shortfalls across employees.
+UNASSIGNED_COST = 10000
+# Unranked shifts are interchangeable apart from their kind, so each
+# employee gets at most this many unranked edges per kind: all of them for
+# seasons up to 24 weekends (the solve is then exact), beyond that a window
+# of the kind's shifts that moves on with each employee, so together the
+# employees cover every shift evenly. That makes long seasons an
+# approximation - a shortfall can remain that edges to other shifts would
+# have avoided - traded for a graph that grows with the roster, not with
+# roster x season.
+FALLBACK_EDGES_PER_KIND = 24
+
+
+def has_complete_preferences(prefs):
+    return bool(prefs) and len(prefs.get('top_12', [])) == TOP_N and len(prefs.get('bottom_6', [])) == BOTTOM_N
+
+def split_by_preferences(employee_list, preferences):
+    """Split employees into (with complete preferences, without)"""
+    employees_with_prefs = []
+    employees_without_prefs = []
+    
+    for emp in employee_list:
+        if has_complete_preferences(preferences.get(emp)):
+            employees_with_prefs.append(emp)
+        else:
+            employees_without_prefs.append(emp)
+    
+    return employees_with_prefs, employees_without_prefs
+
+def calculate_satisfaction_score(rank_matrix, emp, assigned_shift_id):
+    """
+    Calculate satisfaction score for a single assigned shift.
+    Lower score = better (based on preference rank)
+    """
+    rank = rank_matrix.rank(emp, assigned_shift_id)
+    
+    if rank > 0:
+        return rank
+    else:
+        # Not in top preferences - assign high penalty score
+        return 999
+
+def has_same_weekend_conflict(employee_shifts, new_shift_id, shift_index):
+    """
+    Check if assigning new_shift_id would create two shifts on same weekend.
+    Returns True if there's a conflict.
+    """
+    new_week = shift_index.week_of(new_shift_id)
+    
+    # Check all employee's existing shifts
+    for shift_id in employee_shifts:
+        if shift_index.week_of(shift_id) == new_week:
+            return True
+    
+    return False
+
+def has_consecutive_shift_conflict(employee_shifts, new_shift_id, shift_index):
+    """
+    Check if assigning new_shift_id would create consecutive/overlapping shifts.
+    This catches Sunday 8am-4pm + Sunday 3pm-10pm on same day.
+    Returns True if there's a conflict.
+    """
+    new_date = shift_index.date_of(new_shift_id)
+    
+    # Check all employee's existing shifts - any two shifts on the same date overlap
+    for shift_id in employee_shifts:
+        if shift_index.date_of(shift_id) == new_date:
+            return True
+    
+    return False
+
+def _record_phase(phase_times, name, started):
+    """Add the seconds since `started` to phase_times[name] (if timing was requested); returns now"""
+    now = time.perf_counter()
+    if phase_times is not None:
+        phase_times[name] = phase_times.get(name, 0.0) + now - started
+    return now
+
+def _conflict(employee_shifts, shift_id, shift_assignments, shift_index):
+    """Why shift_id can't go to an employee holding employee_shifts ('full', 'same_weekend', 'same_day'), or None"""
+    if len(shift_assignments[shift_id]) >= shift_index.slots_of(shift_id):
+        return 'full'
+    if has_same_weekend_conflict(employee_shifts, shift_id, shift_index):
+        return 'same_weekend'
+    if has_consecutive_shift_conflict(employee_shifts, shift_id, shift_index):
+        return 'same_day'
+    return None
+
+def greedy_allocate(shift_index, employee_list, preferences, seed=DEFAULT_SEED, phase_times=None, trace=None):
+    """
+    Two-phase preference allocation (see README "Allocation Algorithm").
+    Outcome depends on the shuffle order of employees, which is drawn from
+    a private random.Random(seed) - the same seed always gives the same result.
+    Pass a dict as phase_times to get seconds spent per phase, and an
+    AllocationTrace as trace to get every decision it made.
+    """
+    lap = time.perf_counter()
+    
+    # Separate employees into two groups:
+    # 1. Those with complete preferences (top 12 + bottom 6)
+    # 2. Those without complete preferences (will be randomly assigned)
+    employees_with_prefs, employees_without_prefs = split_by_preferences(employee_list, preferences)
+    rank_matrix = RankMatrix(employees_with_prefs, shift_index.ids, preferences)
+    
+    # Initialize assignments
+    assignments = {emp: [] for emp in employee_list}
+    shift_assignments = {shift_id: [] for shift_id in shift_index.by_id}
+    warnings = []  # Track employees who were randomly assigned
+    
+    # Private RNG so runs are reproducible and independent of each other
+    rng = random.Random(seed)
+    
+    # Looked up once: the candidate loops only pay for tracing when it's on
+    if trace is None:
+        trace = AllocationTrace('off')
+    candidates = trace.wants('candidate')
+    
+    lap = _record_phase(phase_times, 'setup', lap)
+    
+    # PHASE 1: Preference-based allocation for employees with complete preferences
+    trace.record('phase', 'phase1', 'started', employees=len(employees_with_prefs))
+    
+    shuffled_employees = employees_with_prefs.copy()
+    rng.shuffle(shuffled_employees)
+    
+    for emp in shuffled_employees:
+        prefs = preferences[emp]
+        top_12 = prefs['top_12']
+        bottom_6 = prefs['bottom_6']
+        
+        # Try to assign from top 12 preferences
+        assigned = False
+        for rank, shift_id in enumerate(top_12, start=1):
+            # Skip if shift is full or would give them two shifts on a weekend / day
+            reason = _conflict(assignments[emp], shift_id, shift_assignments, shift_index)
+            if reason:
+                if candidates:
+                    trace.record('candidate', 'phase1', 'rejected', emp, shift=shift_id, rank=rank, reason=reason)
+                continue
+            
+            # Assign shift
+            assignments[emp].append(shift_id)
+            shift_assignments[shift_id].append(emp)
+            assigned = True
+            trace.record('decision', 'phase1', 'assigned', emp, shift=shift_id, rank=rank)
+            break
+        
+        # If couldn't assign from top 12, try non-bottom-6 shifts
+        if not assigned:
+            shift_type_pref = prefs.get('shift_type_pref', {})
+            # Sort shift types by preference (1=best, 3=worst)
+            sorted_types = sorted(shift_type_pref.items(), key=lambda x: x[1])
+            
+            for shift_type, _ in sorted_types:
+                # Only shifts of this kind, in chronological order
+                for shift_id in shift_index.ids_of_kind(shift_type):
+                    # Skip if in bottom 6
+                    if shift_id in bottom_6:
+                        continue
+                    
+                    # Skip if already assigned this shift
+                    if shift_id in top_12:  # Already tried these
+                        continue
+                    
+                    reason = _conflict(assignments[emp], shift_id, shift_assignments, shift_index)
+                    if reason:
+                        if candidates:
+                            trace.record('candidate', 'phase1', 'rejected', emp, shift=shift_id, reason=reason)
+                        continue
+                    
+                    # Assign shift
+                    assignments[emp].append(shift_id)
+                    shift_assignments[shift_id].append(emp)
+                    assigned = True
+                    trace.record('decision', 'phase1', 'backup', emp, shift=shift_id, kind=shift_type)
+                    break
+                
+                if assigned:
+                    break
+        
+        if not assigned:
+            trace.record('decision', 'phase1', 'unassigned', emp)
+    
+    lap = _record_phase(phase_times, 'phase1', lap)
+    
+    # PHASE 2: Second shift allocation for employees with preferences (sorted by satisfaction from Phase 1)
+    
+    # Calculate satisfaction scores from Phase 1
+    employee_satisfaction = []
+    for emp in employees_with_prefs:
+        if len(assignments[emp]) > 0:
+            score = calculate_satisfaction_score(rank_matrix, emp, assignments[emp][0])
+            employee_satisfaction.append((emp, score))
+        else:
+            employee_satisfaction.append((emp, 9999))  # No first shift = highest priority
+    
+    # Sort by satisfaction (worst first), then randomize within same score
+    employee_satisfaction.sort(key=lambda x: (x[1], rng.random()))
+    trace.record('phase', 'phase2', 'started', employees=len(employee_satisfaction))
+    
+    for emp, phase1_score in employee_satisfaction:
+        # Skip if already has 2 shifts
+        if len(assignments[emp]) >= 2:
+            continue
+        
+        prefs = preferences[emp]
+        top_12 = prefs['top_12']
+        bottom_6 = prefs['bottom_6']
+        
+        # Try to assign from top 12 preferences
+        assigned = False
+        for rank, shift_id in enumerate(top_12, start=1):
+            # Skip if already assigned this shift
+            if shift_id in assignments[emp]:
+                continue
+            
+            reason = _conflict(assignments[emp], shift_id, shift_assignments, shift_index)
+            if reason:
+                if candidates:
+                    trace.record('candidate', 'phase2', 'rejected', emp, shift=shift_id, rank=rank, reason=reason)
+                continue
+            
+            # Assign shift
+            assignments[emp].append(shift_id)
+            shift_assignments[shift_id].append(emp)
+            assigned = True
+            trace.record('decision', 'phase2', 'assigned', emp, shift=shift_id, rank=rank, phase1_score=phase1_score)
+            break
+        
+        # If couldn't assign from top 12, try non-bottom-6 shifts
+        if not assigned:
+            shift_type_pref = prefs.get('shift_type_pref', {})
+            sorted_types = sorted(shift_type_pref.items(), key=lambda x: x[1])
+            
+            for shift_type, _ in sorted_types:
+                # Only shifts of this kind, in chronological order
+                for shift_id in shift_index.ids_of_kind(shift_type):
+                    # Skip if already assigned
+                    if shift_id in assignments[emp]:
+                        continue
+                    
+                    # Skip if in bottom 6
+                    if shift_id in bottom_6:
+                        continue
+                    
+                    reason = _conflict(assignments[emp], shift_id, shift_assignments, shift_index)
+                    if reason:
+                        if candidates:
+                            trace.record('candidate', 'phase2', 'rejected', emp, shift=shift_id, reason=reason)
+                        continue
+                    
+                    # Assign shift
+                    assignments[emp].append(shift_id)
+                    shift_assignments[shift_id].append(emp)
+                    assigned = True
+                    trace.record('decision', 'phase2', 'backup', emp, shift=shift_id, kind=shift_type)
+                    break
+                
+                if assigned:
+                    break
+        
+        if not assigned:
+            trace.record('decision', 'phase2', 'unassigned', emp)
+    
+    lap = _record_phase(phase_times, 'phase2', lap)
+    
+    # PHASE 3: Random assignment for employees without complete preferences
+    if employees_without_prefs:
+        trace.record('phase', 'phase3', 'started', employees=len(employees_without_prefs))
+        
+        for emp in employees_without_prefs:
+            warnings.append(f"{emp} was randomly assigned (no preferences submitted)")
+            
+            # Get all available shifts (not full, not creating weekend conflicts)
+            available_shifts = [shift_id for shift_id in shift_index.by_id
+                                if not _conflict(assignments[emp], shift_id, shift_assignments, shift_index)]
+            
+            # Randomly assign 2 shifts from available shifts
+            if len(available_shifts) >= 2:
+                selected_shifts = rng.sample(available_shifts, 2)
+                for shift_id in selected_shifts:
+                    assignments[emp].append(shift_id)
+                    shift_assignments[shift_id].append(emp)
+                    trace.record('decision', 'phase3', 'random', emp, shift=shift_id)
+            else:
+                trace.record('decision', 'phase3', 'unassigned', emp, available=len(available_shifts))
+                warnings.append(f"{emp} could not be fully assigned - insufficient available shifts")
+    
+    _record_phase(phase_times, 'phase3', lap)
+    
+    return assignments, shift_assignments, warnings
+
+def preference_cost(prefs, kind, complete=True):
+    """Flow cost of an unranked (non-bottom-6) shift of the given kind"""
+    if not complete:
+        return NO_PREFERENCE_COST
+    
+    type_prefs = prefs.get('shift_type_pref') or {}
+    try:
+        type_rank = int(type_prefs.get(kind, 3))
+    except (TypeError, ValueError):
+        type_rank = 3
+    return NEUTRAL_COST + type_rank
+
+def candidate_costs(shift_index, employee_list, preferences):
+    """
+    Edge costs per employee: {emp: {shift_id: cost}}.
+    Top-12 shifts cost rank^2, bottom-6 shifts get no edge, and up to
+    FALLBACK_EDGES_PER_KIND unranked shifts of each kind cost by shift type
+    (the same inputs always give the same edges).
+    """
+    employees_with_prefs, _ = split_by_preferences(employee_list, preferences)
+    complete = set(employees_with_prefs)
+    costs = {}
+    
+    for position, emp in enumerate(employee_list):
+        prefs = preferences.get(emp) or {}
+        banned = set(prefs.get('bottom_6', []))
+        emp_costs = {}
+        
+        if emp in complete:
+            for rank, shift_id in enumerate(prefs['top_12'], start=1):
+                if shift_id in shift_index and shift_id not in banned:
+                    emp_costs[shift_id] = rank * rank
+        
+        for kind, shift_ids in shift_index.ids_by_kind.items():
+            allowed = [sid for sid in shift_ids if sid not in banned and sid not in emp_costs]
+            if len(allowed) > FALLBACK_EDGES_PER_KIND:
+                start = position * FALLBACK_EDGES_PER_KIND % len(allowed)
+                allowed = (allowed[start:] + allowed[:start])[:FALLBACK_EDGES_PER_KIND]
+            cost = preference_cost(prefs, kind, emp in complete)
+            for shift_id in allowed:
+                emp_costs[shift_id] = cost
+        
+        costs[emp] = emp_costs
+    
+    return costs
+
+def _add_employee(mcf, shift_index, emp, emp_costs, shift_nodes, shift_edges, quota=SHIFTS_PER_EMPLOYEE, taken_weeks=()):
+    """
+    Add an employee who needs quota more shifts to the flow graph, with an
+    edge to each shift in emp_costs outside taken_weeks; the edge ids go
+    in shift_edges[(emp, shift_id)].
+    """
+    emp_node = mcf.add_node()
+    mcf.add_edge(0, emp_node, quota, 0)
+    # Convex shortfall penalty: each further empty slot costs more
+    for missing in range(SHIFTS_PER_EMPLOYEE - quota + 1, SHIFTS_PER_EMPLOYEE + 1):
+        mcf.add_edge(emp_node, 1, 1, UNASSIGNED_COST * missing)
+    
+    by_week = {}
+    for shift_id in emp_costs:
+        week = shift_index.week_of(shift_id)
+        if week not in taken_weeks:
+            by_week.setdefault(week, []).append(shift_id)
+    
+    for week, shift_ids in by_week.items():
+        source = emp_node
+        if len(shift_ids) > 1:
+            source = mcf.add_node()
+            mcf.add_edge(emp_node, source, 1, 0)
+        for shift_id in shift_ids:
+            shift_edges[(emp, shift_id)] = mcf.add_edge(source, shift_nodes[shift_id], 1, emp_costs[shift_id])
+
+def optimal_allocate(shift_index, employee_list, preferences, phase_times=None, trace=None):
+    """
+    Allocate every shift in one min-cost flow solve.
+    
+    Graph: source -> employee (capacity 2) -> shift (capacity 1) -> sink
+    (capacity = slots). Where an employee has several candidate shifts on
+    the same weekend they go through an employee-weekend node of capacity 1,
+    which enforces "no two shifts on the same weekend" and with it "not both
+    Sunday shifts on the same day". Bottom-6 shifts get no edge at all.
+    The trace gets the finished assignments (the solve has no step-by-step decisions).
+    """
+    lap = time.perf_counter()
+    employees_with_prefs, _ = split_by_preferences(employee_list, preferences)
+    complete = set(employees_with_prefs)
+    costs = candidate_costs(shift_index, employee_list, preferences)
+    lap = _record_phase(phase_times, 'candidates', lap)
+    
+    mcf = MinCostFlow(2)  # node 0 = source, node 1 = sink
+    shift_nodes = {}
+    shift_edges = {}
+    
+    for shift in shift_index:
+        shift_nodes[shift['id']] = mcf.add_node()
+        mcf.add_edge(shift_nodes[shift['id']], 1, shift['slots'], 0)
+    
+    for emp in employee_list:
+        _add_employee(mcf, shift_index, emp, costs[emp], shift_nodes, shift_edges)
+    
+    lap = _record_phase(phase_times, 'build_graph', lap)
+    
+    mcf.solve(0, 1, max_flow=SHIFTS_PER_EMPLOYEE * len(employee_list))
+    lap = _record_phase(phase_times, 'solve', lap)
+    
+    # Read assignments back off the saturated employee -> shift edges
+    assignments = {emp: [] for emp in employee_list}
+    shift_assignments = {shift_id: [] for shift_id in shift_index.by_id}
+    for (emp, shift_id), edge_id in shift_edges.items():
+        if mcf.flow_on(edge_id):
+            assignments[emp].append(shift_id)
+            shift_assignments[shift_id].append(emp)
+    
+    warnings = []
+    for emp in employee_list:
+        assignments[emp].sort()
+        if emp not in complete:
+            warnings.append(f"{emp} was assigned without preferences (none submitted)")
+        if len(assignments[emp]) < SHIFTS_PER_EMPLOYEE:
+            warnings.append(f"{emp} could not be fully assigned - insufficient available shifts")
+            if trace is not None:
+                trace.record('decision', 'solve', 'unassigned', emp, shifts=len(assignments[emp]))
+    
+    if trace is not None:
+        trace.record('phase', 'solve', 'finished', employees=len(employee_list))
+        record_assignments(trace, 'solve', assignments, preferences)
+    _record_phase(phase_times, 'extract', lap)
+    
+    return assignments, shift_assignments, warnings
+
+def repair_costs(shift_index, prefs, shift_ids):
+    """optimal_allocate's edge costs for one employee, over just the given shifts"""
+    complete = has_complete_preferences(prefs)
+    prefs = prefs or {}
+    banned = set(prefs.get('bottom_6', []))
+    ranks = {shift_id: rank for rank, shift_id in enumerate(prefs['top_12'], start=1)} if complete else {}
+    costs = {}
+    for shift_id in shift_ids:
+        if shift_id in banned:
+            continue
+        if shift_id in ranks:
+            costs[shift_id] = ranks[shift_id] ** 2
+        else:
+            costs[shift_id] = preference_cost(prefs, shift_index.kind_of(shift_id), complete)
+    return costs
+
+def repair_allocate(shift_index, employee_list, preferences, assignments, affected=(), trace=None):
+    """
+    Patch an existing allocation after a few changes instead of redoing it.
+    
+    Employees no longer in employee_list lose their shifts and employees in
+    affected (say, whose preferences changed) give theirs up; everyone else
+    keeps exactly what they had. The freed slots, plus any already vacant,
+    then go to whoever is short of SHIFTS_PER_EMPLOYEE in one min-cost flow
+    with optimal_allocate's costs and constraints - over just those
+    employees and those shifts, so the solve grows with the change, not
+    the roster.
+    
+    Returns (assignments, shift_assignments, warnings, moved), moved being
+    the employees whose shifts changed. The trace gets the freed and
+    re-assigned shifts of just those employees.
+    """
+    affected = set(affected)
+    current = set(employee_list)
+    removed = [emp for emp, shift_ids in assignments.items() if emp not in current and shift_ids]
+    
+    new_assignments = {}
+    for emp in employee_list:
+        new_assignments[emp] = [] if emp in affected else [sid for sid in assignments.get(emp, []) if sid in shift_index]
+    shift_assignments = shift_index.assignees(new_assignments)
+    
+    free = {shift_id: shift_index.slots_of(shift_id) - len(assigned)
+            for shift_id, assigned in shift_assignments.items() if len(assigned) < shift_index.slots_of(shift_id)}
+    needy = [emp for emp in employee_list if len(new_assignments[emp]) < SHIFTS_PER_EMPLOYEE]
+    
+    mcf = MinCostFlow(2)  # node 0 = source, node 1 = sink
+    shift_nodes = {}
+    shift_edges = {}
+    for shift_id, capacity in free.items():
+        shift_nodes[shift_id] = mcf.add_node()
+        mcf.add_edge(shift_nodes[shift_id], 1, capacity, 0)
+    
+    quota = 0
+    for emp in needy:
+        kept = new_assignments[emp]
+        _add_employee(mcf, shift_index, emp, repair_costs(shift_index, preferences.get(emp), free), shift_nodes, shift_edges,
+                      quota=SHIFTS_PER_EMPLOYEE - len(kept), taken_weeks={shift_index.week_of(sid) for sid in kept})
+        quota += SHIFTS_PER_EMPLOYEE - len(kept)
+    mcf.solve(0, 1, max_flow=quota)
+    
+    for (emp, shift_id), edge_id in shift_edges.items():
+        if mcf.flow_on(edge_id):
+            new_assignments[emp].append(shift_id)
+            shift_assignments[shift_id].append(emp)
+    
+    warnings = []
+    # Affected employees only count as moved if they didn't get the same shifts back
+    moved = set(removed)
+    for emp in needy:
+        new_assignments[emp].sort()
+        if new_assignments[emp] != sorted(assignments.get(emp, [])):
+            moved.add(emp)
+        if len(new_assignments[emp]) < SHIFTS_PER_EMPLOYEE:
+            warnings.append(f"{emp} could not be fully assigned - insufficient available shifts "
+                            "(a full allocation can move other employees to make room)")
+            if trace is not None:
+                trace.record('decision', 'repair', 'unassigned', emp, shifts=len(new_assignments[emp]))
+    
+    if trace is not None:
+        trace.record('phase', 'repair', 'finished', employees=len(needy), free_shifts=len(free))
+        for emp in sorted(moved):
+            for shift_id in sorted(set(assignments.get(emp, [])) - set(new_assignments.get(emp, []))):
+                trace.record('decision', 'repair', 'freed', emp, shift=shift_id)
+        record_assignments(trace, 'repair', new_assignments, preferences,
+                           [emp for emp in sorted(moved) if emp in new_assignments])
+    vacancies = sum(max(0, shift_index.slots_of(shift_id) - len(assigned)) for shift_id, assigned in shift_assignments.items())
+    if vacancies:
+        warnings.append(f"{vacancies} shift slot(s) left vacant")
+    
+    return new_assignments, shift_assignments, warnings, sorted(moved)
+
+def summarize_allocation(shift_index, assignments, preferences, rank_matrix=None):
+    """Headline numbers used to compare allocation runs (lower total_rank is better)"""
+    if rank_matrix is None:
+        rank_matrix = RankMatrix(assignments.keys(), shift_index.ids, preferences)
+    stats = rank_matrix.allocation_stats(assignments)
+    
+    # Per-employee score: rank of each shift, TOP_N + 1 for anything unranked or missing
+    missing = np.maximum(0, SHIFTS_PER_EMPLOYEE - stats['shift_count'])
+    unranked = stats['shift_count'] - stats['top_count']
+    employee_score = stats['rank_sum'] + (TOP_N + 1) * (missing + unranked)
+    complete = np.array([has_complete_preferences(preferences.get(emp)) for emp in rank_matrix.employees], dtype=bool)
+    
+    capacity = sum(shift['slots'] for shift in shift_index)
+    filled = sum(len(shift_ids) for shift_ids in assignments.values())
+    
+    return {
+        'total_rank': int(stats['rank_sum'].sum()),
+        'top_12_shifts': int(stats['top_count'].sum()),
+        'fallback_shifts': int(stats['fallback_count'].sum()),
+        'bottom_6_shifts': int(stats['bottom_count'].sum()),
+        'worst_employee_score': int(employee_score[complete].max()) if complete.any() else 0,
+        'unfilled_employee_slots': int(missing.sum()),
+        'vacancies': capacity - filled
+    }
+
+def allocation_score(summary):
+    """
+    Sort key for comparing runs - smaller is better. Empty slots come first,
+    then the worst-off employee, then the total rank across everyone.
+    """
+    return (summary['vacancies'] + summary['unfilled_employee_slots'],
+            summary['worst_employee_score'],
+            summary['total_rank'])
+
+# Worker-process state for multi_seed_allocate, set once per process by the pool initializer
+_worker_inputs = None
+
+def _init_seed_worker(shift_index, employee_list, preferences):
+    global _worker_inputs
+    _worker_inputs = (shift_index, employee_list, preferences)
+
+def _run_seed(seed):
+    shift_index, employee_list, preferences = _worker_inputs
+    assignments, shift_assignments, warnings = greedy_allocate(shift_index, employee_list, preferences, seed)
+    summary = summarize_allocation(shift_index, assignments, preferences)
+    return seed, assignments, shift_assignments, warnings, summary
+
+def multi_seed_allocate(shift_index, employee_list, preferences, seeds, max_workers=None):
+    """
+    Run greedy_allocate once per seed across a process pool and return
+    (best_run, runs). best_run is a dict with the seed, assignments,
+    shift_assignments, warnings and summary of the lowest allocation_score;
+    runs lists {'seed', 'summary'} for every seed in seed order.
+    Re-running greedy_allocate with best_run['seed'] reproduces it exactly.
+    """
+    seeds = list(seeds)
+    best_run = None
+    runs = []
+    
+    # spawn, not fork: in the app this runs next to other request threads (and maybe their locks)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_seed_worker, initargs=(shift_index, employee_list, preferences)) as pool:
+        chunksize = max(1, len(seeds) // (4 * (max_workers or os.cpu_count() or 1)))
+        for seed, assignments, shift_assignments, warnings, summary in pool.map(_run_seed, seeds, chunksize=chunksize):
+            runs.append({'seed': seed, 'summary': summary})
+            # Ties keep the earliest seed so the pick is deterministic
+            if best_run is None or allocation_score(summary) < allocation_score(best_run['summary']):
+                best_run = {
+                    'seed': seed,
+                    'assignments': assignments,
+                    'shift_assignments': shift_assignments,
+                    'warnings': warnings,
+                    'summary': summary
+                }
+    
+    return best_run, runs
@@ -3,67 +3,48 @@ Analyze allocation results - see how well employees did
 Shows which employees got their top choices vs. who got screwed
 """
 
-import json
-from collections import defaultdict
+import numpy as np
 
-# Load data
-with open('data/employees.json', 'r') as f:
-    employees = json.load(f)
+from rank_matrix import RankMatrix
+from shifts import generate_shifts, ShiftIndex
+from storage import open_store
 
-with open('data/preferences.json', 'r') as f:
-    preferences = json.load(f)
+SHIFT_INDEX = ShiftIndex(generate_shifts())
 
-with open('data/assignments.json', 'r') as f:
-    assignments = json.load(f)
+# Load data (from the same backend as the app - see STORAGE_BACKEND)
+store = open_store('data')
+employees = store.load('employees')
+preferences = store.load('preferences')
+assignments = store.load('assignments')
 
 print("="*80)
 print("ALLOCATION RESULTS ANALYSIS")
 print("="*80)
 
-# Analyze each employee
-employee_results = []
-
-for emp in sorted(assignments.keys()):
-    if emp not in employees or employees[emp].get('is_manager'):
-        continue
-    
-    emp_name = employees[emp]['name']
-    emp_prefs = preferences.get(emp, {})
-    emp_shifts = assignments.get(emp, [])
-    
-    top_12 = emp_prefs.get('top_12', [])
-    bottom_6 = emp_prefs.get('bottom_6', [])
-    
-    # Calculate ranks for each assigned shift
-    shift_ranks = []
-    got_top_12 = 0
-    got_bottom_6 = 0
-    
-    for shift_id in emp_shifts:
-        if shift_id in top_12:
-            rank = top_12.index(shift_id) + 1
-            shift_ranks.append(rank)
-            got_top_12 += 1
-        elif shift_id in bottom_6:
-            rank = 'BOTTOM-6'
-            shift_ranks.append(rank)
-            got_bottom_6 += 1
-        else:
-            shift_ranks.append('NOT-RANKED')
-    
-    # Calculate satisfaction score (average rank for top-12 assignments)
-    numeric_ranks = [r for r in shift_ranks if isinstance(r, int)]
-    avg_rank = sum(numeric_ranks) / len(numeric_ranks) if numeric_ranks else 999
-    
-    employee_results.append({
-        'name': emp_name,
-        'shifts': len(emp_shifts),
-        'ranks': shift_ranks,
-        'avg_rank': avg_rank,
-        'top_12_count': got_top_12,
-        'bottom_6_count': got_bottom_6,
-        'got_screwed': got_bottom_6 > 0 or len(numeric_ranks) == 0
-    })
+# Analyze each employee - one rank matrix row per non-manager employee
+analyzed = [emp for emp in sorted(assignments.keys())
+            if emp in employees and not employees[emp].get('is_manager')]
+rank_matrix = RankMatrix(analyzed, SHIFT_INDEX.ids, preferences)
+stats = rank_matrix.allocation_stats(assignments)
+
+# Rank labels per employee, in assignment order: 3 -> 3, -2 -> 'BOTTOM-6', 0 -> 'NOT-RANKED'
+rank_labels = [[] for _ in analyzed]
+for i, rank in zip(stats['rows'], stats['ranks']):
+    rank_labels[i].append(int(rank) if rank > 0 else ('BOTTOM-6' if rank < 0 else 'NOT-RANKED'))
+
+# Satisfaction score (average rank for top-12 assignments)
+avg_ranks = np.nan_to_num(stats['avg_rank'], nan=999)
+got_screwed = (stats['bottom_count'] > 0) | (stats['top_count'] == 0)
+
+employee_results = [{
+    'name': employees[emp]['name'],
+    'shifts': int(stats['shift_count'][i]),
+    'ranks': rank_labels[i],
+    'avg_rank': float(avg_ranks[i]),
+    'top_12_count': int(stats['top_count'][i]),
+    'bottom_6_count': int(stats['bottom_count'][i]),
+    'got_screwed': bool(got_screwed[i])
+} for i, emp in enumerate(analyzed)]
 
 # Sort by satisfaction (best first)
 employee_results.sort(key=lambda x: x['avg_rank'])
@@ -99,10 +80,10 @@ print("SUMMARY STATISTICS")
 print("="*80)
 
 total_employees = len(employee_results)
-fully_assigned = sum(1 for r in employee_results if r['shifts'] == 2)
-got_both_top_12 = sum(1 for r in employee_results if r['top_12_count'] == 2)
-got_one_top_12 = sum(1 for r in employee_results if r['top_12_count'] == 1)
-got_bottom_6 = sum(1 for r in employee_results if r['bottom_6_count'] > 0)
+fully_assigned = int((stats['shift_count'] == 2).sum())
+got_both_top_12 = int((stats['top_count'] == 2).sum())
+got_one_top_12 = int((stats['top_count'] == 1).sum())
+got_bottom_6 = int((stats['bottom_count'] > 0).sum())
 
 print(f"Total Employees:           {total_employees}")
 print(f"Fully Assigned (2 shifts): {fully_assigned} ({fully_assigned/total_employees*100:.1f}%)")
@@ -111,30 +92,24 @@ print(f"Got One from Top 12:       {got_one_top_12} ({got_one_top_12/total_emplo
 print(f"Got Bottom-6 Shift:        {got_bottom_6} ({got_bottom_6/total_employees*100:.1f}%)")
 
 # Rank distribution
-rank_counts = defaultdict(int)
-for result in employee_results:
-    for rank in result['ranks']:
-        if isinstance(rank, int):
-            if rank <= 3:
-                rank_counts['Top 3'] += 1
-            elif rank <= 6:
-                rank_counts['4-6'] += 1
-            elif rank <= 9:
-                rank_counts['7-9'] += 1
-            else:
-                rank_counts['10-12'] += 1
-        elif rank == 'BOTTOM-6':
-            rank_counts['Bottom 6'] += 1
-        else:
-            rank_counts['Not Ranked'] += 1
-
-print(f"\nRank Distribution (60 total shifts assigned):")
+ranks = stats['ranks']
+rank_counts = {
+    'Top 3': int(((ranks >= 1) & (ranks <= 3)).sum()),
+    '4-6': int(((ranks >= 4) & (ranks <= 6)).sum()),
+    '7-9': int(((ranks >= 7) & (ranks <= 9)).sum()),
+    '10-12': int((ranks >= 10).sum()),
+    'Bottom 6': int((ranks < 0).sum()),
+    'Not Ranked': int((ranks == 0).sum())
+}
+
+print(f"\nRank Distribution ({len(ranks)} total shifts assigned):")
 for rank_range, count in sorted(rank_counts.items()):
-    print(f"  {rank_range}: {count} shifts")
+    if count:
+        print(f"  {rank_range}: {count} shifts")
 
 # Average satisfaction
-all_numeric_ranks = [r for result in employee_results for r in result['ranks'] if isinstance(r, int)]
-overall_avg = sum(all_numeric_ranks) / len(all_numeric_ranks) if all_numeric_ranks else 0
+top_ranks = ranks[ranks > 0]
+overall_avg = float(top_ranks.mean()) if top_ranks.size else 0
 
 print(f"\nOverall Average Rank: {overall_avg:.2f} (lower is better)")
 
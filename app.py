@@ -1,177 +1,254 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
-from datetime import datetime, timedelta
-import json
+from flask import Flask, Response, g, render_template, request, jsonify, session, redirect, url_for, send_file
+from datetime import datetime
 import os
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import quote_etag
 import secrets
 import random
-import fcntl
+import time
+import atexit
+import threading
+
+from shifts import generate_shifts, ShiftIndex
+from allocator import DEFAULT_SEED, greedy_allocate, has_complete_preferences, multi_seed_allocate, optimal_allocate, repair_allocate, summarize_allocation
+from allocation_trace import DEFAULT_LEVEL, DEFAULT_SAMPLE, AllocationTrace, filter_events, record_assignments
+from rank_matrix import RankMatrix
+from scenarios import random_preferences
+from storage import COLLECTIONS, SEED_PASSWORD_HASHES, open_store, load_json, save_json, cache_stats, record_etag, seed_collections
+from backups import SnapshotStore, BackupWorker
+from backup_archive import stream_archive, read_sections, validate_section
+from journal import Journal, JournaledStore
+from provisioning import ProvisioningBusy, ProvisioningJobs, guess_format, read_accounts
+from excel_export import ExcelSchedule
+from exports import Calendars, ExportCache, MailMergeCsv, WriterSummaryCsv, run_export, write_bundle
+from summary import DashboardSummary
+from events import EventLog, format_event
+import metrics
+from profiling import ProfileStore, RequestProfile
 
 # Determine the base directory (where this script is located)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(BASE_DIR)
 
 template_folder = os.path.join(BASE_DIR, 'templates')
-app = Flask(__name__, template_folder=template_folder)
 
 # Fixed secret key for session persistence across restarts
-app.secret_key = 'weekend-trunk-shifts-secret-key-2025'
+SECRET_KEY = 'weekend-trunk-shifts-secret-key-2025'
 
-# Data storage (in production, use a proper database)
+# Data storage - JSON files by default, SQLite with STORAGE_BACKEND=sqlite (see storage.py).
+# Nothing here touches the disk: the directories and seed files are created
+# by ensure_data() on the first request, so importing this module is cheap
+# and gunicorn --preload can load it once and fork the workers from it.
 DATA_DIR = os.path.join(BASE_DIR, 'data')
-os.makedirs(DATA_DIR, exist_ok=True)
 
-BACKUP_DIR = os.path.join(DATA_DIR, 'backups')
-os.makedirs(BACKUP_DIR, exist_ok=True)
+def use_data_dir(data_dir, backend=None):
+    """Point every store at data_dir (backend defaults to $STORAGE_BACKEND)"""
+    global DATA_DIR, BACKUP_DIR, JOURNAL, STORE, BACKUPS, PROVISIONING, EXPORT_CACHE, SUMMARY, EVENTS, ALLOCATION_RUN_FILE, ALLOCATION_TRACE_FILE, METRICS_DIR, PROFILES, _data_ready
+    DATA_DIR = data_dir
+    BACKUP_DIR = os.path.join(DATA_DIR, 'backups')
+    # Every write is also appended to data/journal/ for time-travel queries (see journal.py)
+    JOURNAL = Journal(os.path.join(DATA_DIR, 'journal'), COLLECTIONS)
+    STORE = JournaledStore(open_store(DATA_DIR, backend), JOURNAL)
+    # Deduplicated snapshots of all collections (see backups.py)
+    BACKUPS = SnapshotStore(BACKUP_DIR)
+    # Bulk account uploads, hashed in the background (see provisioning.py)
+    PROVISIONING = ProvisioningJobs(os.path.join(DATA_DIR, 'jobs'))
+    # Finished export downloads, per version of the data (see exports.py)
+    EXPORT_CACHE = ExportCache(os.path.join(DATA_DIR, 'exports'))
+    # Dashboard counters, updated by every write to the store (see summary.py)
+    SUMMARY = DashboardSummary(DATA_DIR, SHIFT_INDEX, STORE)
+    # Live dashboard updates for /api/events (see events.py) - after SUMMARY, so they carry its new counts
+    EVENTS = EventLog(os.path.join(DATA_DIR, 'events'))
+    STORE.listeners += [SUMMARY.apply, publish_change]
+    # Engine, seed and scores of the run that produced assignments.json
+    ALLOCATION_RUN_FILE = os.path.join(DATA_DIR, 'allocation_run.json')
+    # What that run decided and why, for /api/allocation-trace (see allocation_trace.py)
+    ALLOCATION_TRACE_FILE = os.path.join(DATA_DIR, 'allocation_trace.json')
+    # Each worker's counters and latency histograms, added up by /metrics (see metrics.py)
+    METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+    # Requests a manager asked to have profiled (see profiling.py)
+    PROFILES = ProfileStore(os.path.join(DATA_DIR, 'profiles'))
+    _data_ready = False
 
-EMPLOYEES_FILE = os.path.join(DATA_DIR, 'employees.json')
-PREFERENCES_FILE = os.path.join(DATA_DIR, 'preferences.json')
-SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
-ASSIGNMENTS_FILE = os.path.join(DATA_DIR, 'assignments.json')
+def publish_change(collection, op, key=None, value=None, previous=None):
+    """Store listener: tell the open dashboards what a write changed"""
+    if not _data_ready:
+        # Seeding the data on first use - nobody is watching yet
+        return
+    try:
+        if collection == 'settings':
+            settings = STORE.load('settings')
+            EVENTS.publish('settings', {'deadline': settings.get('deadline'), 'is_locked': settings.get('is_locked', False),
+                                        'etag': record_etag(settings)})
+        elif collection == 'preferences':
+            data = {'summary': SUMMARY.counts()}
+            if op in ('put', 'delete'):
+                data.update(username=key, submitted=op == 'put' and has_complete_preferences(value))
+            EVENTS.publish('submission', data, 'managers')
+        elif collection == 'employees':
+            EVENTS.publish('roster', {'summary': SUMMARY.counts()}, 'managers')
+        elif collection == 'assignments':
+            EVENTS.publish('allocation', {'summary': SUMMARY.counts()})
+    except Exception as e:
+        # The write itself already succeeded
+        print(f"Live event failed: {e}")
 
-# Generate 60 weekend shifts (20 weekends starting Dec 14, 2025)
-def generate_shifts():
-    shifts = []
-    start_date = datetime(2025, 12, 13)  # Saturday Dec 13, 2025
-    shift_id = 0
-    
-    for week in range(20):
-        saturday = start_date + timedelta(weeks=week)
-        sunday = saturday + timedelta(days=1)
-        
-        # Saturday shift
-        shifts.append({
-            'id': shift_id,
-            'date': saturday.strftime('%Y-%m-%d'),
-            'day': 'Saturday',
-            'time': '11:00 AM - 7:00 PM',
-            'slots': 1,
-            'week': week + 1
-        })
-        shift_id += 1
-        
-        # Sunday morning shift
-        shifts.append({
-            'id': shift_id,
-            'date': sunday.strftime('%Y-%m-%d'),
-            'day': 'Sunday',
-            'time': '8:00 AM - 4:00 PM',
-            'slots': 1,
-            'week': week + 1
-        })
-        shift_id += 1
-        
-        # Sunday evening shift
-        shifts.append({
-            'id': shift_id,
-            'date': sunday.strftime('%Y-%m-%d'),
-            'day': 'Sunday',
-            'time': '3:00 PM - 10:00 PM',
-            'slots': 1,
-            'week': week + 1
+SHIFTS = generate_shifts()
+SHIFT_INDEX = ShiftIndex(SHIFTS)
+
+_data_lock = threading.Lock()
+use_data_dir(DATA_DIR)
+
+# Selected with ?engine=... (or {"engine": ...} in the body) on /api/allocate
+ALLOCATION_ENGINES = ('greedy', 'optimal', 'multiseed', 'repair')
+# Most events /api/allocation-trace returns at once
+TRACE_MAX_EVENTS = 5000
+DEFAULT_ALLOCATION_SEEDS = 64
+
+def ensure_data():
+    """Create the data directories and any missing collections, once per process"""
+    global _data_ready
+    if _data_ready:
+        return
+    with _data_lock:
+        if not _data_ready:
+            seed_collections(STORE)
+            JOURNAL.start(STORE.load)
+            # Catch up with anything written while no process was listening
+            SUMMARY.rebuild()
+            _data_ready = True
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def record_request(response):
+    """Count and time every request, by its route pattern (so /api/x/<id> is one series)"""
+    if 'request_started' in g:
+        route_rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=route_rule, status=response.status_code)
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - g.request_started, method=request.method, route=route_rule)
+    metrics.flush(METRICS_DIR)
+    return response
+
+def start_profile():
+    """?profile=1 or X-Profile: 1 from a manager runs the request under the profiler"""
+    if (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1') and session.get('is_manager'):
+        g.profile = RequestProfile()
+        g.profile.start()
+
+def save_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+        saved = PROFILES.save(profile, {
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'user': session.get('username')
         })
-        shift_id += 1
-    
-    return shifts
+        response.headers['X-Profile-Id'] = saved['id']
+    return response
 
-SHIFTS = generate_shifts()
+def abandon_profile(error=None):
+    # A request that never produced a response still mustn't leave the profiler running
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
 
-# Initialize data files
-def init_data_files():
-    # Create 30 employees
-    if not os.path.exists(EMPLOYEES_FILE):
-        employees = {}
-        
-        # Manager account
-        employees['admin'] = {
-            'name': 'Admin',
-            'is_manager': True,
-            'password': generate_password_hash('admin123')
-        }
-        
-        # 30 employee accounts
-        for i in range(1, 31):
-            username = f'employee{i}'
-            employees[username] = {
-                'name': f'Employee{i}',
-                'is_manager': False,
-                'password': generate_password_hash('password')
-            }
-        
-        with open(EMPLOYEES_FILE, 'w') as f:
-            json.dump(employees, f, indent=2)
-    
-    if not os.path.exists(PREFERENCES_FILE):
-        with open(PREFERENCES_FILE, 'w') as f:
-            json.dump({}, f)
-    
-    if not os.path.exists(SETTINGS_FILE):
-        # Default deadline: 7 days from now
-        deadline = (datetime.now() + timedelta(days=7)).isoformat()
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump({'deadline': deadline, 'is_locked': False}, f)
-    
-    if not os.path.exists(ASSIGNMENTS_FILE):
-        with open(ASSIGNMENTS_FILE, 'w') as f:
-            json.dump({}, f)
+# Routes are collected here and registered on the app by create_app()
+ROUTES = []
 
-init_data_files()
+def route(rule, **options):
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
 
 # Helper functions
-def load_json(filepath):
-    with open(filepath, 'r') as f:
-        return json.load(f)
-
-def save_json(filepath, data):
-    """Save JSON with file locking to prevent race conditions"""
-    with open(filepath, 'w') as f:
-        # Acquire exclusive lock
-        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-        try:
-            json.dump(data, f, indent=2)
-        finally:
-            # Release lock
-            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-
 def get_employees():
-    return load_json(EMPLOYEES_FILE)
+    return STORE.load('employees')
 
 def get_preferences():
-    return load_json(PREFERENCES_FILE)
+    return STORE.load('preferences')
 
 def get_settings():
-    return load_json(SETTINGS_FILE)
+    return STORE.load('settings')
 
 def get_assignments():
-    return load_json(ASSIGNMENTS_FILE)
+    return STORE.load('assignments')
 
-def create_auto_backup():
-    """Create an automatic backup of all data files"""
+def password_matches(password_hash, password):
+    with metrics.PASSWORD_SECONDS.time():
+        return check_password_hash(password_hash, password)
+
+def capture_data():
+    """Current contents of every collection"""
+    with metrics.BACKUP_SECONDS.time(step='capture'):
+        return {collection: STORE.load(collection) for collection in COLLECTIONS}
+
+def write_snapshot(collections, reason):
+    """Snapshot the given data; unchanged files are shared with earlier snapshots"""
+    with metrics.BACKUP_SECONDS.time(step='write'):
+        name, _ = BACKUPS.create(collections, reason)
+    return name
+
+def create_auto_backup(reason='manual'):
+    """Snapshot all data files right now, on the calling thread"""
     try:
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_data = {
-            'employees': get_employees(),
-            'preferences': get_preferences(),
-            'settings': get_settings(),
-            'assignments': get_assignments(),
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        backup_file = os.path.join(BACKUP_DIR, f'auto_backup_{timestamp}.json')
-        with open(backup_file, 'w') as f:
-            json.dump(backup_data, f, indent=2)
-        
-        # Keep only last 30 backups to save space
-        backup_files = sorted([f for f in os.listdir(BACKUP_DIR) if f.startswith('auto_backup_')])
-        if len(backup_files) > 30:
-            for old_backup in backup_files[:-30]:
-                os.remove(os.path.join(BACKUP_DIR, old_backup))
-        
+        write_snapshot(capture_data(), reason)
+        return True
+    except Exception as e:
+        print(f"Auto-backup failed: {e}")
+        return False
+
+# Automatic backups are written by a background thread (see BackupWorker)
+BACKUP_WORKER = BackupWorker(write_snapshot, capture_data)
+atexit.register(BACKUP_WORKER.flush)
+
+def queue_auto_backup(reason, before_change=False):
+    """
+    Hand an automatic backup to the background writer; reason is recorded
+    in the backup catalog. before_change=True captures the data as it is
+    now, ahead of a change the caller is about to make; otherwise the worker
+    snapshots whatever is current when it runs (and merges bursts of these
+    into one snapshot).
+    """
+    state = capture_data() if before_change else None
+    if BACKUP_WORKER.trigger(state, reason):
+        return True
+    # Queue is full - don't lose the backup, write it here instead
+    try:
+        write_snapshot(state or capture_data(), reason)
         return True
     except Exception as e:
         print(f"Auto-backup failed: {e}")
         return False
 
+def write_precondition():
+    """
+    The request's If-Match / If-None-Match as (conditional, expected), where
+    expected is what the store's put_if / delete_if / update_if take. Requests
+    without either header stay unconditional, as before.
+    """
+    if request.if_none_match.star_tag:
+        return True, None
+    if request.if_match:
+        return True, '*' if request.if_match.star_tag else request.if_match.as_set()
+    return False, None
+
+def with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+def precondition_failed(etag):
+    """412 for a conditional write that lost a race; carries the record's current version"""
+    response = jsonify({'error': 'Changed by someone else since you loaded it - reload and try again',
+                        'etag': etag})
+    response.status_code = 412
+    return with_etag(response, etag)
+
 def format_deadline(iso_datetime_str):
     """Format ISO datetime to readable format: 'Nov. 27, 2025 3:24 a.m. ET'"""
     dt = datetime.fromisoformat(iso_datetime_str)
@@ -197,58 +274,36 @@ def format_deadline(iso_datetime_str):
     
     return f"{month}. {day}, {year} {hour_12}:{minute:02d} {am_pm} ET"
 
-def calculate_satisfaction_score(preferences, assigned_shift_id):
-    """
-    Calculate satisfaction score for a single assigned shift.
-    Lower score = better (based on preference rank)
-    """
-    top_prefs = preferences.get('top_12', [])
-    
-    if assigned_shift_id in top_prefs:
-        rank = top_prefs.index(assigned_shift_id) + 1
-        return rank
-    else:
-        # Not in top preferences - assign high penalty score
-        return 999
-
-def has_same_weekend_conflict(employee_shifts, new_shift_id):
-    """
-    Check if assigning new_shift_id would create two shifts on same weekend.
-    Returns True if there's a conflict.
-    """
-    new_shift = next(s for s in SHIFTS if s['id'] == new_shift_id)
-    new_week = new_shift['week']
-    
-    # Check all employee's existing shifts
-    for shift_id in employee_shifts:
-        existing_shift = next(s for s in SHIFTS if s['id'] == shift_id)
-        if existing_shift['week'] == new_week:
-            return True
-    
-    return False
-
-def has_consecutive_shift_conflict(employee_shifts, new_shift_id):
-    """
-    Check if assigning new_shift_id would create consecutive/overlapping shifts.
-    This catches Sunday 8am-4pm + Sunday 3pm-10pm on same day.
-    Returns True if there's a conflict.
-    """
-    new_shift = next(s for s in SHIFTS if s['id'] == new_shift_id)
-    new_date = new_shift['date']
-    new_day = new_shift['day']
-    
-    # Check all employee's existing shifts
-    for shift_id in employee_shifts:
-        existing_shift = next(s for s in SHIFTS if s['id'] == shift_id)
+def preferences_locked(settings):
+    """Locked by a manager, or the deadline has passed"""
+    # Check if deadline has passed - with error handling
+    try:
+        deadline_str = settings['deadline']
+        # Remove timezone info if present to make comparison work
+        if 'T' in deadline_str:
+            # Parse and strip timezone info
+            deadline = datetime.fromisoformat(deadline_str.replace('Z', '+00:00'))
+            # Make it naive for comparison
+            deadline = deadline.replace(tzinfo=None)
+        else:
+            deadline = datetime.fromisoformat(deadline_str)
         
-        # If same date and same day (Sunday has 2 shifts), it's consecutive/overlapping
-        if existing_shift['date'] == new_date and existing_shift['day'] == new_day:
-            return True
-    
-    return False
+        return settings.get('is_locked', False) or datetime.now() > deadline
+    except (ValueError, KeyError, AttributeError) as e:
+        # If deadline parsing fails, default to unlocked
+        print(f"Warning: Could not parse deadline: {e}")
+        return settings.get('is_locked', False)
+
+def deadline_display(settings):
+    """The deadline as the dashboards show it"""
+    try:
+        return format_deadline(settings['deadline'])
+    except Exception as e:
+        # Fallback to original format if formatting fails
+        return settings.get('deadline', 'Not set')
 
 # Routes
-@app.route('/')
+@route('/')
 def index():
     if 'username' in session:
         if session.get('is_manager'):
@@ -257,7 +312,7 @@ def index():
             return redirect(url_for('employee_dashboard'))
     return redirect(url_for('login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         data = request.json
@@ -267,7 +322,7 @@ def login():
         employees = get_employees()
         
         if username in employees:
-            if check_password_hash(employees[username]['password'], password):
+            if password_matches(employees[username]['password'], password):
                 session['username'] = username
                 session['is_manager'] = employees[username].get('is_manager', False)
                 return jsonify({'success': True, 'is_manager': session['is_manager']})
@@ -276,35 +331,40 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
     return redirect(url_for('login'))
 
-@app.route('/manager/dashboard')
+@route('/manager/dashboard')
 def manager_dashboard():
     if not session.get('is_manager'):
         return redirect(url_for('login'))
     
-    employees = get_employees()
     settings = get_settings()
-    preferences = get_preferences()
     assignments = get_assignments()
     
-    # Count employees who have submitted preferences (top 12 + bottom 6)
-    submitted_count = sum(1 for emp, prefs in preferences.items() 
-                         if prefs and len(prefs.get('top_12', [])) == 12 and len(prefs.get('bottom_6', [])) == 6)
+    # Counters come from the maintained summary; the employee table pages
+    # itself in from /api/roster, so nothing here scans every employee
+    summary = SUMMARY.counts()
+    
+    # Who is on each of the first five weekends' shifts
+    preview = []
+    if assignments:
+        employees = get_employees()
+        assignees = SHIFT_INDEX.assignees(assignments)
+        preview = [(shift, [employees.get(emp, {}).get('name', emp) for emp in assignees[shift['id']]])
+                   for shift in SHIFTS[:15]]
     
     return render_template('manager_dashboard.html', 
-                         employees=employees,
                          settings=settings,
-                         submitted_count=submitted_count,
-                         total_employees=len([e for e in employees.values() if not e.get('is_manager')]),
-                         assignments=assignments,
-                         preferences=preferences,
-                         shifts=SHIFTS)
+                         summary=summary,
+                         submitted_count=summary['submitted'],
+                         total_employees=summary['total_employees'],
+                         preview=preview,
+                         settings_etag=quote_etag(record_etag(settings)))
 
-@app.route('/employee/dashboard')
+@route('/employee/dashboard')
 def employee_dashboard():
     if 'username' not in session or session.get('is_manager'):
         return redirect(url_for('login'))
@@ -317,40 +377,20 @@ def employee_dashboard():
     user_prefs = preferences.get(username, {})
     user_assignments = assignments.get(username, [])
     
-    # Check if deadline has passed - with error handling
-    try:
-        deadline_str = settings['deadline']
-        # Remove timezone info if present to make comparison work
-        if 'T' in deadline_str:
-            # Parse and strip timezone info
-            deadline = datetime.fromisoformat(deadline_str.replace('Z', '+00:00'))
-            # Make it naive for comparison
-            deadline = deadline.replace(tzinfo=None)
-        else:
-            deadline = datetime.fromisoformat(deadline_str)
-        
-        is_locked = settings.get('is_locked', False) or datetime.now() > deadline
-    except (ValueError, KeyError, AttributeError) as e:
-        # If deadline parsing fails, default to unlocked
-        print(f"Warning: Could not parse deadline: {e}")
-        is_locked = settings.get('is_locked', False)
-    
-    # Format deadline for display
-    try:
-        formatted_deadline = format_deadline(settings['deadline'])
-    except Exception as e:
-        # Fallback to original format if formatting fails
-        formatted_deadline = settings.get('deadline', 'Not set')
+    is_locked = preferences_locked(settings)
+    formatted_deadline = deadline_display(settings)
     
     return render_template('employee_dashboard.html',
                          username=username,
                          shifts=SHIFTS,
+                         shift_index=SHIFT_INDEX,
                          preferences=user_prefs,
+                         preferences_etag=quote_etag(record_etag(user_prefs)) if username in preferences else None,
                          assignments=user_assignments,
                          deadline=formatted_deadline,
                          is_locked=is_locked)
 
-@app.route('/api/employees', methods=['GET', 'POST', 'DELETE'])
+@route('/api/employees', methods=['GET', 'POST', 'DELETE'])
 def manage_employees():
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
@@ -366,56 +406,140 @@ def manage_employees():
         if username in employees:
             return jsonify({'error': 'Employee already exists'}), 400
         
-        employees[username] = {
+        employee = {
             'name': name,
             'password': generate_password_hash(password),
             'is_manager': False
         }
-        save_json(EMPLOYEES_FILE, employees)
-        return jsonify({'success': True})
+        # Only created if the username is still free when the write happens
+        created, _ = STORE.put_if('employees', username, employee, None)
+        if not created:
+            return jsonify({'error': 'Employee already exists'}), 400
+        EXPORT_CACHE.clear()
+        return with_etag(jsonify({'success': True}), record_etag(employee))
     
     elif request.method == 'DELETE':
         data = request.json
         username = data.get('username')
         
-        if username in employees:
-            del employees[username]
-            save_json(EMPLOYEES_FILE, employees)
-            
+        conditional, expected = write_precondition()
+        if conditional:
+            deleted, etag = STORE.delete_if('employees', username, expected)
+            if not deleted and etag is not None:
+                return precondition_failed(etag)
+        else:
+            deleted = STORE.delete('employees', username)
+        
+        if deleted:
             # Also remove their preferences
-            preferences = get_preferences()
-            if username in preferences:
-                del preferences[username]
-                save_json(PREFERENCES_FILE, preferences)
+            STORE.delete('preferences', username)
+            EXPORT_CACHE.clear()
             
             return jsonify({'success': True})
         
         return jsonify({'error': 'Employee not found'}), 404
     
-    # GET
+    # GET - one employee (with its ETag) or all of them
+    username = request.args.get('username')
+    if username is not None:
+        if username not in employees:
+            return jsonify({'error': 'Employee not found'}), 404
+        return with_etag(jsonify({username: employees[username]}), record_etag(employees[username]))
     return jsonify(employees)
 
-@app.route('/api/preferences', methods=['GET', 'POST'])
+ROSTER_SORTS = ('name', 'username', 'status', 'top_12', 'bottom_6', 'shifts')
+ROSTER_STATUSES = ('pending', 'complete', 'assigned')
+ROSTER_MAX_PER_PAGE = 500
+
+def roster_row(username, employee, prefs, shift_ids):
+    if shift_ids:
+        status = 'assigned'
+    elif has_complete_preferences(prefs):
+        status = 'complete'
+    else:
+        status = 'pending'
+    return {
+        'username': username,
+        'name': employee.get('name', username),
+        'top_12': len(prefs.get('top_12', [])),
+        'bottom_6': len(prefs.get('bottom_6', [])),
+        'shift_type_pref': bool(prefs.get('shift_type_pref')),
+        'status': status,
+        'shifts': [{'id': shift_id, 'day': SHIFT_INDEX[shift_id]['day'], 'date': SHIFT_INDEX[shift_id]['date']}
+                   for shift_id in shift_ids if shift_id in SHIFT_INDEX]
+    }
+
+@route('/api/roster')
+def roster():
+    """
+    One page of the employee roster with submission status and assigned
+    shifts (MANAGER ONLY), plus the dashboard counters.
+    ?page=1&per_page=50, ?sort= name|username|status|top_12|bottom_6|shifts
+    and ?order=asc|desc, ?status= pending|complete|assigned, ?q= matches
+    name or username.
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 50))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    if page < 1 or not 1 <= per_page <= ROSTER_MAX_PER_PAGE:
+        return jsonify({'error': f'page must be at least 1 and per_page 1-{ROSTER_MAX_PER_PAGE}'}), 400
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    status = request.args.get('status')
+    query = request.args.get('q', '').strip().lower()
+    if sort not in ROSTER_SORTS or order not in ('asc', 'desc') or status not in (None, '', *ROSTER_STATUSES):
+        return jsonify({'error': f"sort must be one of {', '.join(ROSTER_SORTS)}, order asc or desc, "
+                                 f"status one of {', '.join(ROSTER_STATUSES)}"}), 400
+    
+    employees = get_employees()
+    preferences = get_preferences()
+    assignments = get_assignments()
+    
+    rows = []
+    for username, employee in employees.items():
+        if employee.get('is_manager'):
+            continue
+        if query and query not in username.lower() and query not in employee.get('name', '').lower():
+            continue
+        row = roster_row(username, employee, preferences.get(username) or {}, assignments.get(username, []))
+        if status and row['status'] != status:
+            continue
+        rows.append(row)
+    
+    if sort == 'shifts':
+        key = lambda row: len(row['shifts'])
+    elif sort == 'status':
+        key = lambda row: ROSTER_STATUSES.index(row['status'])
+    else:
+        key = lambda row: row[sort].lower() if isinstance(row[sort], str) else row[sort]
+    # Ties keep name order, whichever way the sort runs
+    rows.sort(key=lambda row: row['name'].lower())
+    rows.sort(key=key, reverse=order == 'desc')
+    
+    start = (page - 1) * per_page
+    return jsonify({
+        'items': rows[start:start + per_page],
+        'page': page,
+        'per_page': per_page,
+        'total': len(rows),
+        'pages': max(1, -(-len(rows) // per_page)),
+        'summary': SUMMARY.counts()
+    })
+
+@route('/api/preferences', methods=['GET', 'POST'])
 def manage_preferences():
     if 'username' not in session:
         return jsonify({'error': 'Unauthorized'}), 403
     
     username = session['username']
-    preferences = get_preferences()
     settings = get_settings()
     
-    # Check if locked - with proper timezone handling
-    try:
-        deadline_str = settings['deadline']
-        if 'T' in deadline_str:
-            deadline = datetime.fromisoformat(deadline_str.replace('Z', '+00:00'))
-            deadline = deadline.replace(tzinfo=None)
-        else:
-            deadline = datetime.fromisoformat(deadline_str)
-        
-        is_locked = settings.get('is_locked', False) or datetime.now() > deadline
-    except (ValueError, KeyError, AttributeError):
-        is_locked = settings.get('is_locked', False)
+    is_locked = preferences_locked(settings)
     
     if request.method == 'POST':
         if is_locked and not session.get('is_manager'):
@@ -433,356 +557,296 @@ def manage_preferences():
         if len(data['bottom_6']) != 6:
             return jsonify({'error': 'Must select exactly 6 least wanted shifts'}), 400
         
-        preferences[username] = {
+        prefs = {
             'top_12': data['top_12'],
             'bottom_6': data['bottom_6'],
             'shift_type_pref': data['shift_type_pref']
         }
-        save_json(PREFERENCES_FILE, preferences)
         
-        # Create auto-backup after preference submission
-        create_auto_backup()
+        # Only this employee's entry is written - and with If-Match, only if
+        # it hasn't changed since the client read it (e.g. in another tab)
+        conditional, expected = write_precondition()
+        if conditional:
+            written, etag = STORE.put_if('preferences', username, prefs, expected)
+            if not written:
+                return precondition_failed(etag)
+        else:
+            STORE.put('preferences', username, prefs)
+        
+        # Queue an auto-backup after preference submission
+        queue_auto_backup('preference_submit')
         
-        return jsonify({'success': True})
+        return with_etag(jsonify({'success': True}), record_etag(prefs))
     
-    # GET
+    # GET - managers see everyone unless they ask for one employee
+    if session.get('is_manager') and 'username' not in request.args:
+        return jsonify(get_preferences())
     if session.get('is_manager'):
-        return jsonify(preferences)
-    else:
-        return jsonify({username: preferences.get(username, {})})
+        username = request.args['username']
+    prefs = STORE.get('preferences', username)
+    return with_etag(jsonify({username: prefs or {}}), record_etag(prefs))
 
-@app.route('/api/settings', methods=['GET', 'POST'])
+@route('/api/settings', methods=['GET', 'POST'])
 def manage_settings():
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    settings = get_settings()
-    
     if request.method == 'POST':
         data = request.json
+        changes = {}
         
         if 'deadline' in data:
-            settings['deadline'] = data['deadline']
+            changes['deadline'] = data['deadline']
         
         if 'is_locked' in data:
-            settings['is_locked'] = data['is_locked']
-        
-        save_json(SETTINGS_FILE, settings)
-        return jsonify({'success': True})
+            changes['is_locked'] = data['is_locked']
+        
+        # Settings are one record: If-Match is checked against all of them
+        conditional, expected = write_precondition()
+        if conditional:
+            written, etag = STORE.update_if('settings', changes, expected)
+            if not written:
+                return precondition_failed(etag)
+        else:
+            STORE.update('settings', changes)
+            etag = record_etag(get_settings())
+        return with_etag(jsonify({'success': True}), etag)
     
-    return jsonify(settings)
+    settings = get_settings()
+    return with_etag(jsonify(settings), record_etag(settings))
 
-@app.route('/api/allocate', methods=['POST'])
+@route('/api/allocate', methods=['POST'])
 def allocate_shifts():
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
+    # Options come from the JSON body or the query string (?engine=multiseed&seeds=128)
+    options = dict(request.get_json(silent=True) or {})
+    options.update(request.args.to_dict())
+    engine = options.get('engine', 'greedy')
+    if engine not in ALLOCATION_ENGINES:
+        return jsonify({'error': f"Unknown allocation engine '{engine}'"}), 400
+    try:
+        seed = int(options.get('seed', DEFAULT_SEED))
+        seeds = int(options.get('seeds', DEFAULT_ALLOCATION_SEEDS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seed and seeds must be integers'}), 400
+    if seeds < 1:
+        return jsonify({'error': 'seeds must be at least 1'}), 400
+    # ?trace=candidate records every shift tried, ?trace=off nothing (see allocation_trace.py)
+    try:
+        trace = AllocationTrace(options.get('trace', DEFAULT_LEVEL), float(options.get('trace_sample', DEFAULT_SAMPLE)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     # Create backup before allocation
-    create_auto_backup()
+    queue_auto_backup(engine if engine == 'repair' else 'allocate', before_change=True)
     
+    if engine == 'repair':
+        return repair_allocation(options, trace)
+    
+    # Writes after this point are what a later repair has to look at
+    journal_seq = JOURNAL.status()['last_seq']
     preferences = get_preferences()
     employees_data = get_employees()
     
     # Get list of non-manager employees
     employee_list = [user for user, emp in employees_data.items() if not emp.get('is_manager')]
     
-    # Separate employees into two groups:
-    # 1. Those with complete preferences (top 12 + bottom 6)
-    # 2. Those without complete preferences (will be randomly assigned)
-    employees_with_prefs = []
-    employees_without_prefs = []
-    
-    for emp in employee_list:
-        if emp in preferences:
-            prefs = preferences[emp]
-            if len(prefs.get('top_12', [])) == 12 and len(prefs.get('bottom_6', [])) == 6:
-                employees_with_prefs.append(emp)
-            else:
-                employees_without_prefs.append(emp)
-        else:
-            employees_without_prefs.append(emp)
-    
-    # Initialize assignments
-    assignments = {emp: [] for emp in employee_list}
-    shift_assignments = {shift['id']: [] for shift in SHIFTS}
-    warnings = []  # Track employees who were randomly assigned
-    
-    # Set random seed for reproducibility
-    random.seed(42)
-    
-    # PHASE 1: Preference-based allocation for employees with complete preferences
-    print("\n=== PHASE 1: Preference-Based Allocation ===")
-    print(f"Processing {len(employees_with_prefs)} employees with complete preferences\n")
+    started = time.perf_counter()
+    run = {'engine': engine}
+    phase_times = {}
+    if engine == 'optimal':
+        assignments, shift_assignments, warnings = optimal_allocate(SHIFT_INDEX, employee_list, preferences, phase_times, trace)
+    elif engine == 'multiseed':
+        # Seeds seed .. seed + seeds - 1, one greedy run each across all cores
+        best_run, runs = multi_seed_allocate(SHIFT_INDEX, employee_list, preferences, range(seed, seed + seeds))
+        assignments = best_run['assignments']
+        shift_assignments = best_run['shift_assignments']
+        warnings = best_run['warnings']
+        run['seed'] = best_run['seed']
+        run['seeds_tried'] = len(runs)
+        # The runs themselves are untraced; greedy_allocate with the seed replays one step by step
+        trace.record('phase', 'multiseed', 'finished', seeds=len(runs), seed=best_run['seed'])
+        record_assignments(trace, 'multiseed', assignments, preferences)
+    else:
+        assignments, shift_assignments, warnings = greedy_allocate(SHIFT_INDEX, employee_list, preferences, seed,
+                                                                   phase_times, trace)
+        run['seed'] = seed
+    elapsed = time.perf_counter() - started
+    record_allocation_times(engine, phase_times, elapsed)
+    
+    run['summary'] = summarize_allocation(SHIFT_INDEX, assignments, preferences)
+    run['timestamp'] = datetime.now().isoformat()
+    run['journal_seq'] = journal_seq
+    timings = {engine: {
+        'elapsed_seconds': round(elapsed, 4),
+        'summary': run['summary']
+    }}
+    
+    # Run the greedy allocator alongside so the result can be compared with it
+    if engine != 'greedy':
+        started = time.perf_counter()
+        greedy_assignments, _, _ = greedy_allocate(SHIFT_INDEX, employee_list, preferences, seed)
+        timings['greedy'] = {
+            'elapsed_seconds': round(time.perf_counter() - started, 4),
+            'summary': summarize_allocation(SHIFT_INDEX, greedy_assignments, preferences)
+        }
     
-    shuffled_employees = employees_with_prefs.copy()
-    random.shuffle(shuffled_employees)
+    # Save assignments, plus what it takes to reproduce them (greedy_allocate with run['seed'])
+    STORE.save('assignments', assignments)
+    save_json(ALLOCATION_RUN_FILE, run)
+    save_trace(trace, run)
+    EXPORT_CACHE.clear()
     
-    for emp in shuffled_employees:
-        prefs = preferences[emp]
-        top_12 = prefs['top_12']
-        bottom_6 = prefs['bottom_6']
-        
-        # Try to assign from top 12 preferences
-        assigned = False
-        for shift_id in top_12:
-            # Skip if shift is full
-            shift = next(s for s in SHIFTS if s['id'] == shift_id)
-            if len(shift_assignments[shift_id]) >= shift['slots']:
-                continue
-            
-            # Skip if would create same-weekend conflict for second shift
-            if has_same_weekend_conflict(assignments[emp], shift_id):
-                continue
-            
-            # Skip if would create consecutive shift conflict
-            if has_consecutive_shift_conflict(assignments[emp], shift_id):
-                continue
-            
-            # Assign shift
-            assignments[emp].append(shift_id)
-            shift_assignments[shift_id].append(emp)
-            assigned = True
-            rank = top_12.index(shift_id) + 1
-            print(f"✓ {emp:15} → Shift {shift_id:2} (preference #{rank})")
-            break
-        
-        # If couldn't assign from top 12, try non-bottom-6 shifts
-        if not assigned:
-            shift_type_pref = prefs.get('shift_type_pref', {})
-            # Sort shift types by preference (1=best, 3=worst)
-            sorted_types = sorted(shift_type_pref.items(), key=lambda x: x[1])
-            
-            for shift_type, _ in sorted_types:
-                for shift in SHIFTS:
-                    shift_id = shift['id']
-                    
-                    # Skip if in bottom 6
-                    if shift_id in bottom_6:
-                        continue
-                    
-                    # Skip if already assigned this shift
-                    if shift_id in top_12:  # Already tried these
-                        continue
-                    
-                    # Check if matches shift type
-                    shift_matches = False
-                    if shift_type == 'saturday' and shift['day'] == 'Saturday':
-                        shift_matches = True
-                    elif shift_type == 'sunday_morning' and shift['day'] == 'Sunday' and '8:00 AM' in shift['time']:
-                        shift_matches = True
-                    elif shift_type == 'sunday_evening' and shift['day'] == 'Sunday' and '3:00 PM' in shift['time']:
-                        shift_matches = True
-                    
-                    if not shift_matches:
-                        continue
-                    
-                    # Skip if shift is full
-                    if len(shift_assignments[shift_id]) >= shift['slots']:
-                        continue
-                    
-                    # Skip if would create same-weekend conflict
-                    if has_same_weekend_conflict(assignments[emp], shift_id):
-                        continue
-                    
-                    # Skip if would create consecutive shift conflict
-                    if has_consecutive_shift_conflict(assignments[emp], shift_id):
-                        continue
-                    
-                    # Assign shift
-                    assignments[emp].append(shift_id)
-                    shift_assignments[shift_id].append(emp)
-                    assigned = True
-                    print(f"⚠ {emp:15} → Shift {shift_id:2} (backup assignment, not in top 12)")
-                    break
-                
-                if assigned:
-                    break
-        
-        if not assigned:
-            print(f"✗ {emp:15} → Could not assign first shift")
-    
-    # PHASE 2: Second shift allocation for employees with preferences (sorted by satisfaction from Phase 1)
-    print("\n=== PHASE 2: Second Shift Allocation (Preference-Based) ===")
-    
-    # Calculate satisfaction scores from Phase 1
-    employee_satisfaction = []
-    for emp in employees_with_prefs:
-        if len(assignments[emp]) > 0:
-            score = calculate_satisfaction_score(preferences[emp], assignments[emp][0])
-            employee_satisfaction.append((emp, score))
-        else:
-            employee_satisfaction.append((emp, 9999))  # No first shift = highest priority
-    
-    # Sort by satisfaction (worst first), then randomize within same score
-    employee_satisfaction.sort(key=lambda x: (x[1], random.random()))
+    # Lock preferences
+    STORE.put('settings', 'is_locked', True)
     
-    for emp, phase1_score in employee_satisfaction:
-        # Skip if already has 2 shifts
-        if len(assignments[emp]) >= 2:
+    return jsonify({
+        'success': True,
+        'assignments': assignments,
+        'shift_assignments': shift_assignments,
+        'warnings': warnings,
+        'engine': engine,
+        'run': run,
+        'timings': timings
+    })
+
+def preferences_changed_since(run):
+    """
+    Usernames whose preferences were written after the allocation in run,
+    from the change journal - or None when that can't be told.
+    """
+    if run.get('journal_seq') is None:
+        return None
+    entries = JOURNAL.entries_since(run['journal_seq'])
+    if entries is None:
+        return None
+    changed = set()
+    for entry in entries:
+        if entry['collection'] != 'preferences':
             continue
-        
-        prefs = preferences[emp]
-        top_12 = prefs['top_12']
-        bottom_6 = prefs['bottom_6']
-        
-        # Try to assign from top 12 preferences
-        assigned = False
-        for shift_id in top_12:
-            # Skip if already assigned this shift
-            if shift_id in assignments[emp]:
-                continue
-            
-            # Skip if shift is full
-            shift = next(s for s in SHIFTS if s['id'] == shift_id)
-            if len(shift_assignments[shift_id]) >= shift['slots']:
-                continue
-            
-            # Skip if would create same-weekend conflict
-            if has_same_weekend_conflict(assignments[emp], shift_id):
-                continue
-            
-            # Skip if would create consecutive shift conflict
-            if has_consecutive_shift_conflict(assignments[emp], shift_id):
-                continue
-            
-            # Assign shift
-            assignments[emp].append(shift_id)
-            shift_assignments[shift_id].append(emp)
-            assigned = True
-            rank = top_12.index(shift_id) + 1
-            print(f"✓ {emp:15} → Shift {shift_id:2} (preference #{rank}, phase 1 score was {phase1_score})")
-            break
-        
-        # If couldn't assign from top 12, try non-bottom-6 shifts
-        if not assigned:
-            shift_type_pref = prefs.get('shift_type_pref', {})
-            sorted_types = sorted(shift_type_pref.items(), key=lambda x: x[1])
-            
-            for shift_type, _ in sorted_types:
-                for shift in SHIFTS:
-                    shift_id = shift['id']
-                    
-                    # Skip if already assigned
-                    if shift_id in assignments[emp]:
-                        continue
-                    
-                    # Skip if in bottom 6
-                    if shift_id in bottom_6:
-                        continue
-                    
-                    # Check if matches shift type
-                    shift_matches = False
-                    if shift_type == 'saturday' and shift['day'] == 'Saturday':
-                        shift_matches = True
-                    elif shift_type == 'sunday_morning' and shift['day'] == 'Sunday' and '8:00 AM' in shift['time']:
-                        shift_matches = True
-                    elif shift_type == 'sunday_evening' and shift['day'] == 'Sunday' and '3:00 PM' in shift['time']:
-                        shift_matches = True
-                    
-                    if not shift_matches:
-                        continue
-                    
-                    # Skip if shift is full
-                    if len(shift_assignments[shift_id]) >= shift['slots']:
-                        continue
-                    
-                    # Skip if would create same-weekend conflict
-                    if has_same_weekend_conflict(assignments[emp], shift_id):
-                        continue
-                    
-                    # Assign shift
-                    assignments[emp].append(shift_id)
-                    shift_assignments[shift_id].append(emp)
-                    assigned = True
-                    print(f"⚠ {emp:15} → Shift {shift_id:2} (backup assignment, not in top 12)")
-                    break
-                
-                if assigned:
-                    break
-        
-        if not assigned:
-            print(f"✗ {emp:15} → Could not assign second shift")
+        if entry['op'] == 'replace':
+            # All of them at once (test data, a restore)
+            return None
+        changed.update(entry['value'] if entry['op'] == 'update' else [entry['key']])
+    return changed
+
+def record_allocation_times(engine, phase_times, elapsed):
+    for phase, seconds in phase_times.items():
+        metrics.ALLOCATION_SECONDS.observe(seconds, engine=engine, phase=phase)
+    metrics.ALLOCATION_SECONDS.observe(elapsed, engine=engine, phase='total')
+
+def save_trace(trace, run):
+    if trace.level == 'off':
+        # Don't leave an older run's trace looking like this one's
+        if os.path.exists(ALLOCATION_TRACE_FILE):
+            os.remove(ALLOCATION_TRACE_FILE)
+        return
+    save_json(ALLOCATION_TRACE_FILE, {'engine': run['engine'], 'timestamp': run['timestamp'], **trace.to_dict()})
+
+def repair_allocation(options, trace):
+    """
+    POST /api/allocate?engine=repair: patch the saved assignments (see
+    repair_allocate) for employees added or deleted since, employees whose
+    preferences changed since the last allocation, and any listed in
+    ?employees=a,b (or {"employees": [...]}).
+    """
+    assignments = get_assignments()
+    if not assignments:
+        return jsonify({'error': 'Nothing to repair yet - run a full allocation first'}), 400
+    
+    affected = options.get('employees') or []
+    if isinstance(affected, str):
+        affected = [username for username in affected.split(',') if username]
+    affected = set(affected)
+    
+    base_run = load_json(ALLOCATION_RUN_FILE) if os.path.exists(ALLOCATION_RUN_FILE) else {}
+    journal_seq = JOURNAL.status()['last_seq']
+    changed = preferences_changed_since(base_run)
+    warnings = []
+    if changed is None:
+        warnings.append("Couldn't tell from the change journal whose preferences changed since the last "
+                        "allocation - only added / deleted employees and ?employees= were repaired")
+    else:
+        affected |= changed
     
-    # PHASE 3: Random assignment for employees without complete preferences
-    if employees_without_prefs:
-        print("\n=== PHASE 3: Random Assignment for Laggards ===")
-        print(f"Processing {len(employees_without_prefs)} employees without complete preferences\n")
-        
-        for emp in employees_without_prefs:
-            warnings.append(f"{emp} was randomly assigned (no preferences submitted)")
-            
-            # Get all available shifts (not full, not creating weekend conflicts)
-            available_shifts = []
-            for shift in SHIFTS:
-                shift_id = shift['id']
-                
-                # Skip if shift is full
-                if len(shift_assignments[shift_id]) >= shift['slots']:
-                    continue
-                
-                # Skip if would create same-weekend conflict
-                if has_same_weekend_conflict(assignments[emp], shift_id):
-                    continue
-                
-                # Skip if would create consecutive shift conflict
-                if has_consecutive_shift_conflict(assignments[emp], shift_id):
-                    continue
-                
-                available_shifts.append(shift_id)
-            
-            # Randomly assign 2 shifts from available shifts
-            if len(available_shifts) >= 2:
-                selected_shifts = random.sample(available_shifts, 2)
-                for shift_id in selected_shifts:
-                    assignments[emp].append(shift_id)
-                    shift_assignments[shift_id].append(emp)
-                    print(f"⚠ {emp:15} → Shift {shift_id:2} (random assignment)")
-            else:
-                print(f"✗ {emp:15} → Not enough available shifts for random assignment")
-                warnings.append(f"{emp} could not be fully assigned - insufficient available shifts")
+    preferences = get_preferences()
+    employees_data = get_employees()
+    employee_list = [user for user, emp in employees_data.items() if not emp.get('is_manager')]
     
-    # Save assignments
-    save_json(ASSIGNMENTS_FILE, assignments)
+    started = time.perf_counter()
+    assignments, shift_assignments, repair_warnings, moved = repair_allocate(
+        SHIFT_INDEX, employee_list, preferences, assignments, affected, trace)
+    elapsed = time.perf_counter() - started
+    record_allocation_times('repair', {}, elapsed)
+    warnings += repair_warnings
+    
+    run = {
+        'engine': 'repair',
+        # The full allocation this one patched (greedy_allocate with its seed reproduces that)
+        'base': base_run.get('base') or {key: base_run[key] for key in ('engine', 'seed', 'timestamp') if key in base_run},
+        'moved': moved,
+        'summary': summarize_allocation(SHIFT_INDEX, assignments, preferences),
+        'timestamp': datetime.now().isoformat(),
+        'journal_seq': journal_seq
+    }
     
-    # Lock preferences
-    settings = get_settings()
-    settings['is_locked'] = True
-    save_json(SETTINGS_FILE, settings)
+    STORE.save('assignments', assignments)
+    save_json(ALLOCATION_RUN_FILE, run)
+    save_trace(trace, run)
+    EXPORT_CACHE.clear()
+    STORE.put('settings', 'is_locked', True)
     
     return jsonify({
         'success': True,
         'assignments': assignments,
         'shift_assignments': shift_assignments,
-        'warnings': warnings
+        'warnings': warnings,
+        'engine': 'repair',
+        'moved': moved,
+        'run': run,
+        'timings': {'repair': {'elapsed_seconds': round(elapsed, 4), 'summary': run['summary']}}
     })
 
-@app.route('/api/backup')
-def backup_data():
-    """Download all data files as JSON for backup"""
+@route('/api/allocation-trace')
+def allocation_trace():
+    """
+    The last allocation's trace: ?employee=, ?phase= (phase1, phase2, phase3,
+    solve, multiseed, repair) and ?event= (assigned, backup, random, rejected,
+    unassigned, freed) narrow it down; ?limit= caps the events returned.
+    """
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    backup_data = {
-        'employees': get_employees(),
-        'preferences': get_preferences(),
-        'settings': get_settings(),
-        'assignments': get_assignments(),
-        'timestamp': datetime.now().isoformat()
-    }
+    try:
+        limit = int(request.args.get('limit', TRACE_MAX_EVENTS))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not os.path.exists(ALLOCATION_TRACE_FILE):
+        return jsonify({'error': 'No allocation has been traced yet'}), 404
+    
+    trace = load_json(ALLOCATION_TRACE_FILE)
+    events = filter_events(trace.pop('events'), request.args.get('employee'), request.args.get('phase'),
+                           request.args.get('event'))
+    return jsonify({**trace, 'matched': len(events), 'events': events[:max(0, min(limit, TRACE_MAX_EVENTS))]})
+
+@route('/api/backup')
+def backup_data():
+    """Download all data files for backup - gzipped JSON, streamed (?format=json for plain JSON)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    from io import BytesIO
-    output = BytesIO()
-    output.write(json.dumps(backup_data, indent=2).encode('utf-8'))
-    output.seek(0)
+    compress = request.args.get('format', 'gzip') != 'json'
+    filename = f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json' + ('.gz' if compress else '')
     
-    return send_file(
-        output,
-        mimetype='application/json',
-        as_attachment=True,
-        download_name=f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+    return Response(
+        stream_archive(STORE.load, COLLECTIONS, compress),
+        mimetype='application/gzip' if compress else 'application/json',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
-@app.route('/api/populate-test-data', methods=['POST'])
+@route('/api/populate-test-data', methods=['POST'])
 def populate_test_data():
     """Populate random preferences for all employees (TESTING ONLY)"""
     if not session.get('is_manager'):
@@ -791,203 +855,221 @@ def populate_test_data():
     employees = get_employees()
     preferences = {}
     
-    # All 60 shift IDs
-    all_shifts = list(range(60))
+    # Optional seed makes the generated data reproducible
+    seed = (request.get_json(silent=True) or {}).get('seed')
+    rng = random.Random(seed)
     
     # Generate random preferences for each non-manager employee
     for username, emp_data in employees.items():
         if emp_data.get('is_manager'):
             continue
-        
-        # Shuffle all shifts
-        shuffled = all_shifts.copy()
-        random.shuffle(shuffled)
-        
-        # Top 12 are first 12 from shuffled list
-        top_12 = shuffled[:12]
-        
-        # Bottom 6 are next 6 from shuffled list
-        bottom_6 = shuffled[12:18]
-        
-        # Random shift type preferences (1, 2, 3)
-        shift_types = [1, 2, 3]
-        random.shuffle(shift_types)
-        
-        preferences[username] = {
-            'top_12': top_12,
-            'bottom_6': bottom_6,
-            'shift_type_pref': {
-                'saturday': str(shift_types[0]),
-                'sunday_morning': str(shift_types[1]),
-                'sunday_evening': str(shift_types[2])
-            }
-        }
+        preferences[username] = random_preferences(rng, SHIFT_INDEX.ids)
     
     # Save preferences
-    save_json(PREFERENCES_FILE, preferences)
+    STORE.save('preferences', preferences)
     
     return jsonify({
         'success': True,
         'message': f'Populated random preferences for {len(preferences)} employees'
     })
 
-@app.route('/api/export-excel')
+EXPORT_FORMATS = ('mailmerge', 'writers', 'xlsx', 'ics')
+EXPORT_MIMETYPES = {
+    '.csv': 'text/csv',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.ics': 'text/calendar',
+    '.zip': 'application/zip'
+}
+
+def run_exports(data, formats, sheets=(), usernames=None):
+    """Writers for the given formats (see exports.py), fed in one walk over the assignments"""
+    stamp = datetime.now().strftime("%Y%m%d")
+    writers = []
+    for fmt in formats:
+        if fmt == 'mailmerge':
+            writers.append(MailMergeCsv(f'trunk_mailmerge_{stamp}.csv'))
+        elif fmt == 'writers':
+            writers.append(WriterSummaryCsv(f'mailmerge_trunk_assignments_{stamp}.csv'))
+        elif fmt == 'xlsx':
+            preferences = data['preferences']
+            rank_matrix = RankMatrix(preferences.keys(), SHIFT_INDEX.ids, preferences)
+            writers.append(ExcelSchedule(f'weekend_shift_schedule_{stamp}.xlsx', SHIFT_INDEX, rank_matrix,
+                                         per_week='week' in sheets, per_employee='employee' in sheets))
+        elif fmt == 'ics':
+            writers.append(Calendars(usernames=usernames))
+    return run_export(SHIFT_INDEX, data['assignments'], data['employees'], writers)
+
+def send_export(formats, sheets=(), usernames=None, download_name=None):
+    """
+    The export as a download: a single file as itself, several as one zip.
+    Built once per version of the data (see ExportCache) - repeat requests
+    are served from data/exports/, and with If-None-Match get a 304.
+    """
+    data = {collection: STORE.load(collection) for collection in ('assignments', 'employees', 'preferences')}
+    key = EXPORT_CACHE.key(record_etag(data), {
+        'formats': list(formats),
+        'sheets': sorted(sheets),
+        'usernames': sorted(usernames) if usernames is not None else None
+    })
+    cached = EXPORT_CACHE.get(key)
+    metrics.EXPORT_CACHE_REQUESTS.inc(result='miss' if cached is None else 'hit')
+    if cached is None:
+        with metrics.EXPORT_SECONDS.time(formats='+'.join(formats)):
+            writers = run_exports(data, formats, sheets, usernames)
+            files = [file for writer in writers for file in writer.files()]
+            if len(files) == 1:
+                name, write = files[0]
+            else:
+                name = f'weekend_trunk_export_{datetime.now().strftime("%Y%m%d")}.zip'
+                write = lambda f: write_bundle(f, writers)
+            cached = EXPORT_CACHE.put(key, download_name or os.path.basename(name), write)
+    
+    path, meta = cached
+    response = send_file(
+        path,
+        mimetype=EXPORT_MIMETYPES.get(os.path.splitext(meta['download_name'])[1], 'application/octet-stream'),
+        as_attachment=True,
+        download_name=meta['download_name'],
+        etag=key,
+        last_modified=datetime.fromisoformat(meta['created']),
+        conditional=True
+    )
+    # Per-user data: browsers may keep it but must revalidate, shared caches must not
+    response.cache_control.private = True
+    return response
+
+def export_sheets():
+    sheets = set(filter(None, request.args.get('sheets', '').split(',')))
+    if not sheets <= {'week', 'employee'}:
+        raise ValueError('sheets must be week and/or employee')
+    return sheets
+
+# Open /api/events streams per process: each holds a server thread, so
+# they're capped, and each ends after SSE_STREAM_SECONDS (the browser
+# reconnects and resumes from its Last-Event-ID)
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 12))
+SSE_STREAM_SECONDS = int(os.environ.get('SSE_STREAM_SECONDS', 60))
+SSE_RETRY_MS = 3000
+SSE_BUSY_RETRY_MS = 15000
+_event_streams = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+def event_for(event, username, is_manager):
+    """What one dashboard gets of an event, or None if it isn't theirs"""
+    audience = event['audience']
+    if not is_manager and audience != 'all' and audience != username:
+        return None
+    data = event['data']
+    if event['event'] == 'settings':
+        data = {**data, 'deadline_display': deadline_display(data),
+                'preferences_locked': preferences_locked(data)}
+    elif event['event'] == 'allocation' and not is_manager:
+        # Employees get their own shifts instead of the counters
+        data = {'shifts': [{key: SHIFT_INDEX[shift_id][key] for key in ('id', 'day', 'date', 'time')}
+                           for shift_id in get_assignments().get(username, []) if shift_id in SHIFT_INDEX]}
+    return data
+
+@route('/api/events')
+def events():
+    """
+    Server-Sent Events for the open dashboards: settings (deadline / lock),
+    allocation, and for managers submission and roster, each with the new
+    dashboard counters.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    username = session['username']
+    is_manager = session.get('is_manager', False)
+    if not _event_streams.acquire(blocking=False):
+        # Every stream slot is taken - have the browser try again later
+        return Response(f'retry: {SSE_BUSY_RETRY_MS}\n\n', mimetype='text/event-stream')
+    
+    try:
+        position = EVENTS.position_after(request.headers.get('Last-Event-ID'))
+        
+        def stream():
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            for event in EVENTS.follow(position, SSE_STREAM_SECONDS):
+                if event is None:
+                    yield ': keepalive\n\n'
+                    continue
+                data = event_for(event, username, is_manager)
+                if data is not None:
+                    yield format_event(event['id'], event['event'], data)
+        
+        response = Response(stream(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        # The server closes the response when the stream ends or the browser goes away
+        response.call_on_close(_event_streams.release)
+        return response
+    except BaseException:
+        # No response to close - give the slot back here or it's gone for good
+        _event_streams.release()
+        raise
+
+@route('/api/export')
+def export_bundle():
+    """
+    Several exports from one pass over the data (MANAGER ONLY).
+    ?formats= any of mailmerge, writers, xlsx, ics (default: all) - more
+    than one file comes as a zip. ?sheets= as for /api/export-excel.
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    formats = request.args.get('formats', ','.join(EXPORT_FORMATS)).split(',')
+    unknown = [fmt for fmt in formats if fmt not in EXPORT_FORMATS]
+    if unknown:
+        return jsonify({'error': f"Unknown format(s): {', '.join(unknown)}"}), 400
+    
+    try:
+        sheets = export_sheets()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        return send_export(formats, sheets)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@route('/api/export-excel')
 def export_excel():
+    """
+    Schedule workbook (MANAGER ONLY). ?sheets=week,employee adds a sheet
+    per week and/or per employee to the main schedule sheet.
+    """
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-        from io import BytesIO
-        
-        assignments = get_assignments()
-        employees = get_employees()
-        preferences = get_preferences()
-        
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Weekend Schedule"
-        
-        # Title
-        ws['A1'] = 'Weekend Trunk Shift Schedule - Dec 2025 - Apr 2026'
-        ws['A1'].font = Font(size=16, bold=True)
-        ws.merge_cells('A1:H1')
-        
-        # Headers
-        headers = ['Date', 'Day', 'Time', 'Assigned Employee', 'Preference Rank', 'Status', 'Week', 'Notes']
-        header_row = 3
-        for col, header in enumerate(headers, start=1):
-            cell = ws.cell(row=header_row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Data
-        row = header_row + 1
-        for shift in SHIFTS:
-            shift_id = shift['id']
-            assigned = []
-            
-            for emp, emp_shifts in assignments.items():
-                if shift_id in emp_shifts:
-                    assigned.append(emp)
-            
-            # Date
-            ws.cell(row=row, column=1).value = shift['date']
-            
-            # Day
-            ws.cell(row=row, column=2).value = shift['day']
-            
-            # Time
-            ws.cell(row=row, column=3).value = shift['time']
-            
-            # Assigned employee
-            if assigned:
-                emp = assigned[0]
-                emp_name = employees[emp]['name']
-                ws.cell(row=row, column=4).value = emp_name
-                
-                # Get preference rank
-                if emp in preferences:
-                    prefs = preferences[emp]
-                    if shift_id in prefs.get('top_12', []):
-                        rank = prefs['top_12'].index(shift_id) + 1
-                        ws.cell(row=row, column=5).value = f"#{rank}"
-                    elif shift_id in prefs.get('bottom_6', []):
-                        ws.cell(row=row, column=5).value = "Bottom 6"
-                        ws.cell(row=row, column=5).font = Font(color="FF0000")
-                    else:
-                        ws.cell(row=row, column=5).value = "N/A"
-                else:
-                    ws.cell(row=row, column=5).value = "N/A"
-            else:
-                ws.cell(row=row, column=4).value = "VACANT"
-                ws.cell(row=row, column=4).font = Font(color="FF0000", bold=True)
-            
-            # Status
-            if assigned:
-                ws.cell(row=row, column=6).value = "FILLED"
-                ws.cell(row=row, column=6).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-            else:
-                ws.cell(row=row, column=6).value = "VACANT"
-                ws.cell(row=row, column=6).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            
-            # Week
-            ws.cell(row=row, column=7).value = shift['week']
-            
-            row += 1
-        
-        # Employee summary section
-        row += 2
-        ws.cell(row=row, column=1).value = "Employee Summary"
-        ws.cell(row=row, column=1).font = Font(size=14, bold=True)
-        ws.merge_cells(f'A{row}:D{row}')
-        
-        row += 1
-        summary_headers = ['Employee', 'Shifts Assigned', 'Shift Details', 'Status']
-        for col, header in enumerate(summary_headers, start=1):
-            cell = ws.cell(row=row, column=col)
-            cell.value = header
-            cell.font = Font(bold=True, color="FFFFFF")
-            cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-        
-        row += 1
-        for emp, emp_data in employees.items():
-            if emp_data.get('is_manager'):
-                continue
-            
-            ws.cell(row=row, column=1).value = emp_data['name']
-            
-            emp_shifts = assignments.get(emp, [])
-            ws.cell(row=row, column=2).value = len(emp_shifts)
-            
-            # Shift details
-            shift_details = []
-            for shift_id in emp_shifts:
-                shift = next(s for s in SHIFTS if s['id'] == shift_id)
-                shift_details.append(f"{shift['date']} {shift['day']} {shift['time']}")
-            ws.cell(row=row, column=3).value = "; ".join(shift_details) if shift_details else "None"
-            
-            # Status
-            if len(emp_shifts) == 2:
-                ws.cell(row=row, column=4).value = "Complete"
-                ws.cell(row=row, column=4).fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-            else:
-                ws.cell(row=row, column=4).value = f"Incomplete ({len(emp_shifts)}/2)"
-                ws.cell(row=row, column=4).fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-            
-            row += 1
-        
-        # Adjust column widths
-        ws.column_dimensions['A'].width = 12
-        ws.column_dimensions['B'].width = 12
-        ws.column_dimensions['C'].width = 20
-        ws.column_dimensions['D'].width = 20
-        ws.column_dimensions['E'].width = 15
-        ws.column_dimensions['F'].width = 15
-        ws.column_dimensions['G'].width = 10
-        ws.column_dimensions['H'].width = 30
-        
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'weekend_shift_schedule_{datetime.now().strftime("%Y%m%d")}.xlsx'
-        )
+        sheets = export_sheets()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
+    try:
+        return send_export(['xlsx'], sheets)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@route('/api/export-calendar')
+def export_calendar():
+    """Your assigned shifts as an iCalendar file (managers: ?username= for anyone's)"""
+    if 'username' not in session:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    username = session['username']
+    if session.get('is_manager'):
+        username = request.args.get('username', username)
+        if STORE.get('employees', username) is None:
+            return jsonify({'error': 'User not found'}), 404
+    
+    try:
+        return send_export(['ics'], usernames=[username], download_name=f'trunk_shifts_{username}.ics')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/change-password', methods=['POST'])
+@route('/api/change-password', methods=['POST'])
 def change_password():
     """Allow users to change their password"""
     if 'username' not in session:
@@ -1011,12 +1093,12 @@ def change_password():
     if username not in employees:
         return jsonify({'error': 'User not found'}), 404
     
-    if not check_password_hash(employees[username]['password'], current_password):
+    if not password_matches(employees[username]['password'], current_password):
         return jsonify({'error': 'Current password is incorrect'}), 401
     
     # Update password
     employees[username]['password'] = generate_password_hash(new_password)
-    save_json(EMPLOYEES_FILE, employees)
+    STORE.put('employees', username, employees[username])
     
     return jsonify({'success': True, 'message': 'Password changed successfully'})
 
@@ -1054,47 +1136,121 @@ TRUNK_WRITER_CREDENTIALS = [
     {"name": "Zengerle, Patricia A.", "username": "patricia.zengerle", "password": "US1VPF"},
 ]
 
-@app.route('/api/reload-employees-from-csv', methods=['POST'])
+def trunk_writer_accounts():
+    """TRUNK_WRITER_CREDENTIALS as provisioning rows"""
+    return [(number, writer['name'], writer['username'], writer['password'])
+            for number, writer in enumerate(TRUNK_WRITER_CREDENTIALS, 1)]
+
+def start_provisioning(accounts, errors, description, replace_with=None):
+    """
+    Hash and store accounts on a background job; returns the 202 response
+    pointing at its status. replace_with=None adds the accounts, otherwise
+    all employee accounts become replace_with plus the new ones. Only one
+    job runs at a time; while one does, this returns 409 pointing at it.
+    
+    The write checks the accounts as they are once hashing is done: added
+    usernames taken in the meantime are skipped (the job reports them), and
+    a replace fails without writing if any account changed since the start.
+    """
+    started_version = record_etag(STORE.load('employees'))
+    
+    def write(hashed):
+        with STORE.locked('employees'):
+            employees = STORE.load('employees')
+            if replace_with is None:
+                taken = sorted(username for username in hashed if username in employees)
+                fresh = {username: account for username, account in hashed.items() if username not in employees}
+                if fresh:
+                    STORE.update('employees', fresh)
+            else:
+                if record_etag(employees) != started_version:
+                    raise RuntimeError('Employee accounts changed while the job ran - nothing was written, start it again')
+                taken = []
+                queue_auto_backup('provision', before_change=True)
+                STORE.save('employees', {**replace_with, **hashed})
+        EXPORT_CACHE.clear()
+        return taken
+    
+    try:
+        job = PROVISIONING.start(accounts, errors, write, description)
+    except ProvisioningBusy as e:
+        return jsonify({
+            'error': str(e),
+            'job_id': e.job['id'],
+            'status_url': url_for('provision_job_status', job_id=e.job['id'])
+        }), 409
+    status_url = url_for('provision_job_status', job_id=job['id'])
+    response = jsonify({
+        'success': True,
+        'message': f"Provisioning {job['total']} accounts - poll status_url for progress",
+        'job_id': job['id'],
+        'status_url': status_url,
+        'total_accounts': job['total'] + (len(replace_with) if replace_with is not None else 0),
+        'errors': errors
+    })
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+@route('/api/reload-employees-from-csv', methods=['POST'])
 def reload_employees_from_csv():
     """Reload employee accounts from embedded credentials data (ADMIN ONLY)"""
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
+    # Replace all employee accounts with admin + the trunk writers
+    admin = {'name': 'Admin', 'is_manager': True, 'password': SEED_PASSWORD_HASHES['admin123']}
+    return start_provisioning(trunk_writer_accounts(), [], 'reload trunk writers', replace_with={'admin': admin})
+
+@route('/api/provision-accounts', methods=['POST'])
+def provision_accounts():
+    """
+    Bulk-create accounts from a CSV (name,username,password) or JSONL upload
+    (ADMIN ONLY). Send the file as the request body or as the 'file' field
+    of a form. ?mode=add (default) adds accounts; ?mode=replace replaces
+    every non-manager account. Poll the returned status_url for progress.
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    mode = request.args.get('mode', 'add')
+    if mode not in ('add', 'replace'):
+        return jsonify({'error': 'mode must be add or replace'}), 400
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': "No 'file' in the form"}), 400
+        stream, fmt = upload.stream, guess_format(upload.mimetype, upload.filename)
+    else:
+        stream, fmt = request.stream, guess_format(request.mimetype)
+    
+    employees = get_employees()
+    managers = {username: emp for username, emp in employees.items() if emp.get('is_manager')}
     try:
-        employees = {}
-        
-        # Add admin account
-        employees['admin'] = {
-            'name': 'Admin',
-            'is_manager': True,
-            'password': generate_password_hash('admin123')
-        }
-        
-        # Add all trunk writers from embedded data
-        for writer in TRUNK_WRITER_CREDENTIALS:
-            username = writer['username']
-            name = writer['name']
-            password = writer['password']
-            
-            employees[username] = {
-                'name': name,
-                'is_manager': False,
-                'password': generate_password_hash(password)
-            }
-        
-        # Save to employees.json
-        save_json(EMPLOYEES_FILE, employees)
-        
-        return jsonify({
-            'success': True,
-            'message': f'Successfully reloaded {len(employees) - 1} trunk writer accounts',
-            'total_accounts': len(employees)
-        })
+        accounts, errors = read_accounts(stream, request.args.get('format', fmt),
+                                         taken=employees if mode == 'add' else managers)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    if not accounts:
+        return jsonify({'error': 'No valid accounts in the upload', 'errors': errors}), 400
+    
+    return start_provisioning(accounts, errors, f'{mode} {len(accounts)} accounts',
+                              replace_with=managers if mode == 'replace' else None)
 
-@app.route('/api/reset-data', methods=['POST'])
+@route('/api/provision-jobs/<job_id>')
+def provision_job_status(job_id):
+    """Progress of a provisioning job (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    job = PROVISIONING.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@route('/api/reset-data', methods=['POST'])
 def reset_data():
     """Reset preferences and assignments (ADMIN ONLY - for testing)"""
     if not session.get('is_manager'):
@@ -1102,18 +1258,16 @@ def reset_data():
     
     try:
         # Create backup before resetting
-        create_auto_backup()
+        queue_auto_backup('reset', before_change=True)
         
         # Clear preferences
-        save_json(PREFERENCES_FILE, {})
+        STORE.save('preferences', {})
         
         # Clear assignments
-        save_json(ASSIGNMENTS_FILE, {})
+        STORE.save('assignments', {})
         
         # Unlock preferences
-        settings = get_settings()
-        settings['is_locked'] = False
-        save_json(SETTINGS_FILE, settings)
+        STORE.put('settings', 'is_locked', False)
         
         return jsonify({
             'success': True,
@@ -1123,13 +1277,15 @@ def reset_data():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/create-backup', methods=['POST'])
+@route('/api/create-backup', methods=['POST'])
 def trigger_backup():
     """Manually trigger a backup (ADMIN ONLY)"""
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    success = create_auto_backup()
+    # Write out anything the background writer still holds first, so snapshots stay in order
+    BACKUP_WORKER.flush()
+    success = create_auto_backup('manual')
     if success:
         return jsonify({
             'success': True,
@@ -1138,107 +1294,220 @@ def trigger_backup():
     else:
         return jsonify({'error': 'Backup failed'}), 500
 
-@app.route('/api/list-backups')
+@route('/api/backup-status')
+def backup_status():
+    """Background backup writer queue and last snapshot (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        **BACKUP_WORKER.status()
+    })
+
+@route('/api/list-backups')
 def list_backups():
     """List all available backups (ADMIN ONLY)"""
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        backup_files = sorted([f for f in os.listdir(BACKUP_DIR) if f.startswith('auto_backup_')], reverse=True)
-        backups = []
-        
-        for filename in backup_files[:30]:  # Show last 30
-            filepath = os.path.join(BACKUP_DIR, filename)
-            stat = os.stat(filepath)
-            backups.append({
-                'filename': filename,
-                'size': stat.st_size,
-                'created': datetime.fromtimestamp(stat.st_mtime).isoformat()
-            })
+        limit = request.args.get('limit', 30, type=int)
         
         return jsonify({
             'success': True,
-            'backups': backups,
-            'total': len(backup_files)
+            'backups': BACKUPS.list(limit),
+            'total': BACKUPS.count()
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/initialize-system', methods=['GET'])
+@route('/api/cache-stats')
+def data_cache_stats():
+    """JSON read cache hit/miss counters for this worker process (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({
+        'success': True,
+        'backend': STORE.backend,
+        'pid': os.getpid(),
+        **cache_stats()
+    })
+
+# Bearer token a Prometheus scraper sends to /metrics (managers' sessions work too)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+@route('/metrics')
+def prometheus_metrics():
+    """Request, storage, backup, allocation and export latencies of every worker, in the Prometheus text format"""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not session.get('is_manager') and not (METRICS_TOKEN and secrets.compare_digest(token, METRICS_TOKEN)):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # So this worker's latest numbers are in the files being added up
+    metrics.flush(METRICS_DIR, force=True)
+    return Response(metrics.exposition(metrics.collect(METRICS_DIR)), mimetype='text/plain; version=0.0.4')
+
+@route('/api/profiles')
+def list_profiles():
+    """Recently profiled requests, newest first (ADMIN ONLY) - add ?profile=1 to any request to profile it"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({'success': True, 'profiles': PROFILES.list()})
+
+@route('/api/profiles/<profile_id>')
+def get_profile(profile_id):
+    """
+    One profile: ?format=text (default) for the slowest functions by
+    cumulative time, pstats for the cProfile stats file, collapsed for
+    flame graph stacks (ADMIN ONLY)
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    fmt = request.args.get('format', 'text')
+    if fmt not in ('text', 'pstats', 'collapsed'):
+        return jsonify({'error': 'format must be text, pstats or collapsed'}), 400
+    if fmt == 'text':
+        summary = PROFILES.summary(profile_id)
+        if summary is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        return Response(summary, mimetype='text/plain')
+    
+    path = PROFILES.path(profile_id, fmt)
+    if path is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, mimetype='application/octet-stream' if fmt == 'pstats' else 'text/plain',
+                     as_attachment=True, download_name=os.path.basename(path))
+
+@route('/initialize-system', methods=['GET'])
 def initialize_system():
-    """PUBLIC ENDPOINT: Initialize employees.json from embedded credentials (NO AUTH REQUIRED)"""
+    """Initialize employees.json from embedded credentials (ADMIN ONLY)"""
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
     try:
-        employees = {}
-        
-        # Add admin account
-        employees['admin'] = {
-            'name': 'Admin',
-            'is_manager': True,
-            'password': generate_password_hash('admin123')
-        }
-        
-        # Add all trunk writers from embedded data
-        for writer in TRUNK_WRITER_CREDENTIALS:
-            username = writer['username']
-            name = writer['name']
-            password = writer['password']
-            
-            employees[username] = {
-                'name': name,
-                'is_manager': False,
-                'password': generate_password_hash(password)
-            }
-        
-        # Save to employees.json
-        save_json(EMPLOYEES_FILE, employees)
-        
-        return jsonify({
-            'success': True,
-            'message': f'Successfully initialized {len(employees) - 1} trunk writer accounts + admin',
-            'total_accounts': len(employees),
-            'note': 'You can now login with your credentials'
-        })
+        # Replace all employee accounts with admin + the trunk writers
+        admin = {'name': 'Admin', 'is_manager': True, 'password': SEED_PASSWORD_HASHES['admin123']}
+        return start_provisioning(trunk_writer_accounts(), [], 'initialize trunk writers',
+                                  replace_with={'admin': admin})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/restore-from-backup', methods=['POST'])
+@route('/api/restore-from-backup', methods=['POST'])
 def restore_from_backup():
-    """Restore preferences from a backup JSON (ADMIN ONLY)"""
+    """
+    Restore from a backup (ADMIN ONLY). The body is a /api/backup download,
+    gzipped or plain JSON, or {"snapshot": "<filename from /api/list-backups>"}.
+    Restores preferences and, if present, settings; ?sections=... picks others.
+    """
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
+    wanted = request.args.get('sections', 'preferences,settings').split(',')
+    if any(section not in COLLECTIONS for section in wanted):
+        return jsonify({'error': f"sections must be from: {', '.join(COLLECTIONS)}"}), 400
+    
     try:
-        data = request.json
+        # Parse the upload one section at a time, validating each as it arrives
+        sections = {}
+        snapshot = None
+        for key, value in read_sections(request.stream):
+            if key == 'snapshot':
+                snapshot = value
+            elif key in wanted:
+                validate_section(key, value, SHIFT_INDEX)
+                sections[key] = value
+        
+        if snapshot is not None:
+            try:
+                backup = BACKUPS.load(snapshot)
+            except KeyError:
+                return jsonify({'error': 'Backup not found'}), 404
+            sections = {}
+            for key in wanted:
+                if key in backup:
+                    validate_section(key, backup[key], SHIFT_INDEX)
+                    sections[key] = backup[key]
         
         # Expecting full backup format with 'preferences' key
-        if 'preferences' not in data:
+        if 'preferences' in wanted and 'preferences' not in sections:
             return jsonify({'error': 'Invalid backup format - missing preferences'}), 400
-        
+    
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
         # Create backup of current state before restoring
-        create_auto_backup()
-        
-        # Restore preferences
-        preferences = data['preferences']
-        save_json(PREFERENCES_FILE, preferences)
+        queue_auto_backup('restore', before_change=True)
         
-        # Optionally restore settings if provided
-        if 'settings' in data:
-            settings = data['settings']
-            save_json(SETTINGS_FILE, settings)
+        # Swap every validated section in together
+        STORE.save_many(sections)
         
+        preferences = sections.get('preferences', {})
         return jsonify({
             'success': True,
             'message': f'Successfully restored {len(preferences)} preference submissions',
-            'preferences_restored': len(preferences)
+            'preferences_restored': len(preferences),
+            'sections_restored': list(sections)
         })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/allocation-report')
+@route('/api/time-travel')
+def time_travel():
+    """
+    Read-only view of the data as it was at a point in time (ADMIN ONLY),
+    rebuilt from the change journal:
+    /api/time-travel?at=2025-12-05T17:00&collection=preferences&key=employee3
+    """
+    if not session.get('is_manager'):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    at = request.args.get('at')
+    collection = request.args.get('collection')
+    key = request.args.get('key')
+    if not at:
+        return jsonify({'error': 'at (ISO date/time) is required'}), 400
+    if collection is not None and collection not in COLLECTIONS:
+        return jsonify({'error': f"collection must be one of: {', '.join(COLLECTIONS)}"}), 400
+    
+    try:
+        state, seq = JOURNAL.state_at(at)
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO date/time'}), 400
+    if state is None:
+        return jsonify({'error': 'No history before the journal started', **JOURNAL.status()}), 404
+    
+    # Never hand out password hashes
+    for employee in state.get('employees', {}).values():
+        employee.pop('password', None)
+    
+    if collection is None:
+        value = state
+    elif key is None:
+        value = state.get(collection, {})
+    elif key in state.get(collection, {}):
+        value = state[collection][key]
+    else:
+        return jsonify({'error': f'{key} not found in {collection} at {at}', 'as_of_seq': seq}), 404
+    
+    return jsonify({
+        'success': True,
+        'at': at,
+        'as_of_seq': seq,
+        'collection': collection,
+        'key': key,
+        'value': value
+    })
+
+@route('/api/allocation-report')
 def allocation_report():
     """Generate preference satisfaction report after allocation (ADMIN ONLY)"""
     if not session.get('is_manager'):
@@ -1249,48 +1518,32 @@ def allocation_report():
         assignments = get_assignments()
         employees_data = get_employees()
         
-        # Analyze allocation results
-        rank_counts = {i: 0 for i in range(1, 13)}  # Top 12 ranks
-        fallback_count = 0
-        bottom_6_violations = []
-        fallback_writers = []
-        total_shifts_assigned = 0
-        
-        for username, assigned_shifts in assignments.items():
-            if not assigned_shifts or username not in preferences:
-                continue
-            
-            prefs = preferences[username]
-            top_12 = prefs.get('top_12', [])
-            bottom_6 = prefs.get('bottom_6', [])
-            
-            # Check each assigned shift
-            for assigned_shift in assigned_shifts:
-                total_shifts_assigned += 1
-                
-                # Check if in top_12
-                if assigned_shift in top_12:
-                    rank = top_12.index(assigned_shift) + 1
-                    rank_counts[rank] += 1
-                # Check if in bottom_6 (should never happen!)
-                elif assigned_shift in bottom_6:
-                    bottom_6_violations.append({
-                        'name': employees_data[username]['name'],
-                        'username': username,
-                        'shift_id': assigned_shift
-                    })
-                # Fallback assignment
-                else:
-                    fallback_count += 1
-                    fallback_writers.append({
-                        'name': employees_data[username]['name'],
-                        'username': username,
-                        'shift_id': assigned_shift
-                    })
+        # Analyze allocation results - only writers who submitted preferences and got shifts
+        submitted = {username: shifts for username, shifts in assignments.items()
+                     if shifts and username in preferences}
+        rank_matrix = RankMatrix(submitted.keys(), SHIFT_INDEX.ids, preferences)
+        stats = rank_matrix.allocation_stats(submitted)
+        ranks = stats['ranks']
+        
+        histogram = stats['rank_histogram']
+        rank_counts = {i: int(histogram[i - 1]) if i <= len(histogram) else 0 for i in range(1, 13)}  # Top 12 ranks
+        fallback_count = int((ranks == 0).sum())
+        total_shifts_assigned = len(ranks)
+        
+        def writer_rows(mask):
+            return [{
+                'name': employees_data[rank_matrix.employees[i]]['name'],
+                'username': rank_matrix.employees[i],
+                'shift_id': rank_matrix.shift_ids[j]
+            } for i, j in zip(stats['rows'][mask], stats['cols'][mask])]
+        
+        # Bottom 6 should never happen!
+        bottom_6_violations = writer_rows(ranks < 0)
+        fallback_writers = writer_rows(ranks == 0)
         
         total_with_prefs = sum(1 for prefs in preferences.values() 
                                if prefs and len(prefs.get('top_12', [])) == 12)
-        top_12_total = sum(rank_counts.values())
+        top_12_total = int(stats['top_count'].sum())
         expected_total_shifts = total_with_prefs * 2  # Each writer gets 2 shifts
         
         return jsonify({
@@ -1312,84 +1565,42 @@ def allocation_report():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/export-mailmerge')
+@route('/api/export-mailmerge')
 def export_mailmerge():
     """Export simple CSV for mail merge: Writer Name, Shift (in chronological order)"""
     if not session.get('is_manager'):
         return jsonify({'error': 'Unauthorized'}), 403
     
     try:
-        import csv
-        from io import StringIO
-        
-        assignments = get_assignments()
-        employees = get_employees()
-        
-        # Build list of assignments in chronological order
-        shift_assignments = []
-        
-        for shift in SHIFTS:  # SHIFTS are already in chronological order
-            shift_id = shift['id']
-            
-            # Find who's assigned to this shift
-            for username, assigned_shifts in assignments.items():
-                if shift_id in assigned_shifts:
-                    writer_name = employees[username]['name']
-                    
-                    # Format date: "Dec. 14" from "2025-12-14"
-                    date_obj = datetime.strptime(shift['date'], '%Y-%m-%d')
-                    month = date_obj.strftime('%b.')
-                    day = str(date_obj.day)
-                    formatted_date = f"{month} {day}"
-                    
-                    # Format time: "11-7" from "11:00 AM - 7:00 PM", "8-4" from "8:00 AM - 4:00 PM", etc.
-                    time_str = shift['time']
-                    if '11:00 AM - 7:00 PM' in time_str:
-                        time_formatted = '11-7'
-                    elif '8:00 AM - 4:00 PM' in time_str:
-                        time_formatted = '8-4'
-                    elif '3:00 PM - 10:00 PM' in time_str:
-                        time_formatted = '3-10'
-                    else:
-                        time_formatted = time_str
-                    
-                    # Format: "Saturday, Dec. 14, 11-7 ET"
-                    shift_formatted = f"{shift['day']}, {formatted_date}, {time_formatted} ET"
-                    
-                    shift_assignments.append({
-                        'writer_name': writer_name,
-                        'shift': shift_formatted
-                    })
-        
-        # Create CSV
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(['Writer Name', 'Shift'])
-        
-        # Write data (already in chronological order)
-        for assignment in shift_assignments:
-            writer.writerow([assignment['writer_name'], assignment['shift']])
-        
-        # Convert to bytes
-        output.seek(0)
-        csv_content = output.getvalue()
-        
-        from io import BytesIO
-        bytes_output = BytesIO()
-        bytes_output.write(csv_content.encode('utf-8'))
-        bytes_output.seek(0)
-        
-        return send_file(
-            bytes_output,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=f'trunk_mailmerge_{datetime.now().strftime("%Y%m%d")}.csv'
-        )
-    
+        return send_export(['mailmerge'])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def create_app(config=None):
+    """
+    Build the Flask app. config holds Flask settings plus optional DATA_DIR
+    and STORAGE_BACKEND, which repoint the (module-wide) stores - so one
+    data directory per process. No data is read or created until the
+    first request.
+    """
+    config = dict(config or {})
+    if 'DATA_DIR' in config or 'STORAGE_BACKEND' in config:
+        use_data_dir(config.pop('DATA_DIR', DATA_DIR), config.pop('STORAGE_BACKEND', None))
+    
+    app = Flask(__name__, template_folder=template_folder)
+    app.secret_key = config.pop('SECRET_KEY', SECRET_KEY)
+    app.config.update(config)
+    app.before_request(start_request_timer)
+    app.before_request(start_profile)
+    app.before_request(ensure_data)
+    app.after_request(record_request)
+    app.after_request(save_profile)
+    app.teardown_request(abandon_profile)
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -0,0 +1,200 @@
+"""
+Streaming gzip backup archives
+
+An archive is the /api/backup JSON document ({employees, preferences,
+settings, assignments, timestamp}), gzip-compressed. stream_archive()
+produces it chunk by chunk, one collection at a time, so the download
+never holds the whole document (or its compressed form) in memory.
+
+read_sections() is the other direction: it parses an upload (gzip or
+plain JSON) from a file-like stream and yields one top-level section at
+a time, so restore only ever holds one section plus a read buffer.
+validate_section() checks a section before it is allowed to replace
+live data.
+"""
+
+import codecs
+import json
+import zlib
+from datetime import datetime
+
+CHUNK_SIZE = 64 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def stream_archive(load_collection, collections, compress=True, chunk_size=CHUNK_SIZE):
+    """
+    Yield the backup document as bytes chunks. load_collection(name) is
+    called for each collection just before it is written out.
+    """
+    encoder = json.JSONEncoder(indent=2)
+    # wbits=31 -> gzip container, so the download opens with gunzip / any archive tool
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending = []
+    pending_size = 0
+
+    def pieces():
+        yield '{'
+        for collection in collections:
+            yield f'\n  {json.dumps(collection)}: '
+            # Indent nested lines to match json.dumps(backup, indent=2)
+            for piece in encoder.iterencode(load_collection(collection)):
+                yield piece.replace('\n', '\n  ')
+            yield ','
+        yield f'\n  "timestamp": {json.dumps(datetime.now().isoformat())}\n}}'
+
+    for piece in pieces():
+        data = piece.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            pending.append(data)
+            pending_size += len(data)
+        if pending_size >= chunk_size:
+            yield b''.join(pending)
+            pending = []
+            pending_size = 0
+
+    if compressor is not None:
+        pending.append(compressor.flush())
+    tail = b''.join(pending)
+    if tail:
+        yield tail
+
+
+def _text_chunks(stream, chunk_size):
+    """Decoded text from a binary stream, transparently gunzipping it"""
+    first = stream.read(chunk_size)
+    while 0 < len(first) < len(GZIP_MAGIC):
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        first += chunk
+    decompressor = zlib.decompressobj(47) if first[:2] == GZIP_MAGIC else None  # 47 = auto-detect gzip/zlib
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunk = first
+    while chunk:
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        yield text_decoder.decode(chunk)
+        chunk = stream.read(chunk_size)
+    if decompressor is not None:
+        yield text_decoder.decode(decompressor.flush())
+    yield text_decoder.decode(b'', final=True)
+
+
+def read_sections(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield (key, value) for each top-level entry of a JSON object read
+    incrementally from stream. Raises ValueError on malformed input.
+    """
+    chunks = _text_chunks(stream, chunk_size)
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def more():
+        nonlocal buffer, pos, eof
+        for text in chunks:
+            if text:
+                buffer = buffer[pos:] + text
+                pos = 0
+                return True
+        eof = True
+        return False
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buffer) or not more():
+                return
+
+    def expect(char):
+        nonlocal pos
+        skip_whitespace()
+        if pos >= len(buffer) or buffer[pos] != char:
+            found = buffer[pos] if pos < len(buffer) else 'end of input'
+            raise ValueError(f"Invalid backup: expected '{char}', found {found!r}")
+        pos += 1
+
+    def decode_value():
+        # A value is only decoded once the buffer holds all of it; the
+        # buffer at least doubles between failed attempts so re-parsing stays linear
+        nonlocal pos
+        skip_whitespace()
+        attempt_size = 0
+        while True:
+            available = len(buffer) - pos
+            if eof or available >= 2 * attempt_size:
+                attempt_size = available
+                try:
+                    value, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError as e:
+                    if eof:
+                        raise ValueError(f'Invalid backup: {e.msg}')
+                else:
+                    # A number ending right at the end of the buffer may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                    attempt_size = 0
+            more()
+
+    expect('{')
+    skip_whitespace()
+    if pos < len(buffer) and buffer[pos] == '}':
+        return
+    while True:
+        key = decode_value()
+        if not isinstance(key, str):
+            raise ValueError('Invalid backup: keys must be strings')
+        expect(':')
+        yield key, decode_value()
+        skip_whitespace()
+        if pos < len(buffer) and buffer[pos] == ',':
+            pos += 1
+            continue
+        expect('}')
+        return
+
+
+def validate_section(name, data, shift_ids):
+    """Raise ValueError if a backup section isn't shaped like the live collection"""
+    if not isinstance(data, dict):
+        raise ValueError(f'{name}: expected an object')
+
+    if name == 'preferences':
+        for username, prefs in data.items():
+            if not isinstance(prefs, dict):
+                raise ValueError(f'preferences.{username}: expected an object')
+            for key in ('top_12', 'bottom_6'):
+                if not isinstance(prefs.get(key, []), list):
+                    raise ValueError(f'preferences.{username}.{key}: expected a list')
+                if any(shift_id not in shift_ids for shift_id in prefs.get(key, [])):
+                    raise ValueError(f'preferences.{username}.{key}: unknown shift id')
+            if not isinstance(prefs.get('shift_type_pref', {}), dict):
+                raise ValueError(f'preferences.{username}.shift_type_pref: expected an object')
+
+    elif name == 'settings':
+        if 'deadline' in data:
+            try:
+                datetime.fromisoformat(str(data['deadline']).replace('Z', '+00:00'))
+            except ValueError:
+                raise ValueError('settings.deadline: not an ISO date/time')
+        if not isinstance(data.get('is_locked', False), bool):
+            raise ValueError('settings.is_locked: expected true or false')
+
+    elif name == 'employees':
+        for username, employee in data.items():
+            if not isinstance(employee, dict) or not isinstance(employee.get('password'), str):
+                raise ValueError(f'employees.{username}: expected an account with a password hash')
+
+    elif name == 'assignments':
+        for username, assigned in data.items():
+            if not isinstance(assigned, list) or any(shift_id not in shift_ids for shift_id in assigned):
+                raise ValueError(f'assignments.{username}: expected a list of shift ids')
@@ -0,0 +1,435 @@
+"""
+Content-addressed, deduplicated backup snapshots
+
+Each collection is stored once per distinct content, as a compact JSON
+object named by its SHA-256; a snapshot is a small manifest listing the
+object behind each collection. Saving a snapshot where only preferences
+changed writes one new object plus the manifest - employees, settings
+and assignments cost nothing.
+
+    data/backups/catalog.json
+    data/backups/objects/ab/abcdef....json
+    data/backups/snapshots/snapshot_20251201_093012_123456.json
+
+catalog.json indexes every snapshot (time, size, trigger reason, per-file
+checksums) and is rewritten whenever one is added, so listing and pruning
+read one file instead of scanning and stat()ing the directory. Objects,
+manifests and the catalog are written under the catalog lock and fsynced
+before anything refers to them, so a concurrent prune can't delete an
+object a new snapshot is about to list, nor a crash leave the catalog
+pointing at a file that never reached the disk. Retention
+is tiered (RETENTION_TIERS): everything from the last hour, then the
+newest snapshot per hour for a day, per day for 90 days, per week after.
+
+Old full-copy auto_backup_*.json files are still listed and can be
+loaded (and restored from), they are just never written or pruned.
+
+BackupWorker takes snapshots on a background thread so requests don't
+wait for them, coalescing bursts of triggers into one snapshot per interval.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# (snapshots younger than this, keep the newest one per bucket of this size);
+# a bucket of None keeps every snapshot in that tier
+RETENTION_TIERS = (
+    (timedelta(hours=1), None),
+    (timedelta(days=1), timedelta(hours=1)),
+    (timedelta(days=90), timedelta(days=1)),
+    (None, timedelta(weeks=1)),
+)
+
+# Background writer: at most one live snapshot per interval, and a bounded backlog
+BACKUP_INTERVAL = 10
+BACKUP_QUEUE_SIZE = 32
+
+SNAPSHOT_NAME = re.compile(r'^snapshot_\d{8}_\d{6}_\d{6}\.json$')
+LEGACY_NAME = re.compile(r'^auto_backup_\d{8}_\d{6}\.json$')
+
+CATALOG_VERSION = 1
+
+
+def _fsync_dir(dirpath):
+    fd = os.open(dirpath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_atomic(filepath, payload):
+    """Replace filepath with payload, durably (the file and the rename are both fsynced)"""
+    tmp = f'{filepath}.tmp{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filepath)
+    _fsync_dir(os.path.dirname(filepath))
+
+
+def encode_object(data):
+    """One collection's content as an object: (digest, payload)"""
+    payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest(), payload
+
+
+def retained(entries, now, tiers=RETENTION_TIERS):
+    """
+    Names of the catalog entries (oldest first) that the tiered policy
+    keeps at time `now`. The newest snapshot is always kept.
+    """
+    keep = set()
+    seen_buckets = set()
+    for entry in reversed(entries):
+        age = now - datetime.fromisoformat(entry['timestamp'])
+        for tier, (max_age, bucket) in enumerate(tiers):
+            if max_age is None or age < max_age:
+                break
+        if bucket is None:
+            keep.add(entry['filename'])
+            continue
+        # Buckets are aligned to the epoch, so they don't shift as time passes
+        key = (tier, int(datetime.fromisoformat(entry['timestamp']).timestamp() // bucket.total_seconds()))
+        if key not in seen_buckets:
+            seen_buckets.add(key)
+            keep.add(entry['filename'])
+    if entries:
+        keep.add(entries[-1]['filename'])
+    return keep
+
+
+class SnapshotStore:
+    def __init__(self, backup_dir):
+        self.backup_dir = backup_dir
+        self.objects_dir = os.path.join(backup_dir, 'objects')
+        self.snapshots_dir = os.path.join(backup_dir, 'snapshots')
+        self.catalog_path = os.path.join(backup_dir, 'catalog.json')
+
+    def _ensure_dirs(self):
+        # Created on first use, so constructing a store never touches the disk
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], f'{digest}.json')
+
+    def _put_object(self, digest, payload):
+        """Store an encoded object unless it's already there. Hold the catalog lock, or a prune may delete it."""
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_atomic(path, payload)
+
+    def get_object(self, digest):
+        with open(self.object_path(digest), 'rb') as f:
+            return json.loads(f.read())
+
+    def read_manifest(self, name):
+        with open(os.path.join(self.snapshots_dir, name), 'r') as f:
+            return json.load(f)
+
+    # Catalog
+
+    @contextmanager
+    def _catalog_lock(self):
+        # Every gunicorn worker has its own BackupWorker - serialize catalog updates
+        self._ensure_dirs()
+        with open(self.catalog_path + '.lock', 'w') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _read_catalog(self):
+        try:
+            with open(self.catalog_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return self._rebuild_catalog()
+
+    def _write_catalog(self, catalog):
+        _write_atomic(self.catalog_path, json.dumps(catalog, indent=1).encode('utf-8'))
+
+    def _rebuild_catalog(self):
+        """One-time scan of manifests and legacy files, for stores created before the catalog existed"""
+        self._ensure_dirs()
+        snapshots = []
+        for name in sorted(n for n in os.listdir(self.snapshots_dir) if SNAPSHOT_NAME.match(n)):
+            manifest = self.read_manifest(name)
+            snapshots.append(self._catalog_entry(name, manifest))
+        legacy = []
+        for name in sorted(n for n in os.listdir(self.backup_dir) if LEGACY_NAME.match(n)):
+            stat = os.stat(os.path.join(self.backup_dir, name))
+            legacy.append({
+                'filename': name,
+                'timestamp': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                'size': stat.st_size,
+                'reason': 'legacy'
+            })
+        catalog = {'version': CATALOG_VERSION, 'snapshots': snapshots, 'legacy': legacy}
+        self._write_catalog(catalog)
+        return catalog
+
+    @staticmethod
+    def _catalog_entry(name, manifest):
+        return {
+            'filename': name,
+            'timestamp': manifest['timestamp'],
+            'size': sum(entry['size'] for entry in manifest['files'].values()),
+            'reason': manifest.get('reason', 'unknown'),
+            'changed': manifest.get('changed', []),
+            'files': {collection: entry['sha256'] for collection, entry in manifest['files'].items()}
+        }
+
+    def create(self, collections, reason='manual'):
+        """
+        Snapshot {collection: data}. Returns (name, created) - when nothing
+        changed since the latest snapshot, that snapshot's name and False.
+        """
+        # Encoding and hashing need no lock; writing the objects does
+        encoded = {collection: encode_object(data) for collection, data in collections.items()}
+        files = {collection: {'sha256': digest, 'size': len(payload)}
+                 for collection, (digest, payload) in encoded.items()}
+        checksums = {collection: entry['sha256'] for collection, entry in files.items()}
+
+        with self._catalog_lock():
+            catalog = self._read_catalog()
+            snapshots = catalog['snapshots']
+            latest = snapshots[-1] if snapshots else None
+            if latest is not None and latest['files'] == checksums:
+                return latest['filename'], False
+
+            for digest, payload in encoded.values():
+                self._put_object(digest, payload)
+
+            now = datetime.now()
+            name = f"snapshot_{now.strftime('%Y%m%d_%H%M%S_%f')}.json"
+            manifest = {
+                'timestamp': now.isoformat(),
+                'reason': reason,
+                'files': files,
+                # Collections whose content differs from the previous snapshot
+                'changed': sorted(c for c in files if latest is None or latest['files'].get(c) != checksums[c])
+            }
+            _write_atomic(os.path.join(self.snapshots_dir, name), json.dumps(manifest, indent=2).encode('utf-8'))
+            snapshots.append(self._catalog_entry(name, manifest))
+
+            dropped = self._prune(catalog, now)
+            self._write_catalog(catalog)
+            self._remove(dropped)
+        return name, True
+
+    def _prune(self, catalog, now):
+        """
+        Apply the retention tiers to catalog (in place); returns the files
+        that fell out, to _remove() once the catalog no longer lists them.
+        """
+        snapshots = catalog['snapshots']
+        keep = retained(snapshots, now)
+        dropped = [entry for entry in snapshots if entry['filename'] not in keep]
+        if not dropped:
+            return []
+        catalog['snapshots'] = [entry for entry in snapshots if entry['filename'] in keep]
+
+        # Objects only the dropped snapshots used
+        still_used = {digest for entry in catalog['snapshots'] for digest in entry['files'].values()}
+        orphaned = {digest for entry in dropped for digest in entry['files'].values()} - still_used
+        return ([os.path.join(self.snapshots_dir, entry['filename']) for entry in dropped] +
+                [self.object_path(digest) for digest in sorted(orphaned)])
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def prune(self, now=None):
+        """Apply the retention tiers now; returns how many snapshots were dropped"""
+        with self._catalog_lock():
+            catalog = self._read_catalog()
+            before = len(catalog['snapshots'])
+            dropped = self._prune(catalog, now or datetime.now())
+            if dropped:
+                self._write_catalog(catalog)
+                self._remove(dropped)
+        return before - len(catalog['snapshots'])
+
+    def list(self, limit=None):
+        """Catalog entries for snapshots (then legacy full backups), newest first"""
+        catalog = self._read_catalog()
+        backups = list(reversed(catalog['snapshots'])) + [
+            dict(entry, legacy=True) for entry in reversed(catalog.get('legacy', []))]
+        for entry in backups:
+            entry['created'] = entry['timestamp']
+        return backups if limit is None else backups[:limit]
+
+    def count(self):
+        catalog = self._read_catalog()
+        return len(catalog['snapshots']) + len(catalog.get('legacy', []))
+
+    def load(self, name):
+        """
+        Full backup contents for a snapshot or legacy file name, in the
+        /api/backup format ({employees, preferences, settings, assignments, timestamp}).
+        Raises KeyError for unknown names.
+        """
+        if SNAPSHOT_NAME.match(name) and os.path.exists(os.path.join(self.snapshots_dir, name)):
+            manifest = self.read_manifest(name)
+            backup = {collection: self.get_object(entry['sha256'])
+                      for collection, entry in manifest['files'].items()}
+            backup['timestamp'] = manifest['timestamp']
+            return backup
+        if LEGACY_NAME.match(name) and os.path.exists(os.path.join(self.backup_dir, name)):
+            with open(os.path.join(self.backup_dir, name), 'r') as f:
+                return json.load(f)
+        raise KeyError(name)
+
+
+class BackupWorker:
+    """
+    Background snapshot writer.
+
+    trigger() queues either a live snapshot (state=None - whatever the data
+    looks like when the worker gets to it) or an already captured state
+    (taken before a change, so it must be written as-is). Live triggers
+    that arrive while one is still waiting are merged into it, and the
+    worker leaves `interval` seconds between runs, so a submission rush
+    becomes one snapshot per interval. trigger() returns False when the
+    queue is full; the caller should then snapshot synchronously.
+    snapshot_fn(state, reason) writes one snapshot and returns its name.
+    """
+
+    def __init__(self, snapshot_fn, capture_fn, interval=BACKUP_INTERVAL, maxsize=BACKUP_QUEUE_SIZE):
+        self.snapshot_fn = snapshot_fn
+        self.capture_fn = capture_fn
+        self.interval = interval
+        self.maxsize = maxsize
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._items = deque()
+        # Reasons of the live triggers merged into the one waiting in the queue
+        self._live_reasons = None
+        self._busy = False
+        self._flushing = False
+        self._last_run = 0.0
+        self._thread = None
+        self._pid = None
+        self.stats = {
+            'triggers': 0,
+            'coalesced': 0,
+            'overflows': 0,
+            'snapshots_written': 0,
+            'last_success': None,
+            'last_snapshot': None,
+            'last_error': None
+        }
+
+    def _ensure_thread(self):
+        # Threads don't survive fork(); a forked worker process starts its own
+        if self._pid != os.getpid():
+            if self._pid is not None:
+                self._reset()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='backup-worker', daemon=True)
+            self._thread.start()
+
+    def trigger(self, state=None, reason='preference_submit'):
+        with self._cond:
+            self._ensure_thread()
+            self.stats['triggers'] += 1
+            if state is None and self._live_reasons is not None:
+                self._live_reasons.add(reason)
+                self.stats['coalesced'] += 1
+                return True
+            if len(self._items) >= self.maxsize:
+                self.stats['overflows'] += 1
+                return False
+            if state is None:
+                self._live_reasons = {reason}
+                self._items.append((None, self._live_reasons))
+            else:
+                self._items.append((state, reason))
+            self._cond.notify_all()
+            return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._items:
+                    self._cond.wait()
+                # Coalescing window - let more triggers pile up unless flushing
+                while not self._flushing:
+                    remaining = self._last_run + self.interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = list(self._items)
+                self._items.clear()
+                self._live_reasons = None
+                self._busy = True
+                self._last_run = time.monotonic()
+
+            # Captured states are older than the live data, so they go first
+            captured = [(state, reason) for state, reason in batch if state is not None]
+            live = [reasons for state, reasons in batch if state is None]
+            written = []
+            error = None
+            try:
+                for state, reason in captured:
+                    written.append(self.snapshot_fn(state, reason))
+                if live:
+                    written.append(self.snapshot_fn(self.capture_fn(), '+'.join(sorted(live[0]))))
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                print(f"Auto-backup failed: {e}")
+
+            with self._cond:
+                self._busy = False
+                self.stats['snapshots_written'] += len(written)
+                if written:
+                    self.stats['last_snapshot'] = written[-1]
+                if error:
+                    self.stats['last_error'] = {'error': error, 'time': datetime.now().isoformat()}
+                else:
+                    self.stats['last_success'] = datetime.now().isoformat()
+                self._cond.notify_all()
+
+    def flush(self, timeout=30):
+        """Write everything queued now (skipping the interval); True if the queue drained in time"""
+        with self._cond:
+            if self._pid != os.getpid():
+                return not self._items
+            self._flushing = True
+            self._cond.notify_all()
+            deadline = time.monotonic() + timeout
+            while self._items or self._busy:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._flushing = False
+            return not (self._items or self._busy)
+
+    def status(self):
+        with self._cond:
+            return {
+                'queue_depth': len(self._items),
+                'queue_size': self.maxsize,
+                'busy': self._busy,
+                'interval_seconds': self.interval,
+                'running': self._thread is not None and self._thread.is_alive() and self._pid == os.getpid(),
+                **self.stats
+            }
@@ -0,0 +1,233 @@
+"""
+Allocation benchmark - how fast is /api/allocate at different sizes?
+
+Generates seeded scenarios (see scenarios.py), then runs each allocation
+engine through the same steps the route takes - load the JSON files,
+allocate, summarize, save - timing every phase, then repeats the steps
+under tracemalloc for peak memory (timings never come from the traced
+run). tracemalloc only sees this process, so multiseed's peak leaves out
+its worker processes. Results are written as JSON so two versions can be
+compared:
+
+    python benchmark.py --sizes 30x20,300x60,1000x167 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+
+Sizes are EMPLOYEESxWEEKS; a season has one shift per kind per week.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from allocator import DEFAULT_SEED, greedy_allocate, multi_seed_allocate, optimal_allocate, summarize_allocation
+from scenarios import generate_scenario, HOLIDAY_WEEKS
+from shifts import SHIFT_KINDS
+
+ENGINES = ('greedy', 'optimal', 'multiseed')
+DEFAULT_SIZES = '30x20,300x60,1000x167'
+# 2: timings come from an untraced run (version 1 timed under tracemalloc)
+RESULTS_VERSION = 2
+
+
+def parse_sizes(text):
+    """'30x20,300x60' -> [(30, 20), (300, 60)]"""
+    sizes = []
+    for part in text.split(','):
+        employees, weeks = part.lower().split('x')
+        sizes.append((int(employees), int(weeks)))
+    return sizes
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_engine(engine, shift_index, employee_list, preferences, seed, seeds):
+    """Allocate like /api/allocate does; returns (assignments, allocator phase times)"""
+    phase_times = {}
+    if engine == 'optimal':
+        assignments, _, _ = optimal_allocate(shift_index, employee_list, preferences, phase_times)
+    elif engine == 'multiseed':
+        best_run, _ = multi_seed_allocate(shift_index, employee_list, preferences, range(seed, seed + seeds))
+        assignments = best_run['assignments']
+    else:
+        assignments, _, _ = greedy_allocate(shift_index, employee_list, preferences, seed, phase_times)
+    return assignments, phase_times
+
+
+def run_steps(engine, shift_index, workdir, seed, seeds):
+    """The route's steps on the files in workdir; returns (phases, allocator phases, summary)"""
+    phases = {}
+    started = time.perf_counter()
+
+    with open(os.path.join(workdir, 'preferences.json'), 'r') as f:
+        preferences = json.load(f)
+    with open(os.path.join(workdir, 'employees.json'), 'r') as f:
+        employees_data = json.load(f)
+    employee_list = [user for user, emp in employees_data.items() if not emp.get('is_manager')]
+    lap = time.perf_counter()
+    phases['load'] = lap - started
+
+    assignments, allocator_phases = run_engine(engine, shift_index, employee_list, preferences, seed, seeds)
+    now = time.perf_counter()
+    phases['allocate'] = now - lap
+    lap = now
+
+    summary = summarize_allocation(shift_index, assignments, preferences)
+    now = time.perf_counter()
+    phases['summarize'] = now - lap
+    lap = now
+
+    with open(os.path.join(workdir, 'assignments.json'), 'w') as f:
+        json.dump(assignments, f, indent=2)
+    phases['save'] = time.perf_counter() - lap
+    return phases, allocator_phases, summary
+
+
+def bench_case(engine, scenario, workdir, seed, seeds, memory=True):
+    """
+    Time one engine on one scenario, phase by phase. tracemalloc slows
+    allocation-heavy code down a lot, so the timed run is untraced and peak
+    memory comes from a second, traced run. tracemalloc only sees this
+    process: multiseed's worker processes are not counted.
+    """
+    with open(os.path.join(workdir, 'preferences.json'), 'w') as f:
+        json.dump(scenario['preferences'], f, indent=2)
+    with open(os.path.join(workdir, 'employees.json'), 'w') as f:
+        json.dump({emp: {'is_manager': False} for emp in scenario['employees']}, f, indent=2)
+
+    phases, allocator_phases, summary = run_steps(engine, scenario['shift_index'], workdir, seed, seeds)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run_steps(engine, scenario['shift_index'], workdir, seed, seeds)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'engine': engine,
+        'total_seconds': round(sum(phases.values()), 4),
+        'phases': {name: round(seconds, 4) for name, seconds in phases.items()},
+        'allocator_phases': {name: round(seconds, 4) for name, seconds in allocator_phases.items()},
+        'peak_memory_bytes': peak,
+        # Worker processes allocate out of tracemalloc's sight
+        'peak_memory_main_process_only': engine == 'multiseed',
+        'summary': summary
+    }
+
+
+def compare(results, previous):
+    """Print total time per (size, engine) against an earlier results file"""
+    before = {(case['size'], case['engine']): case for case in previous.get('cases', [])}
+    print(f"\nCompared with {previous.get('git_commit') or 'previous run'} ({previous.get('timestamp')})")
+    if previous.get('version') != RESULTS_VERSION:
+        print(f"Note: results format {previous.get('version')} vs {RESULTS_VERSION} - "
+              "version 1 timed everything under tracemalloc, so its times are inflated")
+    print(f"{'size':<12} {'engine':<10} {'before':>9} {'after':>9} {'change':>8}")
+    for case in results['cases']:
+        old = before.get((case['size'], case['engine']))
+        if old is None:
+            continue
+        change = (case['total_seconds'] / old['total_seconds'] - 1) * 100 if old['total_seconds'] else 0.0
+        print(f"{case['size']:<12} {case['engine']:<10} {old['total_seconds']:>8.3f}s "
+              f"{case['total_seconds']:>8.3f}s {change:>+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated EMPLOYEESxWEEKS')
+    parser.add_argument('--engines', default='greedy,optimal', help=f"comma separated, from {', '.join(ENGINES)}")
+    parser.add_argument('--kinds', default=','.join(SHIFT_KINDS), help='shift kinds per weekend')
+    parser.add_argument('--slots', type=int, default=1, help='employees per shift')
+    parser.add_argument('--skew', type=float, default=4.0, help='extra weight on holiday weekends (0 = uniform)')
+    parser.add_argument('--laggard-rate', type=float, default=0.05, help='fraction without preferences')
+    parser.add_argument('--seed', type=int, default=1, help='scenario seed')
+    parser.add_argument('--alloc-seed', type=int, default=DEFAULT_SEED, help='greedy allocator seed')
+    parser.add_argument('--seeds', type=int, default=16, help='seeds tried by the multiseed engine')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case; the fastest is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced run that measures peak memory')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    engines = args.engines.split(',')
+    for engine in engines:
+        if engine not in ENGINES:
+            parser.error(f"unknown engine '{engine}'")
+    kinds = tuple(args.kinds.split(','))
+
+    results = {
+        'version': RESULTS_VERSION,
+        'git_commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'kinds': list(kinds),
+            'slots': args.slots,
+            'skew': args.skew,
+            'hot_weeks': list(HOLIDAY_WEEKS),
+            'laggard_rate': args.laggard_rate,
+            'seed': args.seed,
+            'alloc_seed': args.alloc_seed,
+            'seeds': args.seeds,
+            'repeat': args.repeat,
+            'memory': not args.no_memory
+        },
+        'cases': []
+    }
+
+    print(f"{'size':<12} {'engine':<10} {'total':>9} {'allocate':>9} {'peak MB':>8} {'rank':>7} {'unfilled':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for num_employees, weeks in parse_sizes(args.sizes):
+            scenario = generate_scenario(num_employees, weeks, kinds=kinds, slots=args.slots, skew=args.skew,
+                                         laggard_rate=args.laggard_rate, seed=args.seed)
+            size = f'{num_employees}x{weeks}'
+            for engine in engines:
+                runs = [bench_case(engine, scenario, workdir, args.alloc_seed, args.seeds, not args.no_memory)
+                        for _ in range(args.repeat)]
+                case = min(runs, key=lambda run: run['total_seconds'])
+                case.update(size=size, employees=num_employees, weeks=weeks, shifts=len(scenario['shifts']))
+                results['cases'].append(case)
+
+                summary = case['summary']
+                peak = '-' if case['peak_memory_bytes'] is None else f"{case['peak_memory_bytes'] / 2**20:.1f}"
+                if case['peak_memory_main_process_only'] and case['peak_memory_bytes'] is not None:
+                    peak += '*'
+                print(f"{size:<12} {engine:<10} {case['total_seconds']:>8.3f}s {case['phases']['allocate']:>8.3f}s "
+                      f"{peak:>8} {summary['total_rank']:>7} "
+                      f"{summary['unfilled_employee_slots']:>8}")
+                sys.stdout.flush()
+
+    if 'multiseed' in engines and not args.no_memory:
+        print('* main process only - tracemalloc does not see the multiseed worker processes')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f))
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Live dashboard events, streamed to browsers as Server-Sent Events
+
+Writes publish small events ("a submission came in", "the deadline moved",
+"allocation finished") to an append-only log, data/events/events-<base>.jsonl,
+one JSON line each:
+
+    {"id": 4182, "event": "settings", "audience": "all", "data": {...}}
+
+An event's id is its byte position in the log as a whole - base is the
+position the file starts at - so a reconnecting browser's Last-Event-ID
+says exactly where to resume. Every gunicorn worker appends to the same
+files (under a flock) and every stream follows them by polling their size,
+so an event published by one worker reaches the browsers connected to all
+of them. Once a file passes MAX_BYTES the next event starts a new one; only
+the newest two are kept.
+"""
+
+import json
+import os
+import re
+import time
+
+from storage import FileLocks
+
+MAX_BYTES = 1024 * 1024
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+_FILE_NAME = re.compile(r'^events-(\d+)\.jsonl$')
+
+
+def format_event(event_id, event, data):
+    """One SSE message"""
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+class EventLog:
+    def __init__(self, events_dir, max_bytes=MAX_BYTES):
+        self.events_dir = events_dir
+        self.max_bytes = max_bytes
+        self.locks = FileLocks(events_dir)
+
+    def _files(self):
+        """[(base, path)] oldest first"""
+        if not os.path.isdir(self.events_dir):
+            return []
+        files = []
+        for name in os.listdir(self.events_dir):
+            match = _FILE_NAME.match(name)
+            if match:
+                files.append((int(match.group(1)), os.path.join(self.events_dir, name)))
+        return sorted(files)
+
+    def _size(self, path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def publish(self, event, data, audience='all'):
+        """Append an event for audience ('all', 'managers' or one username); returns its id"""
+        os.makedirs(self.events_dir, exist_ok=True)
+        with self.locks.hold('events'):
+            files = self._files()
+            base, path = files[-1] if files else (0, None)
+            size = self._size(path) if path else 0
+            if path is None or size >= self.max_bytes:
+                base, size = base + size, 0
+                path = os.path.join(self.events_dir, f'events-{base}.jsonl')
+                for _, old in files[:-1]:
+                    os.remove(old)
+            event_id = base + size
+            line = json.dumps({'id': event_id, 'event': event, 'audience': audience, 'data': data},
+                              separators=(',', ':')) + '\n'
+            with open(path, 'a') as f:
+                f.write(line)
+            return event_id
+
+    def end(self):
+        """The position just after the newest event"""
+        files = self._files()
+        if not files:
+            return 0
+        base, path = files[-1]
+        return base + self._size(path)
+
+    def position_after(self, event_id):
+        """Where to resume for a browser whose last event was event_id (None: from now)"""
+        try:
+            event_id = int(event_id)
+        except (TypeError, ValueError):
+            return self.end()
+        if event_id >= self.end():
+            # From a log that has since been cleared
+            return self.end()
+        for base, path in reversed(self._files()):
+            if base <= event_id:
+                with open(path, 'rb') as f:
+                    f.seek(event_id - base)
+                    line = f.readline()
+                return event_id + len(line)
+        # Older than anything kept - replay what there is
+        files = self._files()
+        return files[0][0] if files else 0
+
+    def read(self, position):
+        """(events after position, new position)"""
+        events = []
+        for base, path in self._files():
+            size = self._size(path)
+            if base + size <= position:
+                continue
+            # Events older than the oldest file kept are gone; carry on from what's left
+            position = max(position, base)
+            with open(path, 'rb') as f:
+                f.seek(position - base)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        # Still being written - pick it up next time
+                        break
+                    events.append(json.loads(line))
+                    position = events[-1]['id'] + len(line)
+        return events, position
+
+    def follow(self, position, duration, poll_interval=POLL_INTERVAL, keepalive_interval=KEEPALIVE_INTERVAL):
+        """
+        Yield events from position on for duration seconds, and None
+        whenever keepalive_interval passes without one.
+        """
+        stop = time.monotonic() + duration
+        last_sent = time.monotonic()
+        while time.monotonic() < stop:
+            events, position = self.read(position)
+            for event in events:
+                yield event
+            if events:
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= keepalive_interval:
+                yield None
+                last_sent = time.monotonic()
+            time.sleep(poll_interval)
@@ -0,0 +1,199 @@
+"""
+Excel schedule export
+
+ExcelSchedule is an export writer (see exports.py) that builds the
+workbook in openpyxl's write-only mode: each row goes straight to the
+sheet's temp file as the export walks the season, so memory stays flat
+however many shifts and employees there are. Formats are named styles
+registered once per workbook instead of a new Font/PatternFill per cell.
+
+Sheets: "Weekend Schedule" (every shift, then an employee summary), plus
+optionally one sheet per week and one per employee.
+"""
+
+from datetime import datetime
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+
+SCHEDULE_HEADERS = ['Date', 'Day', 'Time', 'Assigned Employee', 'Preference Rank', 'Status', 'Week', 'Notes']
+SUMMARY_HEADERS = ['Employee', 'Shifts Assigned', 'Shift Details', 'Status']
+EMPLOYEE_HEADERS = ['Date', 'Day', 'Time', 'Preference Rank', 'Week']
+COLUMN_WIDTHS = [12, 12, 20, 20, 15, 15, 10, 30]
+EMPLOYEE_COLUMN_WIDTHS = [12, 12, 20, 15, 10]
+SHIFTS_PER_EMPLOYEE = 2
+
+STYLES = {
+    'schedule_title': {'font': Font(size=16, bold=True)},
+    'schedule_section': {'font': Font(size=14, bold=True)},
+    'schedule_header': {
+        'font': Font(bold=True, color='FFFFFF'),
+        'fill': PatternFill(fill_type='solid', start_color='366092', end_color='366092'),
+        'alignment': Alignment(horizontal='center', vertical='center')
+    },
+    'schedule_ok': {'fill': PatternFill(fill_type='solid', start_color='C6EFCE', end_color='C6EFCE')},
+    'schedule_problem': {'fill': PatternFill(fill_type='solid', start_color='FFC7CE', end_color='FFC7CE')},
+    'schedule_bottom6': {'font': Font(color='FF0000')},
+    'schedule_vacant': {'font': Font(color='FF0000', bold=True)}
+}
+
+# Characters Excel doesn't allow in sheet names
+_SHEET_NAME_TABLE = str.maketrans({char: ' ' for char in '[]:*?/\\'})
+
+
+def season_title(shift_index):
+    """'Weekend Trunk Shift Schedule - Dec 2025 - Apr 2026' from the first and last shift"""
+    dates = [datetime.strptime(shift['date'], '%Y-%m-%d') for shift in (shift_index.shifts[0], shift_index.shifts[-1])]
+    return f"Weekend Trunk Shift Schedule - {dates[0]:%b %Y} - {dates[1]:%b %Y}"
+
+
+def _cell(ws, value, style=None):
+    cell = WriteOnlyCell(ws, value=value)
+    if style is not None:
+        cell.style = style
+    return cell
+
+
+def _header_row(ws, headers):
+    return [_cell(ws, header, 'schedule_header') for header in headers]
+
+
+def _sheet_title(name, used):
+    """A unique sheet name of at most 31 characters"""
+    base = name.translate(_SHEET_NAME_TABLE).strip()[:31] or 'Sheet'
+    title = base
+    n = 2
+    while title.lower() in used:
+        suffix = f' ({n})'
+        title = base[:31 - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+class ExcelSchedule:
+    """The schedule workbook, written while the export walks the season"""
+
+    def __init__(self, filename, shift_index, rank_matrix, per_week=False, per_employee=False):
+        self.filename = filename
+        self.shift_index = shift_index
+        self.rank_matrix = rank_matrix
+        self.per_week = per_week
+        self.per_employee = per_employee
+        self.wb = Workbook(write_only=True)
+        for name, attributes in STYLES.items():
+            self.wb.add_named_style(NamedStyle(name=name, **attributes))
+        self.used_titles = set()
+        self.week_sheet = None
+        self.week = None
+
+    def _new_sheet(self, title, widths=COLUMN_WIDTHS):
+        ws = self.wb.create_sheet(_sheet_title(title, self.used_titles))
+        # Column widths must be set before the first row is written
+        for col, width in enumerate(widths):
+            ws.column_dimensions[chr(ord('A') + col)].width = width
+        return ws
+
+    def _shifts_header(self, ws, title):
+        ws.append([_cell(ws, title, 'schedule_title')])
+        ws.merged_cells.add('A1:H1')
+        ws.append([])
+        ws.append(_header_row(ws, SCHEDULE_HEADERS))
+
+    def name(self, emp):
+        return self.employees.get(emp, {}).get('name', emp)
+
+    def rank_cell(self, ws, emp, shift_id):
+        rank = self.rank_matrix.rank(emp, shift_id)
+        if rank > 0:
+            return _cell(ws, f"#{rank}")
+        if rank < 0:
+            return _cell(ws, "Bottom 6", 'schedule_bottom6')
+        return _cell(ws, "N/A")
+
+    def shift_row(self, ws, shift, assigned):
+        row = [shift['date'], shift['day'], shift['time']]
+        if len(assigned) == 1:
+            row += [self.name(assigned[0]), self.rank_cell(ws, assigned[0], shift['id'])]
+        elif assigned:
+            # Multi-slot shifts list everyone, ranks in the same order
+            ranks = [self.rank_cell(ws, emp, shift['id']).value for emp in assigned]
+            row += [', '.join(self.name(emp) for emp in assigned), ', '.join(ranks)]
+        else:
+            row += [_cell(ws, "VACANT", 'schedule_vacant'), None]
+
+        if len(assigned) >= shift.get('slots', 1):
+            row.append(_cell(ws, "FILLED", 'schedule_ok'))
+        elif assigned:
+            row.append(_cell(ws, f"PARTIAL ({len(assigned)}/{shift['slots']})", 'schedule_problem'))
+        else:
+            row.append(_cell(ws, "VACANT", 'schedule_problem'))
+        row.append(shift['week'])
+        return row
+
+    # Export writer interface
+
+    def begin(self, employees, assignments):
+        self.employees = employees
+        self.assignments = assignments
+        self.shift_rows = 0
+        self.main_sheet = self._new_sheet("Weekend Schedule")
+        self._shifts_header(self.main_sheet, season_title(self.shift_index))
+
+    def shift(self, shift, assigned, labels):
+        self.main_sheet.append(self.shift_row(self.main_sheet, shift, assigned))
+        self.shift_rows += 1
+        if self.per_week:
+            if shift['week'] != self.week:
+                # Weeks arrive in order, so only one week sheet is open at a time
+                if self.week_sheet is not None:
+                    self.week_sheet.close()
+                self.week = shift['week']
+                self.week_sheet = self._new_sheet(f"Week {self.week}")
+                self._shifts_header(self.week_sheet, f"Week {self.week}")
+            self.week_sheet.append(self.shift_row(self.week_sheet, shift, assigned))
+
+    def _summary(self, ws):
+        ws.append([])
+        ws.append([])
+        section_row = 3 + self.shift_rows + 3
+        ws.append([_cell(ws, "Employee Summary", 'schedule_section')])
+        ws.merged_cells.add(f'A{section_row}:D{section_row}')
+        ws.append(_header_row(ws, SUMMARY_HEADERS))
+        for emp, emp_data in self.employees.items():
+            if emp_data.get('is_manager'):
+                continue
+            emp_shifts = self.assignments.get(emp, [])
+            details = "; ".join(f"{shift['date']} {shift['day']} {shift['time']}"
+                                for shift in map(self.shift_index.get, emp_shifts) if shift)
+            if len(emp_shifts) == SHIFTS_PER_EMPLOYEE:
+                status = _cell(ws, "Complete", 'schedule_ok')
+            else:
+                status = _cell(ws, f"Incomplete ({len(emp_shifts)}/{SHIFTS_PER_EMPLOYEE})", 'schedule_problem')
+            ws.append([emp_data['name'], len(emp_shifts), details or "None", status])
+
+    def _employee_sheet(self, emp):
+        ws = self._new_sheet(self.name(emp), EMPLOYEE_COLUMN_WIDTHS)
+        ws.append([_cell(ws, self.name(emp), 'schedule_title')])
+        ws.append([])
+        ws.append(_header_row(ws, EMPLOYEE_HEADERS))
+        for shift_id in sorted(self.assignments.get(emp, [])):
+            shift = self.shift_index.get(shift_id)
+            if shift:
+                ws.append([shift['date'], shift['day'], shift['time'], self.rank_cell(ws, emp, shift_id), shift['week']])
+        ws.close()
+
+    def write(self, fileobj):
+        self._summary(self.main_sheet)
+        self.main_sheet.close()
+        if self.week_sheet is not None:
+            self.week_sheet.close()
+        if self.per_employee:
+            for emp, emp_data in self.employees.items():
+                if not emp_data.get('is_manager'):
+                    self._employee_sheet(emp)
+        self.wb.save(fileobj)
+
+    def files(self):
+        return [(self.filename, self.write)]
@@ -0,0 +1,280 @@
+"""
+One-pass export pipeline for the assignments
+
+run_export() inverts the assignments into shift -> employees once, then
+walks the season in chronological order and hands every writer each
+shift, who is on it, and the shift's labels (formatted once per shift,
+not once per writer or per row). Writers:
+
+    begin(employees, assignments)     before the walk
+    shift(shift, assigned, labels)    once per shift, in order
+    files()                           [(filename, write(fileobj))] after it
+
+Writers here: MailMergeCsv (one row per assignment, for the mail merge),
+WriterSummaryCsv (one row per writer with both shifts and an email),
+Calendars (one .ics per employee); ExcelSchedule is in excel_export.py.
+write_bundle() puts every writer's files in one zip. The web exports and
+export_for_mailmerge.py both go through here.
+
+ExportCache keeps the finished files on disk, keyed by a hash of the data
+they were built from plus what was asked for, so repeat downloads (and
+304s for the same ETag) skip the rebuild.
+"""
+
+import csv
+import io
+import os
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timezone
+
+from shifts import SHORT_TIMES
+from storage import load_json, record_etag, save_json
+
+CALENDAR_TZID = 'America/New_York'
+
+
+def shift_labels(shift):
+    """Every formatted form of a shift the writers use"""
+    date = datetime.strptime(shift['date'], '%Y-%m-%d')
+    start_text, end_text = shift['time'].split(' - ')
+    start = datetime.combine(date, datetime.strptime(start_text, '%I:%M %p').time())
+    end = datetime.combine(date, datetime.strptime(end_text, '%I:%M %p').time())
+    return {
+        # "Saturday, Dec. 13, 11-7 ET"
+        'mailmerge': f"{shift['day']}, {date:%b}. {date.day}, {SHORT_TIMES.get(shift['kind'], shift['time'])} ET",
+        # "Saturday, December 13, 2025 - 11:00 AM - 7:00 PM"
+        'long': f"{date:%A, %B %d, %Y} - {shift['time']}",
+        'start': start,
+        'end': end
+    }
+
+
+def run_export(shift_index, assignments, employees, writers):
+    """Feed every writer the whole season in one walk; returns the writers"""
+    assignees = shift_index.assignees(assignments)
+    for writer in writers:
+        writer.begin(employees, assignments)
+    for shift in shift_index:
+        labels = shift_labels(shift)
+        assigned = assignees[shift['id']]
+        for writer in writers:
+            writer.shift(shift, assigned, labels)
+    return writers
+
+
+def write_bundle(fileobj, writers):
+    """Zip of every file the writers produce"""
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for writer in writers:
+            for filename, write in writer.files():
+                with bundle.open(filename, 'w') as f:
+                    write(f)
+
+
+def _write_csv(fileobj, rows):
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+    csv.writer(text).writerows(rows)
+    # Detach so closing the wrapper doesn't close the caller's file
+    text.flush()
+    text.detach()
+
+
+class MailMergeCsv:
+    """Writer Name, Shift - one row per assignment, in shift order"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows = [['Writer Name', 'Shift']]
+
+    def begin(self, employees, assignments):
+        self.employees = employees
+
+    def shift(self, shift, assigned, labels):
+        for username in assigned:
+            self.rows.append([self.employees.get(username, {}).get('name', username), labels['mailmerge']])
+
+    def files(self):
+        return [(self.filename, lambda f: _write_csv(f, self.rows))]
+
+
+class WriterSummaryCsv:
+    """
+    Name, Email, Shift1, Shift2, TotalShifts - one row per writer, sorted by
+    name. contacts ({username: {'name', 'email'}}) limits the rows to those
+    writers and supplies their emails; without it every non-manager
+    employee is included with a blank email. Usernames left out are in .skipped.
+    """
+
+    FIELDS = ['Name', 'Email', 'Shift1', 'Shift2', 'TotalShifts']
+
+    def __init__(self, filename, contacts=None):
+        self.filename = filename
+        self.contacts = contacts
+        self.skipped = []
+
+    def begin(self, employees, assignments):
+        self.shifts = {}
+        for username in assignments:
+            if username == 'admin' or employees.get(username, {}).get('is_manager'):
+                continue
+            if self.contacts is not None and username not in self.contacts:
+                self.skipped.append(username)
+                continue
+            self.shifts[username] = []
+        if self.contacts is None:
+            self.contacts = {username: {'name': employee.get('name', username), 'email': ''}
+                             for username, employee in employees.items()}
+
+    def shift(self, shift, assigned, labels):
+        # The walk is chronological, so each writer's shifts arrive sorted by date
+        for username in assigned:
+            if username in self.shifts:
+                self.shifts[username].append(labels['long'])
+
+    def rows(self):
+        rows = []
+        for username, labels in self.shifts.items():
+            contact = self.contacts.get(username, {'name': username, 'email': ''})
+            rows.append({
+                'Name': contact['name'],
+                'Email': contact['email'],
+                'Shift1': labels[0] if len(labels) >= 1 else "No shift assigned",
+                'Shift2': labels[1] if len(labels) >= 2 else "No second shift assigned",
+                'TotalShifts': len(labels)
+            })
+        rows.sort(key=lambda row: row['Name'])
+        return rows
+
+    def write(self, fileobj):
+        text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+        writer = csv.DictWriter(text, fieldnames=self.FIELDS)
+        writer.writeheader()
+        writer.writerows(self.rows())
+        text.flush()
+        text.detach()
+
+    def files(self):
+        return [(self.filename, self.write)]
+
+
+def _ics_text(value):
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+class Calendars:
+    """One iCalendar file per employee with a shift: <directory>/<username>.ics"""
+
+    def __init__(self, directory='calendars', usernames=None):
+        self.directory = directory
+        self.usernames = usernames
+        self.events = {}
+        self.stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    def begin(self, employees, assignments):
+        self.employees = employees
+
+    def shift(self, shift, assigned, labels):
+        for username in assigned:
+            if self.usernames is None or username in self.usernames:
+                self.events.setdefault(username, []).append((shift, labels))
+
+    def calendar(self, username):
+        """The .ics text for one employee"""
+        name = self.employees.get(username, {}).get('name', username)
+        lines = [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//Weekend Trunk Shifts//EN',
+            'CALSCALE:GREGORIAN',
+            f'X-WR-CALNAME:{_ics_text(f"Trunk shifts - {name}")}'
+        ]
+        for shift, labels in self.events.get(username, []):
+            lines += [
+                'BEGIN:VEVENT',
+                f"UID:shift-{shift['id']}-{username}@weekend-trunk",
+                f'DTSTAMP:{self.stamp}',
+                f"DTSTART;TZID={CALENDAR_TZID}:{labels['start']:%Y%m%dT%H%M%S}",
+                f"DTEND;TZID={CALENDAR_TZID}:{labels['end']:%Y%m%dT%H%M%S}",
+                f"SUMMARY:{_ics_text('Weekend trunk shift')}",
+                f"DESCRIPTION:{_ics_text(labels['mailmerge'])}",
+                'END:VEVENT'
+            ]
+        lines.append('END:VCALENDAR')
+        return '\r\n'.join(lines) + '\r\n'
+
+    def files(self):
+        # Calendars asked for by name are written even with no shifts in them
+        usernames = self.events if self.usernames is None else sorted(self.usernames)
+        return [(f'{self.directory}/{username}.ics',
+                 lambda f, username=username: f.write(self.calendar(username).encode('utf-8')))
+                for username in usernames]
+
+
+class ExportCache:
+    """
+    Export files in cache_dir as <version>-<variant> plus a .json with the
+    name to download them as. version is the hash of the input data: files from
+    any other version are stale and are dropped when a new one is stored.
+    """
+
+    # Leftover temp files younger than this may still be being written by another worker
+    TEMP_TTL = 600
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def key(self, version, variant):
+        """The artifact's name (and ETag) for these inputs and this request"""
+        return f'{version}-{record_etag(variant)}'
+
+    def _paths(self, key):
+        path = os.path.join(self.cache_dir, key)
+        return path, path + '.json'
+
+    def get(self, key):
+        """(path, {'download_name', 'created'}) of a cached file, or None"""
+        path, meta_path = self._paths(key)
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            return None
+        return path, load_json(meta_path)
+
+    def put(self, key, download_name, write):
+        """Build a file with write(fileobj) and store it; returns what get() would"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._prune(keep=key.split('-')[0])
+        path, meta_path = self._paths(key)
+        # One temp file per call: concurrent misses for the same key (other
+        # threads or workers) each build their own, and the last rename wins
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix=f'.{key}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        # Written once the file is in place, so get() never finds meta without it
+        meta = {'download_name': download_name, 'created': datetime.now().isoformat()}
+        save_json(meta_path, meta)
+        return path, meta
+
+    def _prune(self, keep=None):
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if keep is not None and name.startswith(keep + '-'):
+                continue
+            try:
+                if '.tmp' in name and time.time() - os.path.getmtime(path) < self.TEMP_TTL:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                # Another worker pruned it first
+                pass
+
+    def clear(self):
+        """Drop every cached file (their data just changed)"""
+        if os.path.isdir(self.cache_dir):
+            self._prune()
@@ -0,0 +1,342 @@
+"""
+Append-only change journal with checkpoints, for time-travel queries
+
+Every write to the store is appended to data/journal/journal.jsonl as one
+line with a sequence number:
+
+    {"seq": 42, "ts": "2025-12-05T17:03:12.000123", "actor": "employee3",
+     "collection": "preferences", "op": "put", "key": "employee3", "value": {...}}
+
+ops: put (one key), update (several keys), delete (one key), replace (a
+whole collection). Every CHECKPOINT_EVERY entries the full state is
+written to checkpoints/checkpoint_<seq>.json and recorded in index.json
+with its time and the journal byte offset just after it. Reconstructing
+any collection (or one key) at a time T loads the last checkpoint at or
+before T and replays at most CHECKPOINT_EVERY lines from that offset.
+
+An append holds journal.lock only to number its line and write it (one
+O_APPEND write, no index involved); the fsync happens after the lock is
+released, so concurrent writers share the disk flush instead of queueing
+behind each other's. The last seq is read back from the end of the file.
+The append that lands on a multiple of CHECKPOINT_EVERY writes the
+checkpoint afterwards, under checkpoint.lock, off the append path.
+
+JournaledStore wraps a storage backend so every route that writes
+through the store is journaled without knowing about it. Its listeners
+are called with each write too (collection, op, key, value - the same
+fields as its journal entry - plus previous), after the store has it.
+previous is what the write replaced: the old record for put / delete,
+{key: old record} for update, None for replace.
+"""
+
+import bisect
+import contextlib
+import fcntl
+import json
+import os
+import re
+from datetime import datetime
+
+from flask import has_request_context, session
+
+CHECKPOINT_EVERY = 500
+TAIL_CHUNK = 64 * 1024
+_SEQ = re.compile(rb'^\{"seq":(\d+),')
+
+
+def _now():
+    return datetime.now().isoformat(timespec='microseconds')
+
+
+def normalize_timestamp(text):
+    """ISO date/time -> the journal's fixed-width form (raises ValueError)"""
+    return datetime.fromisoformat(text.replace('Z', '+00:00')).replace(tzinfo=None).isoformat(timespec='microseconds')
+
+
+def apply_entry(state, entry):
+    """Apply one journal entry to {collection: data} in place"""
+    op = entry['op']
+    collection = entry['collection']
+    if op == 'replace':
+        state[collection] = entry['value']
+        return
+    data = state.setdefault(collection, {})
+    if op == 'put':
+        data[entry['key']] = entry['value']
+    elif op == 'update':
+        data.update(entry['value'])
+    elif op == 'delete':
+        data.pop(entry['key'], None)
+
+
+class Journal:
+    def __init__(self, journal_dir, collections):
+        self.journal_dir = journal_dir
+        self.collections = collections
+        self.journal_path = os.path.join(journal_dir, 'journal.jsonl')
+        self.index_path = os.path.join(journal_dir, 'index.json')
+        self.checkpoints_dir = os.path.join(journal_dir, 'checkpoints')
+        # (journal size, last seq) as this process last saw them
+        self._tail = (0, 0)
+
+    @contextlib.contextmanager
+    def _locked(self, name='journal'):
+        # Appends come from every gunicorn worker; one writer at a time
+        os.makedirs(self.checkpoints_dir, exist_ok=True)
+        with open(os.path.join(self.journal_dir, f'{name}.lock'), 'w') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _last_seq(self, fd, size):
+        """Seq of the journal's last line (0 when empty), reading back from size"""
+        cached_size, cached_seq = self._tail
+        if size == cached_size:
+            return cached_seq
+        # Find the start of the last line, a chunk at a time
+        end = size - 1
+        start = end
+        while start > 0:
+            chunk_start = max(0, start - TAIL_CHUNK)
+            newline = os.pread(fd, start - chunk_start, chunk_start).rfind(b'\n')
+            if newline >= 0:
+                start = chunk_start + newline + 1
+                break
+            start = chunk_start
+        match = _SEQ.match(os.pread(fd, 32, start)) if size else None
+        seq = int(match.group(1)) if match else 0
+        self._tail = (size, seq)
+        return seq
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'checkpoints': []}
+
+    def _write_index(self, index):
+        tmp = f'{self.index_path}.tmp{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index_path)
+
+    def _checkpoint_path(self, seq):
+        return os.path.join(self.checkpoints_dir, f'checkpoint_{seq:010d}.json')
+
+    def _write_checkpoint(self, index, seq, ts, state, offset):
+        path = self._checkpoint_path(seq)
+        tmp = f'{path}.tmp{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp, path)
+        index['checkpoints'].append({'seq': seq, 'ts': ts, 'offset': offset})
+        index['checkpoints'].sort(key=lambda checkpoint: checkpoint['seq'])
+
+    def start(self, load_collection):
+        """Write the baseline checkpoint (seq 0) from the live data, once"""
+        with self._locked('checkpoint'):
+            index = self._read_index()
+            if not index['checkpoints']:
+                state = {collection: load_collection(collection) for collection in self.collections}
+                offset = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+                self._write_checkpoint(index, 0, _now(), state, offset)
+                self._write_index(index)
+
+    def append(self, collection, op, key=None, value=None):
+        fields = {
+            'actor': session.get('username') if has_request_context() else None,
+            'collection': collection,
+            'op': op
+        }
+        if key is not None:
+            fields['key'] = key
+        if value is not None:
+            fields['value'] = value
+        # Encoded before taking the lock; only seq and ts are filled in under it
+        body = json.dumps(fields, separators=(',', ':'))[1:]
+
+        os.makedirs(self.checkpoints_dir, exist_ok=True)
+        fd = os.open(self.journal_path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            with self._locked():
+                size = os.fstat(fd).st_size
+                seq = self._last_seq(fd, size) + 1
+                ts = _now()
+                line = f'{{"seq":{seq},"ts":"{ts}",{body}\n'.encode('utf-8')
+                os.write(fd, line)
+                self._tail = (size + len(line), seq)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        if seq % CHECKPOINT_EVERY == 0:
+            self._checkpoint(seq, ts, size + len(line))
+        return seq
+
+    def _checkpoint(self, seq, ts, offset):
+        with self._locked('checkpoint'):
+            index = self._read_index()
+            earlier = [checkpoint for checkpoint in index['checkpoints'] if checkpoint['seq'] < seq]
+            if not earlier:
+                return
+            # Built from the journal itself, so it can't include writes it hasn't seen
+            state, _ = self._replay(earlier[-1], stop_seq=seq)
+            self._write_checkpoint(index, seq, ts, state, offset)
+            self._write_index(index)
+
+    def _replay(self, checkpoint, stop_seq=None, stop_ts=None):
+        """State at a checkpoint plus journal entries up to stop_seq / stop_ts; returns (state, last seq)"""
+        with open(self._checkpoint_path(checkpoint['seq']), 'r') as f:
+            state = json.load(f)
+        seq = checkpoint['seq']
+        if not os.path.exists(self.journal_path):
+            return state, seq
+        with open(self.journal_path, 'rb') as f:
+            f.seek(checkpoint['offset'])
+            for line in f:
+                entry = json.loads(line)
+                if stop_seq is not None and entry['seq'] > stop_seq:
+                    break
+                if stop_ts is not None and entry['ts'] > stop_ts:
+                    break
+                apply_entry(state, entry)
+                seq = entry['seq']
+        return state, seq
+
+    def entries_since(self, seq):
+        """
+        Journal entries after seq, oldest first - read from the checkpoint
+        before it, so at most CHECKPOINT_EVERY lines are skipped. None when
+        the journal doesn't reach back to seq.
+        """
+        checkpoints = self._read_index()['checkpoints']
+        i = bisect.bisect_right([checkpoint['seq'] for checkpoint in checkpoints], seq)
+        if i == 0:
+            return None
+        entries = []
+        if not os.path.exists(self.journal_path):
+            return entries
+        with open(self.journal_path, 'rb') as f:
+            f.seek(checkpoints[i - 1]['offset'])
+            for line in f:
+                entry = json.loads(line)
+                if entry['seq'] > seq:
+                    entries.append(entry)
+        return entries
+
+    def state_at(self, ts):
+        """
+        ({collection: data} as of time ts, last applied seq), or (None, None)
+        when ts is before the journal started.
+        """
+        ts = normalize_timestamp(ts)
+        checkpoints = self._read_index()['checkpoints']
+        i = bisect.bisect_right([checkpoint['ts'] for checkpoint in checkpoints], ts)
+        if i == 0:
+            return None, None
+        return self._replay(checkpoints[i - 1], stop_ts=ts)
+
+    def last_seq(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, 'rb') as f:
+            return self._last_seq(f.fileno(), os.fstat(f.fileno()).st_size)
+
+    def status(self):
+        index = self._read_index()
+        return {
+            'last_seq': self.last_seq(),
+            'checkpoints': len(index['checkpoints']),
+            'started': index['checkpoints'][0]['ts'] if index['checkpoints'] else None,
+            'size': os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        }
+
+
+class JournaledStore:
+    """A storage backend whose writes are also appended to a Journal"""
+
+    def __init__(self, store, journal):
+        self.store = store
+        self.journal = journal
+        self.listeners = []
+
+    def __getattr__(self, name):
+        # Reads (load, get, exists, backend, ...) go straight to the store
+        return getattr(self.store, name)
+
+    # Each write and its journal entry happen under the lock of what it
+    # touches - the collection, or just the records for backends that can
+    # lock them - so the journal order matches the order writes hit the store
+
+    def _record(self, collection, op, key=None, value=None, previous=None):
+        self.journal.append(collection, op, key, value)
+        for listener in self.listeners:
+            listener(collection, op, key, value, previous)
+
+    def _previous(self, collection, keys):
+        """{key: current record} - call with the records' lock held"""
+        if len(keys) == 1:
+            return {key: self.store.get(collection, key) for key in keys}
+        data = self.store.load(collection)
+        return {key: data.get(key) for key in keys}
+
+    def save(self, collection, data):
+        with self.store.locked(collection):
+            self.store.save(collection, data)
+            self._record(collection, 'replace', value=data)
+
+    def save_many(self, collections):
+        with contextlib.ExitStack() as stack:
+            for collection in sorted(collections):
+                stack.enter_context(self.store.locked(collection))
+            self.store.save_many(collections)
+            for collection, data in collections.items():
+                self._record(collection, 'replace', value=data)
+
+    def put(self, collection, key, value):
+        with self.store.locked_records(collection, [key]):
+            previous = self.store.get(collection, key)
+            self.store.put(collection, key, value)
+            self._record(collection, 'put', key, value, previous)
+
+    def update(self, collection, items):
+        with self.store.locked_records(collection, items):
+            previous = self._previous(collection, list(items))
+            self.store.update(collection, items)
+            self._record(collection, 'update', value=items, previous=previous)
+
+    def delete(self, collection, key):
+        with self.store.locked_records(collection, [key]):
+            previous = self.store.get(collection, key)
+            deleted = self.store.delete(collection, key)
+            if deleted:
+                self._record(collection, 'delete', key, previous=previous)
+            return deleted
+
+    def put_if(self, collection, key, value, expected):
+        with self.store.locked_records(collection, [key]):
+            previous = self.store.get(collection, key)
+            written, etag = self.store.put_if(collection, key, value, expected)
+            if written:
+                self._record(collection, 'put', key, value, previous)
+            return written, etag
+
+    def delete_if(self, collection, key, expected):
+        with self.store.locked_records(collection, [key]):
+            previous = self.store.get(collection, key)
+            deleted, etag = self.store.delete_if(collection, key, expected)
+            if deleted:
+                self._record(collection, 'delete', key, previous=previous)
+            return deleted, etag
+
+    def update_if(self, collection, items, expected):
+        # The precondition covers the whole collection
+        with self.store.locked(collection):
+            previous = self._previous(collection, list(items))
+            written, etag = self.store.update_if(collection, items, expected)
+            if written:
+                self._record(collection, 'update', value=items, previous=previous)
+            return written, etag
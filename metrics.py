@@ -0,0 +1,225 @@
+"""
+Prometheus-style counters and latency histograms
+
+The app counts requests, storage reads and writes, backups, allocation
+phases and exports here, and /metrics serves the totals in the Prometheus
+text exposition format:
+
+    # TYPE weekend_trunk_http_request_duration_seconds histogram
+    weekend_trunk_http_request_duration_seconds_bucket{method="POST",route="/login",le="0.1"} 41
+
+Each gunicorn worker counts in memory and writes its totals to
+<metrics_dir>/worker-<pid>.json at most every FLUSH_INTERVAL seconds;
+/metrics adds up the files of the workers still running, so whichever
+worker answers the scrape reports all of them. A restarted worker starts
+from zero, which Prometheus treats as a counter reset.
+
+Label values are whatever the caller passes, so every metric keeps at
+most MAX_SERIES label combinations; anything past that is counted under
+"other" instead of growing without bound.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+PREFIX = 'weekend_trunk_'
+MAX_SERIES = 200
+FLUSH_INTERVAL = 1.0
+# Seconds; scrypt password checks land around 0.05, allocations and exports up to seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_WORKER_FILE = re.compile(r'^worker-(\d+)\.json$')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        """The series for these label values (or the overflow series once MAX_SERIES is reached)"""
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        if key not in self.series and len(self.series) >= MAX_SERIES:
+            key = ('other',) * len(self.labels)
+        return key
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {'type': self.kind, 'help': self.help, 'labels': list(self.labels),
+                    'series': [[list(key), value[:] if isinstance(value, list) else value]
+                               for key, value in self.series.items()]}
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        with self.lock:
+            key = self._key(labels)
+            self.series[key] = self.series.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, seconds, **labels):
+        with self.lock:
+            key = self._key(labels)
+            # [count per bucket (the last is +Inf)..., sum, count]
+            values = self.series.get(key)
+            if values is None:
+                values = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            values[bisect_left(self.buckets, seconds)] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        snapshot = super().snapshot()
+        snapshot['buckets'] = list(self.buckets)
+        return snapshot
+
+
+REGISTRY = []
+_last_flush = 0.0
+
+
+def _reset():
+    global _last_flush
+    for metric in REGISTRY:
+        metric.reset()
+    _last_flush = 0.0
+
+# A forked worker starts counting from zero (gunicorn --preload forks them from the master)
+os.register_at_fork(after_in_child=_reset)
+
+
+def flush(metrics_dir, force=False):
+    """Write this process's totals for /metrics (at most every FLUSH_INTERVAL unless forced)"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    os.makedirs(metrics_dir, exist_ok=True)
+    path = os.path.join(metrics_dir, f'worker-{os.getpid()}.json')
+    # Totals are rewritten whole, so losing one to a crash costs nothing - no fsync
+    tmp = f'{path}.tmp{threading.get_ident()}'
+    with open(tmp, 'w') as f:
+        json.dump({metric.name: metric.snapshot() for metric in REGISTRY}, f, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect(metrics_dir):
+    """Every running worker's totals, added up: {name: snapshot}"""
+    totals = {}
+    names = os.listdir(metrics_dir) if os.path.isdir(metrics_dir) else []
+    for name in sorted(names):
+        match = _WORKER_FILE.match(name)
+        if not match:
+            continue
+        path = os.path.join(metrics_dir, name)
+        if not _running(int(match.group(1))):
+            # A worker that has exited (or restarted) - its totals went with it
+            os.remove(path)
+            continue
+        try:
+            with open(path) as f:
+                worker = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        for metric_name, snapshot in worker.items():
+            total = totals.setdefault(metric_name, {**snapshot, 'series': {}})
+            for key, value in snapshot['series']:
+                key = tuple(key)
+                if key not in total['series']:
+                    total['series'][key] = value
+                elif snapshot['type'] == 'histogram':
+                    total['series'][key] = [a + b for a, b in zip(total['series'][key], value)]
+                else:
+                    total['series'][key] += value
+    return totals
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(totals):
+    """collect()'s totals in the Prometheus text format"""
+    lines = []
+    for name, metric in sorted(totals.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for key, value in sorted(metric['series'].items()):
+            if metric['type'] == 'counter':
+                lines.append(f"{name}{_labels(metric['labels'], key)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-2]):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(metric['labels'], key, [('le', le)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(metric['labels'], key)} {_number(float(value[-2]))}")
+            lines.append(f"{name}_count{_labels(metric['labels'], key)} {value[-1]}")
+    return '\n'.join(lines) + '\n'
+
+
+# What the app measures (see app.py and storage.py)
+HTTP_REQUESTS = Counter('http_requests_total', 'Requests handled, by route and status', ('method', 'route', 'status'))
+HTTP_SECONDS = Histogram('http_request_duration_seconds', 'Time to build each response, by route', ('method', 'route'))
+STORAGE_SECONDS = Histogram('storage_duration_seconds',
+                            'Storage reads and writes: a collection, or the directory of any other JSON file',
+                            ('operation', 'name'))
+PASSWORD_SECONDS = Histogram('password_check_duration_seconds', 'Password hash checks (login, password change)')
+BACKUP_SECONDS = Histogram('backup_duration_seconds', 'Backup snapshots: capturing the data, writing the snapshot',
+                           ('step',))
+ALLOCATION_SECONDS = Histogram('allocation_phase_duration_seconds', 'Allocation engine phases (total = the whole run)',
+                               ('engine', 'phase'))
+EXPORT_SECONDS = Histogram('export_duration_seconds', 'Building an export download (cache misses only)', ('formats',))
+EXPORT_CACHE_REQUESTS = Counter('export_cache_requests_total', 'Export downloads, served from the cache or built',
+                                ('result',))
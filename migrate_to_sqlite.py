@@ -0,0 +1,46 @@
+"""
+One-shot migration of data/*.json into the SQLite store
+
+    python migrate_to_sqlite.py            # data/ -> data/weekend_trunk.db
+    python migrate_to_sqlite.py --force    # overwrite collections already in the database
+
+Then start the app with STORAGE_BACKEND=sqlite. The JSON files are left in
+place, so switching back only needs the environment variable removed.
+"""
+
+import argparse
+import os
+import sys
+
+from storage import COLLECTIONS, SQLITE_FILENAME, JsonStore, SqliteStore, migrate
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Copy data/*.json into a SQLite database')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--db', help=f'database file (default: <data-dir>/{SQLITE_FILENAME})')
+    parser.add_argument('--force', action='store_true', help='replace collections already in the database')
+    args = parser.parse_args(argv)
+
+    source = JsonStore(args.data_dir)
+    target = SqliteStore(args.db or os.path.join(args.data_dir, SQLITE_FILENAME))
+
+    already = [collection for collection in COLLECTIONS if target.exists(collection)]
+    if already and not args.force:
+        print(f"✗ {target.db_path} already has: {', '.join(already)} (use --force to overwrite)")
+        return 1
+
+    copied = migrate(source, target)
+    for collection in COLLECTIONS:
+        if collection in copied:
+            print(f"✓ {collection:<12} {copied[collection]} rows")
+        else:
+            print(f"- {collection:<12} no {collection}.json, skipped")
+    print(f"\nMigrated into {target.db_path} - start the app with STORAGE_BACKEND=sqlite")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Small pure-Python min-cost flow solver
+
+Primal-dual successive shortest paths: each phase runs Dijkstra on reduced
+costs (Johnson potentials), then pushes a blocking flow along every
+zero-reduced-cost path before the next Dijkstra. Costs must be
+non-negative integers. Good for the sparse, small-cost graphs the
+allocator builds; no external dependencies.
+"""
+
+import heapq
+
+INF = float('inf')
+
+
+class MinCostFlow:
+    def __init__(self, num_nodes=0):
+        self.n = num_nodes
+        self.graph = [[] for _ in range(num_nodes)]
+        # Edges are stored as parallel arrays; edge e and e ^ 1 are a residual pair
+        self.to = []
+        self.cap = []
+        self.cost = []
+        self.potential = []
+
+    def add_node(self):
+        self.graph.append([])
+        self.n += 1
+        return self.n - 1
+
+    def add_edge(self, u, v, cap, cost):
+        """Add a directed edge and return its id (use flow_on() to read it back)"""
+        edge_id = len(self.to)
+        self.graph[u].append(edge_id)
+        self.to.append(v)
+        self.cap.append(cap)
+        self.cost.append(cost)
+        self.graph[v].append(edge_id + 1)
+        self.to.append(u)
+        self.cap.append(0)
+        self.cost.append(-cost)
+        return edge_id
+
+    def flow_on(self, edge_id):
+        return self.cap[edge_id ^ 1]
+
+    def _dijkstra(self, s, t):
+        """Shortest reduced-cost distances from s; updates potentials. Returns dist to t."""
+        n, to, cap, cost, graph, h = self.n, self.to, self.cap, self.cost, self.graph, self.potential
+        dist = [INF] * n
+        dist[s] = 0
+        heap = [(0, s)]
+        done = [False] * n
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if done[u]:
+                continue
+            done[u] = True
+            if u == t:
+                break
+            hu = h[u]
+            for e in graph[u]:
+                if cap[e] <= 0:
+                    continue
+                v = to[e]
+                nd = d + cost[e] + hu - h[v]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+
+        dt = dist[t]
+        if dt == INF:
+            return INF
+
+        # Nodes not settled before t keep a valid bound of dist[t]
+        for v in range(n):
+            h[v] += dist[v] if done[v] else dt
+        return dt
+
+    def _blocking_flow(self, s, t, limit):
+        """Push flow along zero-reduced-cost edges (DFS with current-arc pointers)"""
+        to, cap, cost, graph, h = self.to, self.cap, self.cost, self.graph, self.potential
+        it = [0] * self.n
+        pushed_total = 0
+
+        while pushed_total < limit:
+            # Iterative DFS for one augmenting path
+            path = []
+            stack = [s]
+            on_path = {s}
+            found = False
+            while stack:
+                u = stack[-1]
+                if u == t:
+                    found = True
+                    break
+                edges = graph[u]
+                advanced = False
+                while it[u] < len(edges):
+                    e = edges[it[u]]
+                    v = to[e]
+                    if cap[e] > 0 and v not in on_path and cost[e] + h[u] - h[v] == 0:
+                        path.append(e)
+                        stack.append(v)
+                        on_path.add(v)
+                        advanced = True
+                        break
+                    it[u] += 1
+                if not advanced:
+                    # Dead end - retreat and skip the edge that led here
+                    stack.pop()
+                    on_path.discard(u)
+                    if path:
+                        path.pop()
+                        it[stack[-1]] += 1
+            if not found:
+                break
+
+            push = limit - pushed_total
+            for e in path:
+                if cap[e] < push:
+                    push = cap[e]
+            for e in path:
+                cap[e] -= push
+                cap[e ^ 1] += push
+            pushed_total += push
+
+        return pushed_total
+
+    def solve(self, s, t, max_flow=INF):
+        """Send up to max_flow units from s to t at minimum cost. Returns (flow, cost)."""
+        self.potential = [0] * self.n
+        flow = 0
+        total_cost = 0
+
+        while flow < max_flow:
+            if self._dijkstra(s, t) == INF:
+                break
+            path_cost = self.potential[t] - self.potential[s]
+            pushed = self._blocking_flow(s, t, max_flow - flow)
+            if pushed == 0:
+                break
+            flow += pushed
+            total_cost += pushed * path_cost
+
+        return flow, total_cost
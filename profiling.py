@@ -0,0 +1,147 @@
+"""
+On-demand request profiling
+
+A manager adds ?profile=1 (or an X-Profile: 1 header) to any request and
+it runs under cProfile, with a sampling thread alongside recording the
+request thread's full stack every SAMPLE_INTERVAL seconds. The result is
+kept in <profiles_dir> as
+
+    <id>.pstats          cProfile stats (python -m pstats, snakeviz, ...)
+    <id>.collapsed.txt   "outer;inner;leaf count" lines for flamegraph.pl
+                         or speedscope
+    <id>.json            what was profiled: route, status, duration, ...
+
+and only the newest KEEP profiles are kept. Requests without the flag
+never touch any of this.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import secrets
+import sys
+import threading
+import time
+from datetime import datetime
+
+SAMPLE_INTERVAL = 0.005
+KEEP = 20
+PROFILE_ID = re.compile(r'^\d{8}T\d{6}-[0-9a-f]{8}$')
+KINDS = {'pstats': '.pstats', 'collapsed': '.collapsed.txt'}
+
+
+def _frame_label(code):
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class RequestProfile:
+    """cProfile plus a stack sampler for the calling thread, between start() and stop()"""
+
+    def __init__(self, sample_interval=SAMPLE_INTERVAL):
+        self.sample_interval = sample_interval
+        self.profiler = cProfile.Profile()
+        self.stacks = {}
+        self.samples = 0
+        self._done = threading.Event()
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+        self._sampler.start()
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        self.duration = time.perf_counter() - self.started
+        self._done.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._done.wait(self.sample_interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                stack = ';'.join(reversed(labels))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in sorted(self.stacks.items()))
+
+
+class ProfileStore:
+    def __init__(self, profiles_dir, keep=KEEP):
+        self.profiles_dir = profiles_dir
+        self.keep = keep
+
+    def path(self, profile_id, kind):
+        """File of one profile (kind: 'pstats', 'collapsed' or 'meta'), or None for unknown ids"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = os.path.join(self.profiles_dir, profile_id + KINDS.get(kind, '.json'))
+        return path if os.path.exists(path) else None
+
+    def save(self, profile, meta):
+        """Store a stopped RequestProfile; returns its metadata (with 'id')"""
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        profile_id = f"{datetime.now():%Y%m%dT%H%M%S}-{secrets.token_hex(4)}"
+        base = os.path.join(self.profiles_dir, profile_id)
+        profile.profiler.dump_stats(base + KINDS['pstats'])
+        with open(base + KINDS['collapsed'], 'w') as f:
+            f.write(profile.collapsed())
+        meta = {
+            'id': profile_id,
+            'created': datetime.now().isoformat(),
+            'duration_seconds': round(profile.duration, 4),
+            'samples': profile.samples,
+            **meta
+        }
+        # Written last: a profile is listed once its files are all there
+        with open(base + '.json.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(base + '.json.tmp', base + '.json')
+        self._prune()
+        return meta
+
+    def _ids(self):
+        if not os.path.isdir(self.profiles_dir):
+            return []
+        return sorted((name[:-5] for name in os.listdir(self.profiles_dir)
+                       if name.endswith('.json') and PROFILE_ID.match(name[:-5])), reverse=True)
+
+    def _prune(self):
+        for profile_id in self._ids()[self.keep:]:
+            for suffix in (*KINDS.values(), '.json'):
+                try:
+                    os.remove(os.path.join(self.profiles_dir, profile_id + suffix))
+                except FileNotFoundError:
+                    # Another worker pruned it first
+                    pass
+
+    def list(self):
+        """Metadata of the stored profiles, newest first"""
+        profiles = []
+        for profile_id in self._ids():
+            try:
+                with open(os.path.join(self.profiles_dir, profile_id + '.json')) as f:
+                    profiles.append(json.load(f))
+            except FileNotFoundError:
+                # Pruned since the listing
+                pass
+        return profiles
+
+    def summary(self, profile_id, limit=40):
+        """The slowest functions by cumulative time, as pstats prints them"""
+        path = self.path(profile_id, 'pstats')
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(limit)
+        return out.getvalue()
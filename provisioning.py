@@ -0,0 +1,244 @@
+"""
+Bulk account provisioning
+
+Accounts are uploaded as CSV (a header row with name,username,password)
+or JSONL (one {"name", "username", "password"} object per line) and are
+parsed row by row as the upload streams in; bad rows are reported with
+their row number instead of failing the whole upload.
+
+Hashing a password is deliberately slow (scrypt, ~50 ms of CPU), so a job
+hashes the accepted rows on a background thread that spreads them over a
+process pool, then hands every account to write_fn in one batch. The
+upload request returns as soon as the job is queued. The job's progress
+is kept in <jobs_dir>/<id>.json, so whichever gunicorn worker gets the
+poll can answer it. Each job already uses every core, so only one runs at
+a time across all workers; start() refuses another while it does.
+"""
+
+import codecs
+import csv
+import json
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from storage import FileLocks, load_json, save_json
+
+FORMATS = ('csv', 'jsonl')
+CHUNK_SIZE = 64 * 1024
+PROGRESS_INTERVAL = 0.5
+JOB_TTL = timedelta(days=7)
+JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+ACTIVE_STATES = ('queued', 'hashing', 'writing')
+# A job whose status hasn't moved for this long died with its worker
+STALE_AFTER = timedelta(minutes=10)
+
+
+def guess_format(content_type=None, filename=None):
+    """'csv' or 'jsonl' from an upload's content type or file name (CSV if unsure)"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/json-lines', 'application/json'):
+        return 'jsonl'
+    if filename and os.path.splitext(filename)[1].lower() in ('.jsonl', '.ndjson', '.json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def _lines(stream, chunk_size=CHUNK_SIZE):
+    """Text lines (with their '\n') from a binary stream that only has read()"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        *lines, pending = pending.split('\n')
+        for line in lines:
+            yield line + '\n'
+        if not chunk:
+            if pending:
+                yield pending
+            return
+
+
+def _rows(stream, fmt):
+    """Yield (row number, dict or None, error or None) from a binary stream"""
+    text = _lines(stream)
+    if fmt == 'jsonl':
+        for number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield number, None, f'invalid JSON: {e.msg}'
+                continue
+            if not isinstance(record, dict):
+                yield number, None, 'expected an object'
+                continue
+            yield number, record, None
+        return
+
+    reader = csv.reader(text)
+    header = [column.strip().lower() for column in next(reader, [])]
+    missing = [field for field in ('username', 'password') if field not in header]
+    if missing:
+        yield 1, None, f"header is missing {', '.join(missing)}"
+        return
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        yield reader.line_num, dict(zip(header, row)), None
+
+
+def read_accounts(stream, fmt='csv', taken=()):
+    """
+    Parse an upload into ([(row, name, username, password)], [{'row', 'error'}]).
+    Usernames in taken, or repeated in the upload, are rejected.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}' (use {' or '.join(FORMATS)})")
+    accounts = []
+    errors = []
+    seen = set()
+    try:
+        for number, record, error in _rows(stream, fmt):
+            if error is None:
+                username = str(record.get('username') or '').strip()
+                password = record.get('password')
+                name = str(record.get('name') or '').strip() or username
+                if not username:
+                    error = 'missing username'
+                elif not isinstance(password, str) or not password:
+                    error = 'missing password'
+                elif username in seen:
+                    error = f"username '{username}' appears more than once"
+                elif username in taken:
+                    error = f"username '{username}' already exists"
+            if error is not None:
+                errors.append({'row': number, 'error': error})
+                continue
+            seen.add(username)
+            accounts.append((number, name, username, password))
+    except (UnicodeDecodeError, csv.Error) as e:
+        errors.append({'row': None, 'error': f'unreadable upload: {e}'})
+    return accounts, errors
+
+
+class ProvisioningBusy(Exception):
+    """Another provisioning job is still running (its status is .job)"""
+
+    def __init__(self, job):
+        super().__init__(f"Provisioning job {job['id']} is still {job['state']}")
+        self.job = job
+
+
+class ProvisioningJobs:
+    def __init__(self, jobs_dir, workers=None):
+        self.jobs_dir = jobs_dir
+        self.workers = workers or int(os.environ.get('PROVISION_WORKERS', 0)) or os.cpu_count() or 1
+        self.locks = FileLocks(jobs_dir)
+
+    def path(self, job_id):
+        return os.path.join(self.jobs_dir, f'{job_id}.json')
+
+    def get(self, job_id):
+        """A job's status, or None for unknown ids"""
+        if not JOB_ID.match(job_id) or not os.path.exists(self.path(job_id)):
+            return None
+        return load_json(self.path(job_id))
+
+    def _save(self, job):
+        save_json(self.path(job['id']), job)
+
+    def active(self):
+        """The status of the job still running, or None"""
+        cutoff = (datetime.now() - STALE_AFTER).timestamp()
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            if not (name.endswith('.json') and JOB_ID.match(name[:-5])) or os.path.getmtime(path) < cutoff:
+                continue
+            job = load_json(path)
+            if job['state'] in ACTIVE_STATES:
+                return job
+        return None
+
+    def _prune(self):
+        cutoff = (datetime.now() - JOB_TTL).timestamp()
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            if name.endswith('.json') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    def start(self, accounts, errors, write_fn, description=''):
+        """
+        Queue a job hashing accounts ([(row, name, username, password)]);
+        write_fn({username: account}) stores them once all are hashed and
+        returns the usernames it had to skip (taken since the upload was
+        read), which are reported as row errors. Returns the job's initial status; raises ProvisioningBusy while
+        another job is running.
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with self.locks.hold('start'):
+            self._prune()
+            running = self.active()
+            if running is not None:
+                raise ProvisioningBusy(running)
+            job = self._new_job(accounts, errors, description)
+            self._save(job)
+        threading.Thread(target=self._run, args=(job, accounts, write_fn),
+                         name=f"provision-{job['id'][:8]}", daemon=True).start()
+        return job
+
+    def _new_job(self, accounts, errors, description):
+        return {
+            'id': secrets.token_hex(16),
+            'description': description,
+            'state': 'queued',
+            'created': datetime.now().isoformat(),
+            'finished': None,
+            'total': len(accounts),
+            'hashed': 0,
+            'written': 0,
+            'workers': min(self.workers, max(len(accounts), 1)),
+            'errors': errors,
+            'error': None
+        }
+
+    def _run(self, job, accounts, write_fn):
+        job['state'] = 'hashing'
+        self._save(job)
+        try:
+            passwords = [password for _, _, _, password in accounts]
+            # spawn, not fork: this process has request threads (and maybe locks) running
+            with ProcessPoolExecutor(job['workers'], mp_context=multiprocessing.get_context('spawn')) as pool:
+                chunksize = max(1, len(passwords) // (job['workers'] * 4))
+                hashed = {}
+                last_saved = time.monotonic()
+                for (_, name, username, _), password_hash in zip(
+                        accounts, pool.map(generate_password_hash, passwords, chunksize=chunksize)):
+                    hashed[username] = {'name': name, 'is_manager': False, 'password': password_hash}
+                    job['hashed'] = len(hashed)
+                    if time.monotonic() - last_saved >= PROGRESS_INTERVAL:
+                        self._save(job)
+                        last_saved = time.monotonic()
+
+            job['state'] = 'writing'
+            self._save(job)
+            skipped = write_fn(hashed) or []
+            rows = {username: number for number, _, username, _ in accounts}
+            for username in skipped:
+                job['errors'].append({'row': rows[username], 'error': f"username '{username}' was created while the job ran"})
+            job['written'] = len(hashed) - len(skipped)
+            job['state'] = 'done'
+        except Exception as e:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+        job['finished'] = datetime.now().isoformat()
+        self._save(job)
@@ -0,0 +1,107 @@
+"""
+Employees x shifts preference rank matrix
+
+One int8 cell per (employee, shift):
+    1..N    position in the employee's top-N list (1 = first choice)
+    0       neutral - not ranked either way
+    -1..-M  position in the employee's bottom-M list (a veto)
+
+Built once from preferences.json; the allocator, /api/allocation-report,
+the Excel export and analyze_results.py all read ranks from it, and the
+satisfaction statistics are array reductions instead of list scans.
+"""
+
+import json
+
+import numpy as np
+
+NEUTRAL = 0
+
+
+class RankMatrix:
+    def __init__(self, employees, shift_ids, preferences, top_key='top_12', bottom_key='bottom_6'):
+        self.employees = list(employees)
+        self.shift_ids = list(shift_ids)
+        self.row = {emp: i for i, emp in enumerate(self.employees)}
+        self.col = {shift_id: j for j, shift_id in enumerate(self.shift_ids)}
+        self.ranks = np.zeros((len(self.employees), len(self.shift_ids)), dtype=np.int8)
+        self.top_n = 0
+
+        rows, cols, values = [], [], []
+        for i, emp in enumerate(self.employees):
+            prefs = preferences.get(emp) or {}
+            top = prefs.get(top_key, [])
+            self.top_n = max(self.top_n, len(top))
+            for rank, shift_id in enumerate(top, start=1):
+                if shift_id in self.col:
+                    rows.append(i)
+                    cols.append(self.col[shift_id])
+                    values.append(rank)
+            # Bottom entries come last so a shift listed in both counts as vetoed
+            for rank, shift_id in enumerate(prefs.get(bottom_key, []), start=1):
+                if shift_id in self.col:
+                    rows.append(i)
+                    cols.append(self.col[shift_id])
+                    values.append(-rank)
+
+        if rows:
+            self.ranks[np.array(rows), np.array(cols)] = np.array(values, dtype=np.int8)
+
+    @classmethod
+    def load(cls, preferences_file, shift_ids, employees=None):
+        """Build straight from a preferences.json file"""
+        with open(preferences_file, 'r') as f:
+            preferences = json.load(f)
+        return cls(preferences.keys() if employees is None else employees, shift_ids, preferences)
+
+    def rank(self, emp, shift_id):
+        """Rank of one shift for one employee (0 if unknown or neutral)"""
+        i = self.row.get(emp)
+        j = self.col.get(shift_id)
+        if i is None or j is None:
+            return NEUTRAL
+        return int(self.ranks[i, j])
+
+    def assignment_pairs(self, assignments):
+        """(rows, cols) index arrays for every known (employee, assigned shift) pair"""
+        rows, cols = [], []
+        for emp, shift_ids in assignments.items():
+            i = self.row.get(emp)
+            if i is None:
+                continue
+            for shift_id in shift_ids:
+                j = self.col.get(shift_id)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+        return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+    def allocation_stats(self, assignments):
+        """
+        Per-assignment and per-employee statistics as arrays.
+        Per-employee arrays are indexed like self.employees.
+        """
+        rows, cols = self.assignment_pairs(assignments)
+        ranks = self.ranks[rows, cols]
+        is_top = ranks > 0
+        is_bottom = ranks < 0
+        num_employees = len(self.employees)
+
+        top_count = np.bincount(rows[is_top], minlength=num_employees)
+        rank_sum = np.bincount(rows[is_top], weights=ranks[is_top], minlength=num_employees)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg_rank = np.where(top_count > 0, rank_sum / np.maximum(top_count, 1), np.nan)
+
+        return {
+            'rows': rows,
+            'cols': cols,
+            'ranks': ranks,
+            'shift_count': np.bincount(rows, minlength=num_employees),
+            'top_count': top_count,
+            'bottom_count': np.bincount(rows[is_bottom], minlength=num_employees),
+            'fallback_count': np.bincount(rows[ranks == NEUTRAL], minlength=num_employees),
+            'rank_sum': rank_sum.astype(np.int64),
+            'avg_rank': avg_rank,
+            # rank_histogram[r - 1] = number of assigned shifts at top rank r
+            'rank_histogram': np.bincount(ranks[is_top], minlength=self.top_n + 1)[1:]
+        }
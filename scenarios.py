@@ -0,0 +1,95 @@
+"""
+Seeded synthetic scheduling scenarios
+
+Builds employees and preferences.json-shaped preferences for a season of
+any size, so the allocator can be exercised (and benchmarked) well beyond
+the real 60-shift / ~30-employee season. Every scenario is drawn from a
+private random.Random(seed): the same arguments always give the same data.
+
+Preference skew models popular weekends - with skew > 0 the "hot" weeks
+(by default the holiday weekends) are ranked in far more top lists and
+far fewer bottom lists than the rest of the season.
+"""
+
+import random
+
+from shifts import generate_shifts, ShiftIndex, SEASON_START, SHIFT_KINDS
+
+TOP_N = 12
+BOTTOM_N = 6
+
+# Weekends around Christmas / New Year in the default season (Dec 20 - Jan 3)
+HOLIDAY_WEEKS = (2, 3, 4)
+
+
+def _weighted_order(rng, items, weights):
+    """
+    Weighted random permutation (Efraimidis-Spirakis): items with larger
+    weights tend to come first. Equal weights give a plain shuffle.
+    """
+    keys = [(rng.random() ** (1.0 / weight), item) for item, weight in zip(items, weights)]
+    keys.sort(key=lambda pair: pair[0], reverse=True)
+    return [item for _, item in keys]
+
+
+def random_preferences(rng, shift_ids, weights=None, top_n=TOP_N, bottom_n=BOTTOM_N):
+    """
+    One employee's preferences in the preferences.json format.
+    weights (one per shift id) bias the top list towards popular shifts
+    and the bottom list away from them.
+    """
+    if weights is None:
+        weights = [1.0] * len(shift_ids)
+
+    top = _weighted_order(rng, shift_ids, weights)[:top_n]
+    chosen = set(top)
+    rest = [shift_id for shift_id in shift_ids if shift_id not in chosen]
+    rest_weights = [1.0 / weight for shift_id, weight in zip(shift_ids, weights) if shift_id not in chosen]
+    bottom = _weighted_order(rng, rest, rest_weights)[:bottom_n]
+
+    # Random shift type preferences (1, 2, 3)
+    shift_types = [1, 2, 3]
+    rng.shuffle(shift_types)
+
+    return {
+        'top_12': top,
+        'bottom_6': bottom,
+        'shift_type_pref': {kind: str(rank) for kind, rank in zip(SHIFT_KINDS, shift_types)}
+    }
+
+
+def generate_scenario(num_employees=30, weeks=20, kinds=SHIFT_KINDS, slots=1, skew=0.0,
+                      hot_weeks=HOLIDAY_WEEKS, laggard_rate=0.0, seed=0, start_date=SEASON_START):
+    """
+    Build a complete scenario.
+
+    num_employees  employees named emp0001, emp0002, ...
+    weeks, kinds, slots  passed to generate_shifts()
+    skew           0 = uniform preferences; k > 0 makes hot-week shifts
+                   (1 + k) times as likely to be ranked
+    laggard_rate   fraction of employees who never submitted preferences
+
+    Returns a dict with shifts, shift_index, employees (name list) and preferences.
+    """
+    rng = random.Random(seed)
+    shifts = generate_shifts(start_date=start_date, weeks=weeks, kinds=kinds, slots=slots)
+    shift_index = ShiftIndex(shifts)
+    shift_ids = shift_index.ids
+
+    hot = set(hot_weeks)
+    weights = [1.0 + skew if shift_index.week_of(shift_id) in hot else 1.0 for shift_id in shift_ids]
+
+    width = max(4, len(str(num_employees)))
+    employees = [f'emp{i:0{width}d}' for i in range(1, num_employees + 1)]
+    preferences = {}
+    for emp in employees:
+        if rng.random() < laggard_rate:
+            continue
+        preferences[emp] = random_preferences(rng, shift_ids, weights)
+
+    return {
+        'shifts': shifts,
+        'shift_index': shift_index,
+        'employees': employees,
+        'preferences': preferences
+    }
@@ -0,0 +1,129 @@
+"""
+Weekend shift calendar and a precomputed lookup index over it
+
+generate_shifts() builds the season's shift list; ShiftIndex is built once
+from that list so the allocator, routes and exports can look shifts up by
+id, week, date or kind without scanning the whole season each time.
+"""
+
+from datetime import datetime, timedelta
+
+# Shift kinds - these match the keys employees rank in 'shift_type_pref'
+SATURDAY = 'saturday'
+SUNDAY_MORNING = 'sunday_morning'
+SUNDAY_EVENING = 'sunday_evening'
+SHIFT_KINDS = (SATURDAY, SUNDAY_MORNING, SUNDAY_EVENING)
+
+# Compact time labels used in mail merge exports ("Saturday, Dec. 13, 11-7 ET")
+SHORT_TIMES = {
+    SATURDAY: '11-7',
+    SUNDAY_MORNING: '8-4',
+    SUNDAY_EVENING: '3-10',
+}
+
+SEASON_START = datetime(2025, 12, 13)  # Saturday Dec 13, 2025
+SEASON_WEEKS = 20
+
+
+# Day offset from Saturday, day name and hours for each kind of shift
+SHIFT_TEMPLATES = {
+    SATURDAY: (0, 'Saturday', '11:00 AM - 7:00 PM'),
+    SUNDAY_MORNING: (1, 'Sunday', '8:00 AM - 4:00 PM'),
+    SUNDAY_EVENING: (1, 'Sunday', '3:00 PM - 10:00 PM'),
+}
+
+
+# Generate 60 weekend shifts (20 weekends starting Dec 13, 2025)
+def generate_shifts(start_date=SEASON_START, weeks=SEASON_WEEKS, kinds=SHIFT_KINDS, slots=1):
+    shifts = []
+    shift_id = 0
+
+    for week in range(weeks):
+        saturday = start_date + timedelta(weeks=week)
+
+        # One shift per kind, in weekend order (Saturday, Sunday morning, Sunday evening)
+        for kind in kinds:
+            day_offset, day_name, hours = SHIFT_TEMPLATES[kind]
+            shifts.append({
+                'id': shift_id,
+                'date': (saturday + timedelta(days=day_offset)).strftime('%Y-%m-%d'),
+                'day': day_name,
+                'time': hours,
+                'kind': kind,
+                'slots': slots,
+                'week': week + 1
+            })
+            shift_id += 1
+
+    return shifts
+
+
+class ShiftIndex:
+    """
+    Read-only lookup tables over a list of shifts.
+    Built once at startup; every lookup is a dict access instead of a
+    linear scan. Id lists are kept in chronological (shift id) order.
+    """
+
+    def __init__(self, shifts):
+        self.shifts = list(shifts)
+        self.by_id = {}
+        self.ids_by_week = {}
+        self.ids_by_date = {}
+        self.ids_by_kind = {kind: [] for kind in SHIFT_KINDS}
+
+        for shift in self.shifts:
+            shift_id = shift['id']
+            self.by_id[shift_id] = shift
+            self.ids_by_week.setdefault(shift['week'], []).append(shift_id)
+            self.ids_by_date.setdefault(shift['date'], []).append(shift_id)
+            self.ids_by_kind.setdefault(shift['kind'], []).append(shift_id)
+
+    def __getitem__(self, shift_id):
+        return self.by_id[shift_id]
+
+    def __contains__(self, shift_id):
+        return shift_id in self.by_id
+
+    def __iter__(self):
+        return iter(self.shifts)
+
+    def __len__(self):
+        return len(self.shifts)
+
+    def get(self, shift_id, default=None):
+        return self.by_id.get(shift_id, default)
+
+    @property
+    def ids(self):
+        return list(self.by_id)
+
+    def week_of(self, shift_id):
+        return self.by_id[shift_id]['week']
+
+    def date_of(self, shift_id):
+        return self.by_id[shift_id]['date']
+
+    def kind_of(self, shift_id):
+        return self.by_id[shift_id]['kind']
+
+    def slots_of(self, shift_id):
+        return self.by_id[shift_id]['slots']
+
+    def ids_in_week(self, week):
+        return self.ids_by_week.get(week, [])
+
+    def ids_on_date(self, date):
+        return self.ids_by_date.get(date, [])
+
+    def ids_of_kind(self, kind):
+        return self.ids_by_kind.get(kind, [])
+
+    def assignees(self, assignments):
+        """{shift id: [employees]} for every shift, from {employee: [shift ids]} in one pass"""
+        by_shift = {shift_id: [] for shift_id in self.by_id}
+        for emp, shift_ids in assignments.items():
+            for shift_id in shift_ids:
+                if shift_id in by_shift:
+                    by_shift[shift_id].append(emp)
+        return by_shift
@@ -0,0 +1,556 @@
+"""
+Storage backends for the app's four collections
+
+    employees    username -> account
+    preferences  username -> {top_12, bottom_6, shift_type_pref}
+    settings     deadline / is_locked
+    assignments  username -> [shift ids]
+
+JsonStore keeps the original layout - one data/<collection>.json file per
+collection, rewritten whole on every save. SqliteStore keeps one row per
+key in data/weekend_trunk.db (WAL mode), so submitting one employee's
+preferences is a single-row upsert and readers never block the writer.
+
+The backend is picked with the STORAGE_BACKEND environment variable
+('json' by default, or 'sqlite'); migrate_to_sqlite.py copies the JSON
+files into a new database.
+
+Every record's version is record_etag(value), a hash of its content, so
+no extra bookkeeping is stored. put_if / delete_if / update_if only write
+when the record still has the version the client last read (HTTP
+If-Match), and report the current version when it doesn't. SqliteStore
+does this as a compare-and-swap on the one row, so writers of different
+records never wait for each other.
+"""
+
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+
+from flask import g, has_request_context
+
+from metrics import STORAGE_SECONDS
+
+COLLECTIONS = ('employees', 'preferences', 'settings', 'assignments')
+
+SQLITE_FILENAME = 'weekend_trunk.db'
+
+# werkzeug hashes of the seed accounts' passwords ('admin123' for admin,
+# 'password' for employee1..30), computed once so that creating a data
+# directory doesn't run scrypt 31 times. check_password_hash() reads the
+# method and salt from the hash itself.
+SEED_PASSWORD_HASHES = {
+    'admin123': 'scrypt:32768:8:1$C5Uh0eyjSXKyFpbq$bec447f885fe9fec07326560feec10353e8aba7ba341dcf074f7c8648220ff67d2019cf9958442112701eb39f30af7d6417451b3223828efe18be67216f53054',
+    'password': 'scrypt:32768:8:1$ehWmfThH1RmjW34E$df2083fc89034bce0ff7b37b84e095a2d42967efabd64e6013dbc1efd34d9a6ac5e6520e73eac50c918fbc6ada67282ee90766721278df56d8d5c048c41beb85'
+}
+SEED_EMPLOYEES = 30
+
+
+# Read-through cache for load_json: path -> (version, stat, pickled data),
+# least recently used first, at most CACHE_ENTRIES files (job and export
+# meta files go through here too). Every fill gets a new version, so a
+# request's memo of a file is good while the cached copy is the one it
+# read; the stat picks up edits from other workers, and our own writes
+# replace the entry. Callers get a fresh copy (pickle.loads) every time
+# and may mutate it.
+CACHE_ENTRIES = 64
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_fills = itertools.count(1)
+CACHE_STATS = {'hits': 0, 'misses': 0, 'request_hits': 0}
+
+
+def _stat(filepath):
+    st = os.stat(filepath)
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+def _cache_put(filepath, stat, blob):
+    """Cache blob as the current copy of filepath (evicting the oldest); returns its version. Hold _cache_lock."""
+    version = next(_fills)
+    _cache[filepath] = (version, stat, blob)
+    _cache.move_to_end(filepath)
+    while len(_cache) > CACHE_ENTRIES:
+        _cache.popitem(last=False)
+    return version
+
+def _request_memo():
+    """Per-request {path: (version, pickled data)} in flask.g, or None outside a request"""
+    if not has_request_context():
+        return None
+    if 'json_memo' not in g:
+        g.json_memo = {}
+    return g.json_memo
+
+def _metric_name(filepath):
+    """storage_duration_seconds label: the collection, or for any other file its directory (bounded)"""
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    return stem if stem in COLLECTIONS else os.path.basename(os.path.dirname(filepath))
+
+def load_json(filepath):
+    with STORAGE_SECONDS.time(operation='load', name=_metric_name(filepath)):
+        return _load_json(filepath)
+
+def _load_json(filepath):
+    # Same request, no write since: skip even the stat()
+    memo = _request_memo()
+    if memo is not None and filepath in memo:
+        version, blob = memo[filepath]
+        with _cache_lock:
+            cached = _cache.get(filepath)
+            if cached is not None and cached[0] == version:
+                CACHE_STATS['request_hits'] += 1
+                return pickle.loads(blob)
+
+    stat = _stat(filepath)
+    with _cache_lock:
+        cached = _cache.get(filepath)
+        if cached is not None and cached[1] == stat:
+            CACHE_STATS['hits'] += 1
+            _cache.move_to_end(filepath)
+            version, _, blob = cached
+        else:
+            CACHE_STATS['misses'] += 1
+            blob = None
+    if blob is None:
+        with open(filepath, 'r') as f:
+            data = json.load(f)
+        blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        with _cache_lock:
+            version = _cache_put(filepath, stat, blob)
+
+    if memo is not None:
+        memo[filepath] = (version, blob)
+    return pickle.loads(blob)
+
+def _write_temp(filepath, data, durable=True):
+    """Write data to a (fsynced, when durable) temp file next to filepath; returns the temp file's path"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filepath), prefix=f'.{os.path.basename(filepath)}.', suffix='.tmp')
+    try:
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+def _fsync_dir(dirpath):
+    # Makes the rename itself durable
+    fd = os.open(dirpath, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def save_json(filepath, data, durable=True):
+    """
+    Atomically replace a JSON file: the data goes to a fsynced temp file
+    that is renamed over the target, so readers (which take no lock) see
+    either the old file or the new one, never a truncated or partial one.
+    durable=False skips the fsyncs, for files that are rebuilt when lost.
+    """
+    with STORAGE_SECONDS.time(operation='save', name=_metric_name(filepath)):
+        tmp = _write_temp(filepath, data, durable)
+        os.replace(tmp, filepath)
+        if durable:
+            _fsync_dir(os.path.dirname(filepath))
+        _mark_written(filepath, data)
+
+def _mark_written(filepath, data):
+    # Invalidate every cached copy, then prime the cache with what was just written
+    blob = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    with _cache_lock:
+        _cache_put(filepath, _stat(filepath), blob)
+
+def cache_stats():
+    """Hit/miss counters for load_json and the files currently cached"""
+    with _cache_lock:
+        stats = dict(CACHE_STATS)
+        entries = {os.path.basename(path): len(blob) for path, (_, _, blob) in _cache.items()}
+    lookups = stats['hits'] + stats['misses'] + stats['request_hits']
+    return {
+        **stats,
+        'hit_rate': round((lookups - stats['misses']) / lookups, 4) if lookups else None,
+        'capacity': CACHE_ENTRIES,
+        'entries': entries
+    }
+
+
+def record_etag(value):
+    """Version of one record (or of a whole small collection like settings); None if it doesn't exist"""
+    if value is None:
+        return None
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:20]
+
+def etag_matches(value, expected):
+    """
+    Does the current value satisfy a write precondition? expected is a
+    collection of etags (If-Match), '*' (must exist) or None (must not exist).
+    """
+    if expected is None:
+        return value is None
+    if expected == '*':
+        return value is not None
+    return record_etag(value) in expected
+
+
+class FileLocks:
+    """
+    Named locks (flock on <lock_dir>/.<name>.lock) that hold across threads
+    and worker processes. Re-entrant within a thread, so a store method can
+    take the lock its caller already holds - in the mode it already holds
+    it, so never ask for an exclusive lock while holding the shared one.
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self._local = threading.local()
+
+    @contextmanager
+    def hold(self, name, shared=False):
+        held = self._local.__dict__.setdefault('held', set())
+        if name in held:
+            yield
+            return
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(os.path.join(self.lock_dir, f'.{name}.lock'), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            held.add(name)
+            try:
+                yield
+            finally:
+                held.discard(name)
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+class JsonStore:
+    """One JSON file per collection (data/employees.json, ...)"""
+
+    backend = 'json'
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.locks = FileLocks(data_dir)
+
+    def locked(self, collection):
+        """Serialize read-modify-write cycles on one collection (readers never wait)"""
+        return self.locks.hold(collection)
+
+    def locked_records(self, collection, keys):
+        # The whole file is rewritten for any record, so this is the collection lock
+        return self.locked(collection)
+
+    def path(self, collection):
+        return os.path.join(self.data_dir, f'{collection}.json')
+
+    def exists(self, collection):
+        return os.path.exists(self.path(collection))
+
+    def load(self, collection):
+        return load_json(self.path(collection))
+
+    def save(self, collection, data):
+        save_json(self.path(collection), data)
+
+    def save_many(self, collections):
+        """
+        Replace several collections together: every file is written and
+        fsynced to a temp file first, then all are renamed into place.
+        """
+        staged = []
+        try:
+            for collection, data in collections.items():
+                path = self.path(collection)
+                staged.append((_write_temp(path, data), path, data))
+        except Exception:
+            for tmp, _, _ in staged:
+                os.remove(tmp)
+            raise
+        for tmp, path, data in staged:
+            os.replace(tmp, path)
+            _mark_written(path, data)
+        _fsync_dir(self.data_dir)
+
+    def get(self, collection, key, default=None):
+        return self.load(collection).get(key, default)
+
+    def put(self, collection, key, value):
+        self.update(collection, {key: value})
+
+    def update(self, collection, items):
+        with self.locked(collection):
+            data = self.load(collection)
+            data.update(items)
+            self.save(collection, data)
+
+    def delete(self, collection, key):
+        with self.locked(collection):
+            data = self.load(collection)
+            if key not in data:
+                return False
+            del data[key]
+            self.save(collection, data)
+            return True
+
+    def put_if(self, collection, key, value, expected):
+        """Write one record if it matches expected; returns (written, its etag now)"""
+        with self.locked(collection):
+            data = self.load(collection)
+            if not etag_matches(data.get(key), expected):
+                return False, record_etag(data.get(key))
+            data[key] = value
+            self.save(collection, data)
+            return True, record_etag(value)
+
+    def delete_if(self, collection, key, expected):
+        """Delete one record if it matches expected; returns (deleted, its etag now)"""
+        with self.locked(collection):
+            data = self.load(collection)
+            if key not in data or not etag_matches(data[key], expected):
+                return False, record_etag(data.get(key))
+            del data[key]
+            self.save(collection, data)
+            return True, None
+
+    def update_if(self, collection, items, expected):
+        """update() if the whole collection matches expected; returns (written, collection etag now)"""
+        with self.locked(collection):
+            data = self.load(collection)
+            if not etag_matches(data, expected):
+                return False, record_etag(data)
+            data.update(items)
+            self.save(collection, data)
+            return True, record_etag(data)
+
+
+class SqliteStore:
+    """
+    One row per (collection, key) with the value stored as JSON.
+    Rows come back in insertion order, like the JSON files; each thread
+    gets its own connection.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.locks = FileLocks(os.path.dirname(db_path))
+        # One lock file per record that has been written, kept out of data/ itself
+        self.record_locks = FileLocks(os.path.join(os.path.dirname(db_path), 'record_locks'))
+        self._local = threading.local()
+
+    def _connect(self):
+        # The database is opened on first use, not at construction; a
+        # connection inherited across fork() (gunicorn --preload) is never reused
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            # WAL + NORMAL only syncs at checkpoints - committed rows survive an app crash
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._create_tables(db)
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _create_tables(self, db):
+        with db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    collection TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    UNIQUE (collection, key)
+                );
+                -- A collection exists once it has been saved, even if it is empty
+                CREATE TABLE IF NOT EXISTS collections (
+                    name TEXT PRIMARY KEY
+                );
+            """)
+
+    def locked(self, collection):
+        """Serialize writers of one collection (SQLite itself keeps each statement atomic)"""
+        return self.locks.hold(collection)
+
+    @contextmanager
+    def locked_records(self, collection, keys):
+        """
+        Serialize writers of these records only. The collection lock is
+        held shared, so whole-collection writers (locked()) still exclude them.
+        """
+        with ExitStack() as stack:
+            stack.enter_context(self.locks.hold(collection, shared=True))
+            for key in sorted(keys):
+                digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+                stack.enter_context(self.record_locks.hold(f'{collection}.{digest}'))
+            yield
+
+    def exists(self, collection):
+        row = self._connect().execute('SELECT 1 FROM collections WHERE name = ?', (collection,)).fetchone()
+        return row is not None
+
+    def load(self, collection):
+        with STORAGE_SECONDS.time(operation='load', name=collection):
+            rows = self._connect().execute(
+                'SELECT key, value FROM records WHERE collection = ? ORDER BY rowid', (collection,))
+            return {key: json.loads(value) for key, value in rows}
+
+    def save(self, collection, data):
+        with STORAGE_SECONDS.time(operation='save', name=collection), self._connect() as db:
+            db.execute('DELETE FROM records WHERE collection = ?', (collection,))
+            db.executemany('INSERT INTO records (collection, key, value) VALUES (?, ?, ?)',
+                           [(collection, key, json.dumps(value)) for key, value in data.items()])
+            db.execute('INSERT OR IGNORE INTO collections (name) VALUES (?)', (collection,))
+
+    def save_many(self, collections):
+        """Replace several collections in one transaction"""
+        with self._connect() as db:
+            for collection, data in collections.items():
+                db.execute('DELETE FROM records WHERE collection = ?', (collection,))
+                db.executemany('INSERT INTO records (collection, key, value) VALUES (?, ?, ?)',
+                               [(collection, key, json.dumps(value)) for key, value in data.items()])
+                db.execute('INSERT OR IGNORE INTO collections (name) VALUES (?)', (collection,))
+
+    def get(self, collection, key, default=None):
+        row = self._connect().execute(
+            'SELECT value FROM records WHERE collection = ? AND key = ?', (collection, key)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def put(self, collection, key, value):
+        self.update(collection, {key: value})
+
+    def update(self, collection, items):
+        # Upsert keeps an existing row's position (rowid), so order is stable
+        with self._connect() as db:
+            db.executemany("""
+                INSERT INTO records (collection, key, value) VALUES (?, ?, ?)
+                ON CONFLICT (collection, key) DO UPDATE SET value = excluded.value
+            """, [(collection, key, json.dumps(value)) for key, value in items.items()])
+            db.execute('INSERT OR IGNORE INTO collections (name) VALUES (?)', (collection,))
+
+    def delete(self, collection, key):
+        with self._connect() as db:
+            cursor = db.execute('DELETE FROM records WHERE collection = ? AND key = ?', (collection, key))
+        return cursor.rowcount > 0
+
+    def _get_text(self, db, collection, key):
+        row = db.execute('SELECT value FROM records WHERE collection = ? AND key = ?', (collection, key)).fetchone()
+        return None if row is None else row[0]
+
+    def put_if(self, collection, key, value, expected):
+        """Write one record if it matches expected; returns (written, its etag now)"""
+        db = self._connect()
+        text = self._get_text(db, collection, key)
+        current = None if text is None else json.loads(text)
+        if not etag_matches(current, expected):
+            return False, record_etag(current)
+        # Compare-and-swap on the row: it only changes if nobody wrote it since we read it
+        with db:
+            if text is None:
+                cursor = db.execute('INSERT OR IGNORE INTO records (collection, key, value) VALUES (?, ?, ?)',
+                                    (collection, key, json.dumps(value)))
+            else:
+                cursor = db.execute('UPDATE records SET value = ? WHERE collection = ? AND key = ? AND value = ?',
+                                    (json.dumps(value), collection, key, text))
+            db.execute('INSERT OR IGNORE INTO collections (name) VALUES (?)', (collection,))
+        if cursor.rowcount == 0:
+            return False, record_etag(self.get(collection, key))
+        return True, record_etag(value)
+
+    def delete_if(self, collection, key, expected):
+        """Delete one record if it matches expected; returns (deleted, its etag now)"""
+        db = self._connect()
+        text = self._get_text(db, collection, key)
+        current = None if text is None else json.loads(text)
+        if text is None or not etag_matches(current, expected):
+            return False, record_etag(current)
+        with db:
+            cursor = db.execute('DELETE FROM records WHERE collection = ? AND key = ? AND value = ?',
+                                (collection, key, text))
+        if cursor.rowcount == 0:
+            return False, record_etag(self.get(collection, key))
+        return True, None
+
+    def update_if(self, collection, items, expected):
+        """update() if the whole collection matches expected; returns (written, collection etag now)"""
+        db = self._connect()
+        with db:
+            # Take the write lock before reading so the check and the write are one step
+            db.execute('BEGIN IMMEDIATE')
+            data = self.load(collection)
+            if not etag_matches(data, expected):
+                return False, record_etag(data)
+            db.executemany("""
+                INSERT INTO records (collection, key, value) VALUES (?, ?, ?)
+                ON CONFLICT (collection, key) DO UPDATE SET value = excluded.value
+            """, [(collection, key, json.dumps(value)) for key, value in items.items()])
+            db.execute('INSERT OR IGNORE INTO collections (name) VALUES (?)', (collection,))
+        data.update(items)
+        return True, record_etag(data)
+
+
+def open_store(data_dir, backend=None):
+    """Store for data_dir; backend defaults to $STORAGE_BACKEND, then 'json'"""
+    backend = backend or os.environ.get('STORAGE_BACKEND', 'json')
+    if backend == 'sqlite':
+        return SqliteStore(os.path.join(data_dir, SQLITE_FILENAME))
+    if backend == 'json':
+        return JsonStore(data_dir)
+    raise ValueError(f"Unknown storage backend '{backend}'")
+
+
+def seed_collections(store):
+    """
+    Create whichever collections don't exist yet with their starting data:
+    the admin and employee1..30 accounts, an open season with a deadline a
+    week out, and no preferences or assignments. Safe to call from every
+    worker at once. Returns the names of the collections it created.
+    """
+    def employees():
+        accounts = {'admin': {'name': 'Admin', 'is_manager': True, 'password': SEED_PASSWORD_HASHES['admin123']}}
+        for i in range(1, SEED_EMPLOYEES + 1):
+            accounts[f'employee{i}'] = {
+                'name': f'Employee{i}',
+                'is_manager': False,
+                'password': SEED_PASSWORD_HASHES['password']
+            }
+        return accounts
+
+    defaults = {
+        'employees': employees,
+        'preferences': dict,
+        'settings': lambda: {'deadline': (datetime.now() + timedelta(days=7)).isoformat(), 'is_locked': False},
+        'assignments': dict
+    }
+    created = []
+    for collection, initial in defaults.items():
+        with store.locked(collection):
+            if not store.exists(collection):
+                store.save(collection, initial())
+                created.append(collection)
+    return created
+
+
+def migrate(source, target, collections=COLLECTIONS):
+    """Copy every existing collection from one store to another; returns {collection: rows}"""
+    copied = {}
+    for collection in collections:
+        if source.exists(collection):
+            data = source.load(collection)
+            target.save(collection, data)
+            copied[collection] = len(data)
+    return copied
@@ -0,0 +1,139 @@
+"""
+Manager dashboard summary, maintained on every write
+
+The counters the dashboard shows (employees, submitted, pending, assigned,
+filled / partial / vacant shifts) live in data/summary.json as counts only:
+
+    {"version": 2, "employees": 30, "submitted": 12, "assigned": 0,
+     "shifts": {"filled": 41, "partial": 3, "vacant": 16}}
+
+DashboardSummary.apply() is a JournaledStore listener: a write to one
+employee or one preference compares the record with the one it replaced
+(and, when that changes whether it counts, looks up the same username in
+the other collection) and adjusts the counts by one, with no scan of the
+collection. Whole-collection replaces and assignment writes (one per
+allocation) recount. Who is in which group is for /api/roster to list.
+Reads are a load of the (cached) summary file.
+
+The file is rebuilt from the store when it is missing or in an older
+format - on the first request of each process, and after any update that
+failed part way - so it is written without fsyncs.
+"""
+
+import os
+from datetime import datetime
+
+from allocator import has_complete_preferences
+from storage import FileLocks, load_json, save_json
+
+# The collections the counters come from
+COLLECTIONS = ('employees', 'preferences', 'assignments')
+SUMMARY_VERSION = 2
+
+
+def is_employee(account):
+    """An account that counts on the dashboard (managers don't)"""
+    return account is not None and not account.get('is_manager')
+
+
+def shift_counts(shift_index, assignments):
+    """{'filled', 'partial', 'vacant'} shift counts for the given assignments"""
+    counts = {'filled': 0, 'partial': 0, 'vacant': 0}
+    for shift_id, assigned in shift_index.assignees(assignments).items():
+        if not assigned:
+            counts['vacant'] += 1
+        elif len(assigned) >= shift_index[shift_id].get('slots', 1):
+            counts['filled'] += 1
+        else:
+            counts['partial'] += 1
+    return counts
+
+
+class DashboardSummary:
+    def __init__(self, data_dir, shift_index, store):
+        """store is what the summary describes (its load and get are used)"""
+        self.path = os.path.join(data_dir, 'summary.json')
+        self.locks = FileLocks(data_dir)
+        self.shift_index = shift_index
+        self.store = store
+
+    def _recount(self, summary, collection):
+        """Recompute the part of the summary that comes from one collection"""
+        if collection == 'assignments':
+            assignments = self.store.load('assignments')
+            summary['assigned'] = sum(1 for shift_ids in assignments.values() if shift_ids)
+            summary['shifts'] = shift_counts(self.shift_index, assignments)
+            return
+        # Submitted counts depend on both employees and preferences
+        employees = [username for username, account in self.store.load('employees').items() if is_employee(account)]
+        preferences = self.store.load('preferences')
+        summary['employees'] = len(employees)
+        summary['submitted'] = sum(1 for username in employees if has_complete_preferences(preferences.get(username)))
+
+    def rebuild(self):
+        """Recompute the whole summary from the store"""
+        with self.locks.hold('summary'):
+            summary = {'version': SUMMARY_VERSION}
+            self._recount(summary, 'employees')
+            self._recount(summary, 'assignments')
+            summary['rebuilt'] = summary['updated'] = datetime.now().isoformat()
+            save_json(self.path, summary, durable=False)
+            return summary
+
+    def _load(self):
+        """The saved summary, or None when it has to be rebuilt"""
+        if not os.path.exists(self.path):
+            return None
+        summary = load_json(self.path)
+        return summary if summary.get('version') == SUMMARY_VERSION else None
+
+    def _adjust(self, summary, collection, username, old, new):
+        """Count one record's change from old to new (None = no record)"""
+        if collection == 'employees':
+            change = is_employee(new) - is_employee(old)
+            if change:
+                summary['employees'] += change
+                if has_complete_preferences(self.store.get('preferences', username)):
+                    summary['submitted'] += change
+        else:
+            change = has_complete_preferences(new) - has_complete_preferences(old)
+            if change and is_employee(self.store.get('employees', username)):
+                summary['submitted'] += change
+
+    def apply(self, collection, op, key=None, value=None, previous=None):
+        """JournaledStore listener (same arguments as a journal entry, plus the records replaced)"""
+        if collection not in COLLECTIONS:
+            return
+        with self.locks.hold('summary'):
+            try:
+                summary = self._load()
+                if summary is None:
+                    # Nothing to update - the next read rebuilds it
+                    return
+                if op == 'replace' or collection == 'assignments':
+                    self._recount(summary, collection)
+                elif op == 'update':
+                    for username, new in value.items():
+                        self._adjust(summary, collection, username, previous.get(username), new)
+                else:
+                    self._adjust(summary, collection, key, previous, value if op == 'put' else None)
+                summary['updated'] = datetime.now().isoformat()
+                save_json(self.path, summary, durable=False)
+            except Exception as e:
+                # Never fail the write over the summary - drop it so it's rebuilt
+                print(f"Dashboard summary update failed, rebuilding on next read: {e}")
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+
+    def counts(self):
+        """The dashboard's counters"""
+        summary = self._load() or self.rebuild()
+        return {
+            'total_employees': summary['employees'],
+            'submitted': summary['submitted'],
+            'pending': summary['employees'] - summary['submitted'],
+            'assigned': summary['assigned'],
+            'total_shifts': len(self.shift_index),
+            **summary['shifts'],
+            'updated': summary['updated']
+        }
@@ -0,0 +1,20 @@
+import os
+import sys
+
+# The app is a set of top-level modules, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+
+@pytest.fixture
+def client(tmp_path):
+    """A test client on an app with its own, freshly seeded data directory"""
+    import app
+    flask_app = app.create_app({'DATA_DIR': str(tmp_path), 'STORAGE_BACKEND': 'json', 'TESTING': True})
+    return flask_app.test_client()
+
+
+def login(client, username, password):
+    response = client.post('/login', json={'username': username, 'password': password})
+    assert response.status_code == 200
@@ -0,0 +1,83 @@
+import pytest
+
+import app
+from allocation_trace import AllocationTrace, filter_events
+from allocator import greedy_allocate
+from conftest import login
+from scenarios import generate_scenario
+
+
+def run(trace):
+    scenario = generate_scenario(num_employees=12, weeks=6, seed=3)
+    assignments, _, _ = greedy_allocate(scenario['shift_index'], scenario['employees'], scenario['preferences'],
+                                        trace=trace)
+    return assignments
+
+
+def test_each_level_includes_the_ones_before():
+    traces = {level: AllocationTrace(level) for level in ('phase', 'decision', 'candidate')}
+    results = [run(trace) for trace in traces.values()]
+    levels = {name: {event['level'] for event in trace.events} for name, trace in traces.items()}
+
+    assert levels == {'phase': {'phase'}, 'decision': {'phase', 'decision'},
+                      'candidate': {'phase', 'decision', 'candidate'}}
+    # Tracing never changes the outcome
+    assert results[0] == results[1] == results[2] == run(None)
+
+
+def test_off_records_nothing():
+    trace = AllocationTrace('off')
+    run(trace)
+
+    assert not trace.wants('phase')
+    assert trace.to_dict()['recorded'] == 0
+
+
+def test_sampling_keeps_all_or_none_of_an_employee():
+    full = AllocationTrace('decision')
+    half = AllocationTrace('decision', sample=0.5)
+    run(full)
+    run(half)
+
+    employees = {event['employee'] for event in full.events if event['employee']}
+    kept = {event['employee'] for event in half.events if event['employee']}
+    assert 0 < len(kept) < len(employees)
+    without_n = lambda events: [{key: value for key, value in event.items() if key != 'n'} for event in events]
+    for employee in kept:
+        assert without_n(filter_events(half.events, employee)) == without_n(filter_events(full.events, employee))
+    # Phase events have no employee and are always kept
+    assert [event['event'] for event in half.events if event['level'] == 'phase'] == \
+        [event['event'] for event in full.events if event['level'] == 'phase']
+
+
+def test_ring_buffer_drops_the_oldest():
+    trace = AllocationTrace('decision', capacity=3)
+    for n in range(5):
+        trace.record('decision', 'phase1', 'assigned', f'employee{n}', shift=n)
+
+    summary = trace.to_dict()
+    assert (summary['recorded'], summary['dropped']) == (5, 2)
+    assert [event['shift'] for event in summary['events']] == [2, 3, 4]
+
+
+def test_bad_level_or_sample():
+    with pytest.raises(ValueError):
+        AllocationTrace('everything')
+    with pytest.raises(ValueError):
+        AllocationTrace('phase', sample=1.5)
+
+
+def test_allocate_saves_the_trace_only_when_tracing(client):
+    login(client, 'admin', 'admin123')
+    for n in range(1, 7):
+        app.STORE.put('preferences', f'employee{n}', {'top_12': list(range(n, n + 12)), 'bottom_6': list(range(60, 66)),
+                                                      'shift_type_pref': {}})
+
+    assert client.post('/api/allocate?trace=decision').status_code == 200
+    traced = client.get('/api/allocation-trace?event=assigned&limit=5').get_json()
+    assert traced['level'] == 'decision'
+    assert traced['matched'] > 5 and len(traced['events']) == 5
+
+    assert client.post('/api/allocate?trace=off').status_code == 200
+    assert client.get('/api/allocation-trace').status_code == 404
+    assert client.post('/api/allocate?trace=loud').status_code == 400
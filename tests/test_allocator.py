@@ -0,0 +1,143 @@
+import itertools
+
+from allocator import (FALLBACK_EDGES_PER_KIND, SHIFTS_PER_EMPLOYEE, UNASSIGNED_COST, candidate_costs,
+                       optimal_allocate, repair_allocate)
+from scenarios import generate_scenario
+from shifts import ShiftIndex
+
+
+def shortfall_cost(missing):
+    # optimal_allocate's convex penalty: the k-th empty slot costs k * UNASSIGNED_COST
+    return sum(UNASSIGNED_COST * k for k in range(1, missing + 1))
+
+
+def allocation_cost(assignments, costs):
+    return sum(sum(costs[emp][sid] for sid in shift_ids) + shortfall_cost(SHIFTS_PER_EMPLOYEE - len(shift_ids))
+               for emp, shift_ids in assignments.items())
+
+
+def brute_force_cost(shift_index, employees, costs):
+    """Cheapest allocation over every feasible choice of up to 2 shifts per employee"""
+    options = []
+    for emp in employees:
+        allowed = sorted(costs[emp])
+        choices = [()]
+        choices += [(sid,) for sid in allowed]
+        choices += [pair for pair in itertools.combinations(allowed, 2)
+                    if shift_index.week_of(pair[0]) != shift_index.week_of(pair[1])]
+        options.append([(choice, sum(costs[emp][sid] for sid in choice) +
+                         shortfall_cost(SHIFTS_PER_EMPLOYEE - len(choice))) for choice in choices])
+
+    best = None
+    for combo in itertools.product(*options):
+        taken = [sid for choice, _ in combo for sid in choice]
+        if any(taken.count(sid) > shift_index.slots_of(sid) for sid in set(taken)):
+            continue
+        total = sum(cost for _, cost in combo)
+        if best is None or total < best:
+            best = total
+    return best
+
+
+def check_constraints(shift_index, assignments, preferences):
+    taken = [sid for shift_ids in assignments.values() for sid in shift_ids]
+    for sid in set(taken):
+        assert taken.count(sid) <= shift_index.slots_of(sid)
+    for emp, shift_ids in assignments.items():
+        assert len(shift_ids) <= SHIFTS_PER_EMPLOYEE
+        assert len({shift_index.week_of(sid) for sid in shift_ids}) == len(shift_ids)
+        assert not set(shift_ids) & set((preferences.get(emp) or {}).get('bottom_6', []))
+
+
+def test_optimal_allocate_matches_brute_force():
+    for seed in range(3):
+        scenario = generate_scenario(num_employees=3, weeks=6, seed=seed)
+        shift_index, employees, preferences = scenario['shift_index'], scenario['employees'], scenario['preferences']
+        costs = candidate_costs(shift_index, employees, preferences)
+
+        assignments, _, _ = optimal_allocate(shift_index, employees, preferences)
+
+        check_constraints(shift_index, assignments, preferences)
+        assert allocation_cost(assignments, costs) == brute_force_cost(shift_index, employees, costs)
+
+
+def test_optimal_allocate_matches_brute_force_when_short_of_shifts():
+    # Preferences over 6 weekends, but only the first two are on offer: 6 shifts for 4 employees
+    scenario = generate_scenario(num_employees=4, weeks=6, seed=7)
+    shift_index = ShiftIndex(shift for shift in scenario['shifts'] if shift['week'] <= 2)
+    employees, preferences = scenario['employees'], scenario['preferences']
+    costs = candidate_costs(shift_index, employees, preferences)
+
+    assignments, _, warnings = optimal_allocate(shift_index, employees, preferences)
+
+    check_constraints(shift_index, assignments, preferences)
+    assert any('could not be fully assigned' in warning for warning in warnings)
+    assert allocation_cost(assignments, costs) == brute_force_cost(shift_index, employees, costs)
+
+
+def test_candidate_costs_cover_every_allowed_shift_in_short_seasons():
+    scenario = generate_scenario(num_employees=10, weeks=20, laggard_rate=0.3, seed=5)
+    shift_index, employees, preferences = scenario['shift_index'], scenario['employees'], scenario['preferences']
+    costs = candidate_costs(shift_index, employees, preferences)
+    for emp in employees:
+        banned = set((preferences.get(emp) or {}).get('bottom_6', []))
+        assert set(costs[emp]) == set(shift_index.ids) - banned
+
+
+def test_candidate_costs_spread_fallback_edges_over_long_seasons():
+    scenario = generate_scenario(num_employees=40, weeks=60, laggard_rate=0.5, seed=6)
+    shift_index, employees, preferences = scenario['shift_index'], scenario['employees'], scenario['preferences']
+    costs = candidate_costs(shift_index, employees, preferences)
+
+    assert costs == candidate_costs(shift_index, employees, preferences)
+    laggards = [emp for emp in employees if emp not in preferences]
+    for emp in laggards:
+        assert len(costs[emp]) == FALLBACK_EDGES_PER_KIND * len(shift_index.ids_by_kind)
+    # Between them, the laggards can reach every shift
+    assert set().union(*(costs[emp] for emp in laggards)) == set(shift_index.ids)
+
+
+def test_repair_allocate_only_moves_affected_employees():
+    scenario = generate_scenario(num_employees=30, weeks=20, seed=3)
+    shift_index, employees, preferences = scenario['shift_index'], scenario['employees'], scenario['preferences']
+    assignments, _, _ = optimal_allocate(shift_index, employees, preferences)
+
+    changed, removed = employees[0], employees[1]
+    preferences = dict(preferences)
+    preferences[changed] = generate_scenario(num_employees=1, weeks=20, seed=99)['preferences']['emp0001']
+    remaining = [emp for emp in employees if emp != removed]
+
+    repaired, shift_assignments, _, moved = repair_allocate(shift_index, remaining, preferences, assignments,
+                                                            affected=[changed])
+
+    assert removed not in repaired
+    assert changed in moved and removed in moved
+    for emp in remaining:
+        if emp not in moved:
+            assert repaired[emp] == sorted(assignments[emp])
+        assert len(repaired[emp]) == SHIFTS_PER_EMPLOYEE
+    check_constraints(shift_index, repaired, preferences)
+    assert shift_assignments == shift_index.assignees(repaired)
+
+
+def test_repair_allocate_without_changes_moves_nobody():
+    scenario = generate_scenario(num_employees=30, weeks=20, seed=4)
+    shift_index, employees, preferences = scenario['shift_index'], scenario['employees'], scenario['preferences']
+    assignments, _, _ = optimal_allocate(shift_index, employees, preferences)
+
+    repaired, _, _, moved = repair_allocate(shift_index, employees, preferences, assignments)
+
+    assert moved == []
+    assert repaired == {emp: sorted(shift_ids) for emp, shift_ids in assignments.items()}
+
+
+def test_repair_allocate_does_not_report_affected_employees_who_keep_their_shifts():
+    scenario = generate_scenario(num_employees=30, weeks=20, seed=4)
+    shift_index, employees, preferences = scenario['shift_index'], scenario['employees'], scenario['preferences']
+    assignments, _, _ = optimal_allocate(shift_index, employees, preferences)
+
+    # Preferences "changed" but are the same, so the repair hands back the same shifts
+    repaired, _, _, moved = repair_allocate(shift_index, employees, preferences, assignments, affected=[employees[0]])
+
+    assert repaired[employees[0]] == sorted(assignments[employees[0]])
+    assert moved == []
@@ -0,0 +1,94 @@
+import pytest
+
+from conftest import login
+
+PREFS = {'top_12': list(range(12)), 'bottom_6': list(range(40, 46)), 'shift_type_pref': {'saturday': '1'}}
+
+
+def test_preferences_put_if_returns_412_on_a_stale_etag(client):
+    login(client, 'employee1', 'password')
+    client.post('/api/preferences', json=PREFS)
+    stale = client.get('/api/preferences').headers['ETag']
+
+    # Another tab submits first...
+    newer = {**PREFS, 'top_12': list(range(1, 13))}
+    first = client.post('/api/preferences', json=newer, headers={'If-Match': stale})
+    assert first.status_code == 200
+
+    # ...so this one, still holding the old version, is refused
+    second = client.post('/api/preferences', json={**PREFS, 'top_12': list(range(2, 14))}, headers={'If-Match': stale})
+    assert second.status_code == 412
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert client.get('/api/preferences').get_json()['employee1'] == newer
+
+
+def test_preferences_if_none_match_only_creates(client):
+    login(client, 'employee1', 'password')
+    assert client.post('/api/preferences', json=PREFS, headers={'If-None-Match': '*'}).status_code == 200
+    assert client.post('/api/preferences', json=PREFS, headers={'If-None-Match': '*'}).status_code == 412
+
+
+def test_preferences_if_match_with_the_current_etag_writes(client):
+    login(client, 'employee1', 'password')
+    first = client.post('/api/preferences', json=PREFS)
+
+    second = client.post('/api/preferences', json={**PREFS, 'top_12': list(range(1, 13))},
+                         headers={'If-Match': first.headers['ETag']})
+
+    assert second.status_code == 200
+    assert client.get('/api/preferences').get_json()['employee1']['top_12'] == list(range(1, 13))
+
+
+def test_provisioning_status_needs_a_manager(client):
+    assert client.get('/initialize-system').status_code == 403
+    assert client.get('/api/provision-jobs/' + '0' * 32).status_code == 403
+
+
+@pytest.fixture
+def captured_jobs(monkeypatch):
+    """Provisioning jobs that don't run: their write functions are kept so a test can call them"""
+    import app
+    jobs = []
+
+    def start(accounts, errors, write_fn, description=''):
+        jobs.append(write_fn)
+        return {'id': '0' * 32, 'total': len(accounts)}
+
+    monkeypatch.setattr(app.PROVISIONING, 'start', start)
+    return jobs
+
+
+def hashed_account(name):
+    return {'name': name, 'is_manager': False, 'password': 'hash-from-the-job'}
+
+
+def test_provisioning_add_skips_usernames_created_during_the_job(client, captured_jobs):
+    login(client, 'admin', 'admin123')
+    upload = 'name,username,password\nNew Writer,newwriter,pw1\nOther Writer,otherwriter,pw2\n'
+    response = client.post('/api/provision-accounts', data=upload, content_type='text/csv')
+    assert response.status_code == 202
+
+    # While the job hashes, a manager creates one of the same usernames
+    created = client.post('/api/employees', json={'username': 'newwriter', 'password': 'secret', 'name': 'Created Meanwhile'})
+    assert created.status_code == 200
+
+    write = captured_jobs[0]
+    assert write({'newwriter': hashed_account('New Writer'), 'otherwriter': hashed_account('Other Writer')}) == ['newwriter']
+
+    employees = client.get('/api/employees').get_json()
+    assert employees['newwriter']['name'] == 'Created Meanwhile'
+    assert employees['otherwriter']['name'] == 'Other Writer'
+
+
+def test_provisioning_replace_fails_if_accounts_changed_during_the_job(client, captured_jobs):
+    import app
+    login(client, 'admin', 'admin123')
+    upload = 'name,username,password\nNew Writer,newwriter,pw1\n'
+    assert client.post('/api/provision-accounts?mode=replace', data=upload, content_type='text/csv').status_code == 202
+
+    client.post('/api/employees', json={'username': 'latecomer', 'password': 'secret', 'name': 'Latecomer'})
+    before = app.STORE.load('employees')
+
+    with pytest.raises(RuntimeError):
+        captured_jobs[0]({'newwriter': hashed_account('New Writer')})
+    assert app.STORE.load('employees') == before
@@ -0,0 +1,40 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from backup_archive import read_sections, stream_archive
+
+COLLECTIONS = ('employees', 'preferences', 'settings', 'assignments')
+
+
+def sample_data(version=0):
+    return {
+        'employees': {'admin': {'name': 'Admin', 'is_manager': True, 'password': 'hash'}},
+        'preferences': {'employee1': {'top_12': list(range(version, version + 12)), 'bottom_6': [40, 41, 42, 43, 44, 45],
+                                      'shift_type_pref': {'saturday': '1'}}},
+        'settings': {'deadline': '2025-12-01T12:00:00', 'is_locked': False},
+        'assignments': {'employee1': [3, 17]}
+    }
+
+
+@pytest.mark.parametrize('compress', [True, False])
+@pytest.mark.parametrize('chunk_size', [7, 64 * 1024])
+def test_archive_round_trip(compress, chunk_size):
+    data = sample_data()
+    data['preferences']['employee2'] = {'top_12': [], 'bottom_6': [], 'shift_type_pref': {'note': 'café – "quoted" {braces}'}}
+    archive = b''.join(stream_archive(data.__getitem__, COLLECTIONS, compress=compress, chunk_size=chunk_size))
+
+    document = json.loads(gzip.decompress(archive) if compress else archive)
+    assert {key: document[key] for key in COLLECTIONS} == data
+
+    sections = dict(read_sections(io.BytesIO(archive), chunk_size=chunk_size))
+    assert {key: sections[key] for key in COLLECTIONS} == data
+    assert sections['timestamp'] == document['timestamp']
+
+
+def test_read_sections_rejects_truncated_input():
+    archive = b''.join(stream_archive(sample_data().__getitem__, COLLECTIONS, compress=False))
+    with pytest.raises(ValueError):
+        list(read_sections(io.BytesIO(archive[:-10])))
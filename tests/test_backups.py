@@ -0,0 +1,77 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from backups import SnapshotStore
+
+COLLECTIONS = ('employees', 'preferences', 'settings', 'assignments')
+
+
+def sample_data(version=0):
+    return {
+        'employees': {'admin': {'name': 'Admin', 'is_manager': True, 'password': 'hash'}},
+        'preferences': {'employee1': {'top_12': list(range(version, version + 12)), 'bottom_6': [40, 41, 42, 43, 44, 45],
+                                      'shift_type_pref': {'saturday': '1'}}},
+        'settings': {'deadline': '2025-12-01T12:00:00', 'is_locked': False},
+        'assignments': {'employee1': [3, 17]}
+    }
+
+
+def object_files(store):
+    return {name for _, _, names in os.walk(store.objects_dir) for name in names}
+
+
+def test_snapshot_create_and_restore(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    name, created = store.create(sample_data(), 'manual')
+    assert created
+
+    backup = store.load(name)
+    assert {key: backup[key] for key in COLLECTIONS} == sample_data()
+    assert store.list()[0]['filename'] == name
+
+
+def test_unchanged_snapshot_is_not_written_again(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    first, _ = store.create(sample_data(), 'manual')
+    second, created = store.create(sample_data(), 'manual')
+    assert (second, created) == (first, False)
+    assert store.count() == 1
+
+
+def test_snapshots_share_unchanged_objects(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.create(sample_data(0), 'manual')
+    before = object_files(store)
+    name, _ = store.create(sample_data(1), 'manual')
+
+    # Only preferences changed, so only its object is new
+    assert len(object_files(store) - before) == 1
+    assert store.read_manifest(name)['changed'] == ['preferences']
+
+
+def test_prune_drops_old_snapshots_and_their_objects(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    names = [store.create(sample_data(version), 'manual')[0] for version in range(3)]
+
+    # Two days on, all three fall in the same daily bucket: only the newest is kept
+    dropped = store.prune(datetime.now() + timedelta(days=2))
+
+    assert dropped == 2
+    assert [entry['filename'] for entry in store.list()] == [names[-1]]
+    for name in names[:-1]:
+        with pytest.raises(KeyError):
+            store.load(name)
+    manifest = store.read_manifest(names[-1])
+    assert object_files(store) == {f"{entry['sha256']}.json" for entry in manifest['files'].values()}
+    restored = store.load(names[-1])
+    assert {key: restored[key] for key in COLLECTIONS} == sample_data(2)
+
+
+def test_catalog_is_rebuilt_from_manifests(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    name, _ = store.create(sample_data(), 'manual')
+    os.remove(store.catalog_path)
+
+    assert [entry['filename'] for entry in SnapshotStore(str(tmp_path)).list()] == [name]
@@ -0,0 +1,125 @@
+import functools
+import json
+
+import pytest
+
+import app
+from conftest import login
+from events import EventLog, format_event
+
+PREFS = {'top_12': list(range(12)), 'bottom_6': list(range(40, 46)), 'shift_type_pref': {'saturday': '1'}}
+
+
+@pytest.fixture
+def log(tmp_path):
+    return EventLog(str(tmp_path / 'events'), max_bytes=200)
+
+
+def test_event_ids_are_byte_positions(log):
+    first = log.publish('settings', {'n': 1})
+    second = log.publish('settings', {'n': 2})
+
+    events, position = log.read(0)
+
+    assert first == 0
+    assert [event['id'] for event in events] == [first, second]
+    assert position == log.end()
+    assert log.read(position) == ([], position)
+
+
+def test_resume_after_last_event_id(log):
+    first = log.publish('settings', {'n': 1})
+    log.publish('settings', {'n': 2})
+
+    events, _ = log.read(log.position_after(str(first)))
+
+    assert [event['data'] for event in events] == [{'n': 2}]
+    # No (or a garbled) Last-Event-ID starts from now
+    assert log.position_after(None) == log.position_after('junk') == log.end()
+
+
+def test_ids_continue_across_rotation_and_old_files_go(log):
+    ids = [log.publish('settings', {'n': n, 'padding': 'x' * 40}) for n in range(12)]
+
+    files = log._files()
+    events, _ = log.read(0)
+
+    assert len(files) == 2
+    assert ids == sorted(ids)
+    # Everything in the kept files, in order, ending with the newest
+    assert [event['id'] for event in events] == ids[-len(events):]
+    # A browser that last saw a dropped event replays what is left
+    assert log.position_after(str(ids[0])) == files[0][0]
+
+
+def test_a_half_written_line_waits(log):
+    log.publish('settings', {'n': 1})
+    _, path = log._files()[-1]
+    with open(path, 'a') as f:
+        f.write('{"id": 99, "event"')
+
+    events, position = log.read(0)
+
+    assert len(events) == 1
+    assert position == events[0]['id'] + len(json.dumps(events[0], separators=(',', ':'))) + 1
+
+
+def test_format_event():
+    assert format_event(7, 'settings', {'a': 1}) == 'id: 7\nevent: settings\ndata: {"a":1}\n\n'
+
+
+def stream(client, monkeypatch, **headers):
+    """The events one /api/events stream sends, as (id, event, data)"""
+    monkeypatch.setattr(app, 'SSE_STREAM_SECONDS', 0.05)
+    monkeypatch.setattr(app.EVENTS, 'follow', functools.partial(app.EVENTS.follow, poll_interval=0.01))
+    with client.get('/api/events', headers=headers) as response:
+        assert response.mimetype == 'text/event-stream'
+        body = response.get_data(as_text=True)
+    events = []
+    for message in body.split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in message.splitlines() if not line.startswith(':'))
+        if 'id' in fields:
+            events.append((int(fields['id']), fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def publish_settings(is_locked=False):
+    return app.EVENTS.publish('settings', {'deadline': app.STORE.load('settings')['deadline'], 'is_locked': is_locked})
+
+
+def test_stream_resumes_from_last_event_id(client, monkeypatch):
+    login(client, 'admin', 'admin123')
+    first = publish_settings()
+    second = publish_settings(is_locked=True)
+
+    events = stream(client, monkeypatch, **{'Last-Event-ID': str(first)})
+
+    assert [(event_id, name) for event_id, name, _ in events] == [(second, 'settings')]
+    assert events[0][2]['preferences_locked'] is True
+    # Nothing to resume from: only what is published from now on
+    assert stream(client, monkeypatch) == []
+
+
+def test_stream_only_sends_employees_their_events(client, monkeypatch):
+    login(client, 'employee1', 'password')
+    marker = publish_settings()
+    assert client.post('/api/preferences', json=PREFS).status_code == 200
+    publish_settings()
+
+    employee = stream(client, monkeypatch, **{'Last-Event-ID': str(marker)})
+    login(client, 'admin', 'admin123')
+    manager = stream(client, monkeypatch, **{'Last-Event-ID': str(marker)})
+
+    assert [name for _, name, _ in employee] == ['settings']
+    assert [name for _, name, _ in manager] == ['submission', 'settings']
+    assert manager[0][2]['username'] == 'employee1' and manager[0][2]['submitted']
+
+
+def test_stream_slots_are_given_back(client, monkeypatch):
+    login(client, 'employee1', 'password')
+    for _ in range(app.SSE_MAX_STREAMS + 1):
+        stream(client, monkeypatch)
+
+    # Every stream released its slot, so another still gets one
+    with client.get('/api/events') as response:
+        assert response.get_data(as_text=True).startswith(f'retry: {app.SSE_RETRY_MS}\n')
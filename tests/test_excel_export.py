@@ -0,0 +1,69 @@
+import io
+
+from openpyxl import load_workbook
+
+from excel_export import SCHEDULE_HEADERS, SUMMARY_HEADERS, ExcelSchedule
+from exports import run_export
+from rank_matrix import RankMatrix
+from scenarios import generate_scenario
+from shifts import ShiftIndex
+
+
+def build(per_week=False, per_employee=False):
+    """The workbook for a small season, read back with openpyxl"""
+    scenario = generate_scenario(num_employees=3, weeks=2, seed=1)
+    shift_index = ShiftIndex(scenario['shifts'])
+    employees = {username: {'name': f'Name {username}'} for username in scenario['employees']}
+    employees['admin'] = {'name': 'Admin', 'is_manager': True}
+    first, second = shift_index.ids[:2]
+    assignments = {'emp0001': [first, second], 'emp0002': [second]}
+    preferences = {'emp0001': {'top_12': [second], 'bottom_6': [first]}}
+    rank_matrix = RankMatrix(preferences.keys(), shift_index.ids, preferences)
+
+    schedule = ExcelSchedule('schedule.xlsx', shift_index, rank_matrix, per_week=per_week, per_employee=per_employee)
+    run_export(shift_index, assignments, employees, [schedule])
+    out = io.BytesIO()
+    schedule.write(out)
+    out.seek(0)
+    return load_workbook(out), shift_index
+
+
+def test_schedule_sheet_rows_and_merged_headers():
+    wb, shift_index = build()
+    ws = wb['Weekend Schedule']
+    rows = list(ws.iter_rows(values_only=True))
+
+    assert wb.sheetnames == ['Weekend Schedule']
+    assert rows[0][0].startswith('Weekend Trunk Shift Schedule - ')
+    assert list(rows[2]) == SCHEDULE_HEADERS
+    shift_rows = rows[3:3 + len(shift_index)]
+    assert [row[0] for row in shift_rows] == [shift['date'] for shift in shift_index]
+    assert shift_rows[0][3:6] == ('Name emp0001', 'Bottom 6', 'FILLED')
+    assert shift_rows[1][3:6] == ('Name emp0001, Name emp0002', '#1, N/A', 'FILLED')
+    assert shift_rows[2][3] == 'VACANT'
+
+    section_row = 3 + len(shift_index) + 3
+    assert rows[section_row - 1][0] == 'Employee Summary'
+    assert list(rows[section_row][:4]) == SUMMARY_HEADERS
+    # Managers are left out of the summary
+    assert [row[0] for row in rows[section_row + 1:]] == ['Name emp0001', 'Name emp0002', 'Name emp0003']
+    assert {str(merged) for merged in ws.merged_cells.ranges} == {'A1:H1', f'A{section_row}:D{section_row}'}
+
+
+def test_header_cells_keep_their_style():
+    wb, _ = build()
+    header = wb['Weekend Schedule']['A3']
+
+    assert header.font.bold
+    assert header.fill.start_color.rgb.endswith('366092')
+
+
+def test_week_and_employee_sheets():
+    wb, shift_index = build(per_week=True, per_employee=True)
+    weeks = sorted({shift['week'] for shift in shift_index})
+
+    assert wb.sheetnames == ['Weekend Schedule', *[f'Week {week}' for week in weeks],
+                             'Name emp0001', 'Name emp0002', 'Name emp0003']
+    assert {str(merged) for merged in wb[f'Week {weeks[0]}'].merged_cells.ranges} == {'A1:H1'}
+    employee_rows = list(wb['Name emp0001'].iter_rows(min_row=4, values_only=True))
+    assert [row[3] for row in employee_rows] == ['Bottom 6', '#1']
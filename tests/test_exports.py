@@ -0,0 +1,135 @@
+import io
+import os
+import threading
+import time
+import zipfile
+
+import pytest
+
+import app
+import exports
+from conftest import login
+from exports import ExportCache
+
+
+def slow_writer(payload):
+    def write(f):
+        for piece in payload:
+            f.write(piece)
+            f.flush()
+            time.sleep(0.001)
+    return write
+
+
+def test_export_cache_concurrent_misses_for_one_key(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    key = cache.key('v1', {'formats': 'csv'})
+    payload = [bytes([65 + i]) * 100 for i in range(20)]
+    errors = []
+
+    def miss():
+        try:
+            cache.put(key, 'export.csv', slow_writer(payload))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=miss) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    path, meta = cache.get(key)
+    with open(path, 'rb') as f:
+        assert f.read() == b''.join(payload)
+    assert meta['download_name'] == 'export.csv'
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.tmp')] == []
+
+
+def test_export_cache_failed_build_leaves_nothing(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    key = cache.key('v1', {'formats': 'csv'})
+
+    def broken(f):
+        f.write(b'partial')
+        raise RuntimeError('writer failed')
+
+    with pytest.raises(RuntimeError):
+        cache.put(key, 'export.csv', broken)
+    assert cache.get(key) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_export_cache_drops_other_versions(tmp_path):
+    cache = ExportCache(str(tmp_path))
+    old = cache.key('v1', {'formats': 'csv'})
+    cache.put(old, 'export.csv', lambda f: f.write(b'old'))
+    new = cache.key('v2', {'formats': 'csv'})
+    cache.put(new, 'export.csv', lambda f: f.write(b'new'))
+
+    assert cache.get(old) is None
+    assert cache.get(new) is not None
+
+
+def assign(shifts_by_user):
+    for username, positions in shifts_by_user.items():
+        app.STORE.put('assignments', username, [app.SHIFT_INDEX.ids[i] for i in positions])
+
+
+def test_run_export_formats_each_shift_once_for_all_writers(monkeypatch):
+    calls = []
+    real = exports.shift_labels
+    monkeypatch.setattr(exports, 'shift_labels', lambda shift: calls.append(shift['id']) or real(shift))
+    assignments = {'employee1': app.SHIFT_INDEX.ids[:2], 'employee2': app.SHIFT_INDEX.ids[1:2]}
+
+    mailmerge, calendars = exports.run_export(app.SHIFT_INDEX, assignments, {},
+                                              [exports.MailMergeCsv('m.csv'), exports.Calendars()])
+
+    assert calls == list(app.SHIFT_INDEX.ids)
+    assert len(mailmerge.rows) == 1 + 3
+    assert sorted(calendars.events) == ['employee1', 'employee2']
+
+
+def test_export_bundle_zips_csv_and_ics(client):
+    login(client, 'admin', 'admin123')
+    assign({'employee1': [0, 5], 'employee2': [5]})
+
+    response = client.get('/api/export?formats=mailmerge,writers,ics')
+
+    assert response.status_code == 200
+    bundle = zipfile.ZipFile(io.BytesIO(response.data))
+    names = bundle.namelist()
+    assert sorted(name for name in names if name.startswith('calendars/')) == \
+        ['calendars/employee1.ics', 'calendars/employee2.ics']
+    mailmerge = next(name for name in names if name.startswith('trunk_mailmerge_'))
+    rows = bundle.read(mailmerge).decode('utf-8').splitlines()
+    assert rows[0] == 'Writer Name,Shift' and len(rows) == 1 + 3
+    calendar = bundle.read('calendars/employee1.ics').decode('utf-8')
+    assert calendar.count('BEGIN:VEVENT') == 2
+    assert client.get('/api/export?formats=pdf').status_code == 400
+
+
+def test_export_calendar_for_yourself_and_for_a_manager(client):
+    login(client, 'employee1', 'password')
+    assign({'employee1': [3]})
+    own = client.get('/api/export-calendar?username=employee2')
+    assert own.status_code == 200
+    assert 'trunk_shifts_employee1.ics' in own.headers['Content-Disposition']
+    assert own.data.decode('utf-8').count('BEGIN:VEVENT') == 1
+
+    login(client, 'admin', 'admin123')
+    assert client.get('/api/export-calendar?username=employee1').data == own.data
+    assert client.get('/api/export-calendar?username=nobody').status_code == 404
+
+
+def test_export_calendar_failure_is_a_json_500(client, monkeypatch):
+    login(client, 'employee1', 'password')
+
+    def broken(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(app, 'send_export', broken)
+
+    response = client.get('/api/export-calendar')
+    assert response.status_code == 500
+    assert response.get_json() == {'error': 'disk full'}
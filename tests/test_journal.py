@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+import journal
+from journal import Journal
+
+COLLECTIONS = ('preferences', 'settings')
+
+
+@pytest.fixture
+def small_journal(tmp_path, monkeypatch):
+    """A journal checkpointing every 5 entries, with 12 preference writes in it"""
+    monkeypatch.setattr(journal, 'CHECKPOINT_EVERY', 5)
+    log = Journal(str(tmp_path), COLLECTIONS)
+    log.start(lambda collection: {})
+    for i in range(1, 13):
+        log.append('preferences', 'put', f'employee{i % 3}', {'version': i})
+    return log
+
+
+def expected_state(upto):
+    state = {}
+    for i in range(1, upto + 1):
+        state[f'employee{i % 3}'] = {'version': i}
+    return state
+
+
+def test_append_numbers_entries_and_checkpoints(small_journal):
+    status = small_journal.status()
+    assert status['last_seq'] == 12
+    # Baseline plus seq 5 and 10
+    assert status['checkpoints'] == 3
+    with open(small_journal.journal_path) as f:
+        assert [json.loads(line)['seq'] for line in f] == list(range(1, 13))
+
+
+@pytest.mark.parametrize('seq', [0, 3, 4, 5, 6, 9, 10, 11, 12])
+def test_entries_since_across_checkpoints(small_journal, seq):
+    entries = small_journal.entries_since(seq)
+    assert [entry['seq'] for entry in entries] == list(range(seq + 1, 13))
+    assert all(entry['value'] == {'version': entry['seq']} for entry in entries)
+
+
+def test_entries_since_before_the_journal_started(small_journal):
+    assert small_journal.entries_since(-1) is None
+
+
+@pytest.mark.parametrize('seq', [1, 4, 5, 6, 10, 12])
+def test_state_at_across_checkpoints(small_journal, seq):
+    entries = {entry['seq']: entry for entry in small_journal.entries_since(0)}
+    state, last_seq = small_journal.state_at(entries[seq]['ts'])
+    assert last_seq == seq
+    assert state['preferences'] == expected_state(seq)
+
+
+def test_state_at_before_the_journal_started(small_journal):
+    assert small_journal.state_at('2000-01-01T00:00:00') == (None, None)
+
+
+def test_sequence_continues_in_a_new_process(small_journal):
+    # A fresh Journal (another worker) reads the last seq back from the file
+    other = Journal(small_journal.journal_dir, COLLECTIONS)
+    assert other.append('settings', 'replace', value={'is_locked': True}) == 13
+    assert small_journal.append('preferences', 'delete', 'employee1') == 14
+    state, seq = small_journal.state_at('2100-01-01T00:00:00')
+    assert seq == 14
+    assert state['settings'] == {'is_locked': True}
+    assert 'employee1' not in state['preferences']
@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import app
+import metrics
+from conftest import login
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics made in a test stay out of the app's registry"""
+    monkeypatch.setattr(metrics, 'REGISTRY', [])
+    return metrics.REGISTRY
+
+
+def worker_file(metrics_dir, pid, requests, seconds):
+    counter = {'type': 'counter', 'help': 'Requests', 'labels': ['route'], 'series': [[['/login'], requests]]}
+    # One observation per bucket list: [<=0.1, <=1.0, +Inf, sum, count]
+    histogram = {'type': 'histogram', 'help': 'Latency', 'labels': [], 'buckets': [0.1, 1.0],
+                 'series': [[[], [1, 0, 0, seconds, 1]]]}
+    os.makedirs(metrics_dir, exist_ok=True)
+    with open(os.path.join(metrics_dir, f'worker-{pid}.json'), 'w') as f:
+        json.dump({'t_requests_total': counter, 't_seconds': histogram}, f)
+
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_collect_adds_up_running_workers_and_drops_exited_ones(tmp_path):
+    metrics_dir = str(tmp_path)
+    dead = exited_pid()
+    worker_file(metrics_dir, os.getpid(), 3, 0.05)
+    worker_file(metrics_dir, os.getppid(), 4, 0.02)
+    worker_file(metrics_dir, dead, 100, 9.0)
+
+    totals = metrics.collect(metrics_dir)
+
+    assert totals['t_requests_total']['series'] == {('/login',): 7}
+    assert totals['t_seconds']['series'][()] == [2, 0, 0, pytest.approx(0.07), 2]
+    assert not os.path.exists(os.path.join(metrics_dir, f'worker-{dead}.json'))
+
+
+def test_exposition_format(tmp_path):
+    worker_file(str(tmp_path), os.getpid(), 3, 0.05)
+
+    text = metrics.exposition(metrics.collect(str(tmp_path)))
+
+    assert text.splitlines() == [
+        '# HELP t_requests_total Requests',
+        '# TYPE t_requests_total counter',
+        't_requests_total{route="/login"} 3',
+        '# HELP t_seconds Latency',
+        '# TYPE t_seconds histogram',
+        't_seconds_bucket{le="0.1"} 1',
+        't_seconds_bucket{le="1.0"} 1',
+        't_seconds_bucket{le="+Inf"} 1',
+        't_seconds_sum 0.05',
+        't_seconds_count 1'
+    ]
+
+
+def test_histogram_buckets_and_label_escaping(registry, tmp_path):
+    histogram = metrics.Histogram('h', 'H', ('route',), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(seconds, route='a"b')
+    metrics.flush(str(tmp_path), force=True)
+
+    lines = metrics.exposition(metrics.collect(str(tmp_path))).splitlines()
+
+    assert 'weekend_trunk_h_bucket{route="a\\"b",le="0.1"} 2' in lines
+    assert 'weekend_trunk_h_bucket{route="a\\"b",le="1.0"} 3' in lines
+    assert 'weekend_trunk_h_bucket{route="a\\"b",le="+Inf"} 4' in lines
+    assert 'weekend_trunk_h_count{route="a\\"b"} 4' in lines
+
+
+def test_series_past_the_limit_go_to_other(registry, monkeypatch):
+    monkeypatch.setattr(metrics, 'MAX_SERIES', 2)
+    counter = metrics.Counter('c', 'C', ('user',))
+    for user in ('a', 'b', 'c', 'd', 'a'):
+        counter.inc(user=user)
+
+    assert counter.series == {('a',): 2, ('b',): 1, ('other',): 2}
+
+
+def test_metrics_route_needs_a_manager_or_the_token(client, monkeypatch):
+    assert client.get('/metrics').status_code == 403
+    monkeypatch.setattr(app, 'METRICS_TOKEN', 'secret')
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+
+    login(client, 'employee1', 'password')
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert '# TYPE weekend_trunk_http_request_duration_seconds histogram' in text
+    assert 'weekend_trunk_http_requests_total{method="POST",route="/login",status="200"}' in text
@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+
+import pytest
+
+import app
+from conftest import login
+from profiling import ProfileStore, RequestProfile
+
+
+@pytest.fixture
+def no_profiler(monkeypatch):
+    """Fail any request that would build a profiler"""
+    def refuse():
+        raise AssertionError('profiler started for an unflagged request')
+    monkeypatch.setattr(app, 'RequestProfile', refuse)
+
+
+def test_requests_without_the_flag_are_not_profiled(client, no_profiler):
+    login(client, 'admin', 'admin123')
+    threads = threading.active_count()
+
+    response = client.get('/api/roster')
+
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert threading.active_count() == threads
+    assert not os.path.exists(app.PROFILES.profiles_dir)
+
+
+def test_employees_cannot_profile(client, no_profiler):
+    login(client, 'employee1', 'password')
+
+    response = client.get('/api/preferences?profile=1', headers={'X-Profile': '1'})
+
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+
+
+def test_manager_profiles_a_request(client):
+    login(client, 'admin', 'admin123')
+
+    response = client.get('/api/roster?profile=1')
+    profile_id = response.headers['X-Profile-Id']
+
+    # The profiler is off again once the request is done
+    assert sys.getprofile() is None
+    [meta] = client.get('/api/profiles').get_json()['profiles']
+    assert meta['id'] == profile_id
+    assert (meta['route'], meta['status'], meta['user']) == ('/api/roster', 200, 'admin')
+    assert 'roster' in client.get(f'/api/profiles/{profile_id}').get_data(as_text=True)
+    assert client.get(f'/api/profiles/{profile_id}?format=collapsed').status_code == 200
+    assert client.get(f'/api/profiles/{profile_id}?format=pstats').status_code == 200
+    assert client.get('/api/profiles/20260101T000000-00000000').status_code == 404
+    assert client.get('/api/profiles/..%2Fsummary?format=collapsed').status_code == 404
+
+
+def test_profile_store_keeps_the_newest(tmp_path):
+    store = ProfileStore(str(tmp_path), keep=2)
+    ids = []
+    for _ in range(3):
+        profile = RequestProfile()
+        profile.start()
+        sum(range(1000))
+        profile.stop()
+        ids.append(store.save(profile, {'route': '/x'})['id'])
+
+    assert [meta['id'] for meta in store.list()] == sorted(ids, reverse=True)[:2]
+    assert len(os.listdir(tmp_path)) == 2 * 3
@@ -0,0 +1,64 @@
+import io
+import time
+
+import pytest
+
+from provisioning import ProvisioningBusy, ProvisioningJobs, read_accounts
+
+
+def wait_for(jobs, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job['state'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} still {job["state"]}')
+
+
+def test_read_accounts_reports_bad_rows():
+    upload = io.BytesIO(b'name,username,password\nA,a,pw\nB,,pw\nC,a,pw\nD,d,\nE,admin,pw\n')
+    accounts, errors = read_accounts(upload, 'csv', taken={'admin'})
+    assert accounts == [(2, 'A', 'a', 'pw')]
+    assert [error['row'] for error in errors] == [3, 4, 5, 6]
+
+
+def test_job_reports_usernames_the_write_skipped(tmp_path):
+    jobs = ProvisioningJobs(str(tmp_path), workers=1)
+    written = {}
+
+    def write(hashed):
+        written.update(hashed)
+        return ['a']
+
+    job = jobs.start([(2, 'A', 'a', 'pw'), (3, 'B', 'b', 'pw')], [], write, 'test')
+    job = wait_for(jobs, job['id'])
+
+    assert job['state'] == 'done'
+    assert sorted(written) == ['a', 'b']
+    assert written['b']['password'].startswith('scrypt:')
+    assert job['written'] == 1
+    assert job['errors'] == [{'row': 2, 'error': "username 'a' was created while the job ran"}]
+
+
+def test_one_job_at_a_time(tmp_path):
+    jobs = ProvisioningJobs(str(tmp_path), workers=1)
+    first = jobs.start([(2, 'A', 'a', 'pw')], [], lambda hashed: [], 'first')
+    with pytest.raises(ProvisioningBusy) as busy:
+        jobs.start([(2, 'B', 'b', 'pw')], [], lambda hashed: [], 'second')
+    assert busy.value.job['id'] == first['id']
+
+    wait_for(jobs, first['id'])
+    second = jobs.start([(2, 'B', 'b', 'pw')], [], lambda hashed: [], 'second')
+    assert wait_for(jobs, second['id'])['state'] == 'done'
+
+
+def test_failed_write_fails_the_job(tmp_path):
+    jobs = ProvisioningJobs(str(tmp_path), workers=1)
+
+    def write(hashed):
+        raise RuntimeError('Employee accounts changed while the job ran')
+
+    job = wait_for(jobs, jobs.start([(2, 'A', 'a', 'pw')], [], write)['id'])
+    assert job['state'] == 'failed'
+    assert 'changed while the job ran' in job['error']
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import pytest
+from flask import Flask
+
+import storage
+from storage import open_store, record_etag
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def store(request, tmp_path):
+    store = open_store(str(tmp_path), request.param)
+    store.save('preferences', {'employee1': {'top_12': [1, 2, 3]}})
+    return store
+
+
+def test_put_if_writes_with_the_current_etag(store):
+    current = record_etag(store.get('preferences', 'employee1'))
+    written, etag = store.put_if('preferences', 'employee1', {'top_12': [4]}, {current})
+    assert written
+    assert etag == record_etag({'top_12': [4]})
+    assert store.get('preferences', 'employee1') == {'top_12': [4]}
+
+
+def test_put_if_refuses_a_stale_etag(store):
+    stale = record_etag(store.get('preferences', 'employee1'))
+    store.put('preferences', 'employee1', {'top_12': [5]})
+
+    written, etag = store.put_if('preferences', 'employee1', {'top_12': [6]}, {stale})
+
+    assert not written
+    assert etag == record_etag({'top_12': [5]})
+    assert store.get('preferences', 'employee1') == {'top_12': [5]}
+
+
+def test_put_if_none_only_creates(store):
+    assert store.put_if('preferences', 'employee1', {'top_12': []}, None) == (False, record_etag({'top_12': [1, 2, 3]}))
+    assert store.put_if('preferences', 'employee2', {'top_12': []}, None) == (True, record_etag({'top_12': []}))
+
+
+def test_delete_if_refuses_a_stale_etag(store):
+    stale = record_etag(store.get('preferences', 'employee1'))
+    store.put('preferences', 'employee1', {'top_12': [7]})
+    assert store.delete_if('preferences', 'employee1', {stale}) == (False, record_etag({'top_12': [7]}))
+    assert store.delete_if('preferences', 'employee1', '*') == (True, None)
+    assert store.get('preferences', 'employee1') is None
+
+
+# Read cache (load_json)
+
+@pytest.fixture
+def cache(monkeypatch):
+    """An empty read cache of three entries, so tests don't see each other's files"""
+    monkeypatch.setattr(storage, '_cache', OrderedDict())
+    monkeypatch.setattr(storage, 'CACHE_ENTRIES', 3)
+    monkeypatch.setattr(storage, 'CACHE_STATS', {'hits': 0, 'misses': 0, 'request_hits': 0})
+    return storage._cache
+
+
+def test_load_json_hits_the_cache_and_returns_copies(tmp_path, cache):
+    path = str(tmp_path / 'a.json')
+    storage.save_json(path, {'names': ['x']})
+
+    first = storage.load_json(path)
+    first['names'].append('mutated')
+
+    assert storage.load_json(path) == {'names': ['x']}
+    assert storage.CACHE_STATS['hits'] == 2
+
+
+def test_load_json_sees_another_process_rewriting_the_file(tmp_path, cache):
+    path = str(tmp_path / 'a.json')
+    storage.save_json(path, {'n': 1})
+    assert storage.load_json(path) == {'n': 1}
+
+    # Same size, written behind the cache's back (as another worker would)
+    with open(path, 'w') as f:
+        json.dump({'n': 2}, f, indent=2)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+    assert storage.load_json(path) == {'n': 2}
+    assert storage.CACHE_STATS['misses'] == 1
+
+
+def test_load_json_cache_evicts_least_recently_used(tmp_path, cache):
+    paths = [str(tmp_path / f'{i}.json') for i in range(4)]
+    for i, path in enumerate(paths[:3]):
+        storage.save_json(path, {'i': i})
+    storage.load_json(paths[0])
+
+    storage.save_json(paths[3], {'i': 3})
+
+    assert list(cache) == [paths[2], paths[0], paths[3]]
+    assert storage.load_json(paths[1]) == {'i': 1}
+    assert len(cache) == 3
+
+
+def test_request_memo_is_dropped_by_a_write(tmp_path, cache):
+    path = str(tmp_path / 'a.json')
+    storage.save_json(path, {'n': 1})
+
+    with Flask(__name__).test_request_context():
+        assert storage.load_json(path) == {'n': 1}
+        assert storage.load_json(path) == {'n': 1}
+        storage.save_json(path, {'n': 2})
+        assert storage.load_json(path) == {'n': 2}
+
+    assert storage.CACHE_STATS['request_hits'] == 1
+
+
+# Atomic writes and locks
+
+def test_save_json_failure_leaves_the_old_file(tmp_path):
+    path = str(tmp_path / 'a.json')
+    storage.save_json(path, {'n': 1})
+
+    with pytest.raises(TypeError):
+        storage.save_json(path, {'n': object()})
+
+    assert storage.load_json(path) == {'n': 1}
+    assert os.listdir(tmp_path) == ['a.json']
+
+
+def test_file_locks_exclude_other_threads_and_reenter(tmp_path):
+    locks = storage.FileLocks(str(tmp_path))
+    order = []
+
+    def other():
+        with locks.hold('employees'):
+            order.append('other')
+
+    with locks.hold('employees'):
+        with locks.hold('employees'):
+            thread = threading.Thread(target=other)
+            thread.start()
+            thread.join(0.2)
+            order.append('first')
+    thread.join()
+
+    assert order == ['first', 'other']
+
+
+def test_json_store_puts_from_many_threads_all_land(tmp_path):
+    store = open_store(str(tmp_path), 'json')
+    store.save('preferences', {})
+
+    threads = [threading.Thread(target=store.put, args=('preferences', f'employee{i}', {'top_12': [i]}))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store.load('preferences')) == 20
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
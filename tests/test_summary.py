@@ -0,0 +1,96 @@
+import json
+
+import app
+from conftest import login
+
+PREFS = {'top_12': list(range(12)), 'bottom_6': list(range(40, 46)), 'shift_type_pref': {'saturday': '1'}}
+
+
+def roster(client, **params):
+    response = client.get('/api/roster', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def recounted():
+    """The counters a rebuild from the store gives"""
+    return {key: value for key, value in app.SUMMARY.rebuild().items() if key not in ('rebuilt', 'updated')}
+
+
+def test_summary_keeps_counts_not_username_lists(client):
+    login(client, 'admin', 'admin123')
+    roster(client)
+
+    with open(app.SUMMARY.path) as f:
+        saved = json.load(f)
+
+    assert isinstance(saved['employees'], int)
+    assert isinstance(saved['submitted'], int)
+    assert isinstance(saved['assigned'], int)
+
+
+def test_summary_counters_follow_writes(client):
+    login(client, 'admin', 'admin123')
+    before = roster(client)['summary']
+
+    app.STORE.put('preferences', 'employee1', PREFS)
+    app.STORE.put('preferences', 'employee2', {**PREFS, 'bottom_6': [40]})  # incomplete
+    app.STORE.put('employees', 'newhire', {'name': 'New Hire', 'password': 'x', 'is_manager': False})
+    app.STORE.update('preferences', {'employee2': PREFS, 'newhire': PREFS})
+    app.STORE.delete('preferences', 'employee1')
+    app.STORE.put('preferences', 'admin', PREFS)  # managers don't count
+    after = roster(client)['summary']
+
+    assert after['total_employees'] == before['total_employees'] + 1
+    assert after['submitted'] == before['submitted'] + 2
+    assert after['pending'] == after['total_employees'] - after['submitted']
+
+    # Deleting an employee with a complete submission takes it out of both
+    app.STORE.delete('employees', 'newhire')
+    counts = roster(client)['summary']
+    assert counts['total_employees'] == before['total_employees']
+    assert counts['submitted'] == before['submitted'] + 1
+
+    # Incremental counts match a full recount
+    saved = {key: value for key, value in app.SUMMARY._load().items() if key not in ('rebuilt', 'updated')}
+    assert saved == recounted()
+
+
+def test_summary_recounts_on_replace_and_rebuilds_an_old_format(client):
+    login(client, 'admin', 'admin123')
+    roster(client)
+
+    app.STORE.save('preferences', {'employee1': PREFS, 'employee3': PREFS})
+    assert roster(client)['summary']['submitted'] == 2
+
+    # A summary.json from before counters replaced the username lists
+    with open(app.SUMMARY.path, 'w') as f:
+        json.dump({'employees': ['employee1'], 'submitted': [], 'assigned': []}, f)
+    assert roster(client)['summary']['submitted'] == 2
+
+
+def test_roster_pages(client):
+    login(client, 'admin', 'admin123')
+    total = roster(client)['total']
+
+    first = roster(client, page=1, per_page=7)
+    last = roster(client, page=first['pages'], per_page=7)
+    everyone = [row['username'] for page in range(1, first['pages'] + 1)
+                for row in roster(client, page=page, per_page=7)['items']]
+
+    assert first['pages'] == -(-total // 7)
+    assert len(first['items']) == 7
+    assert len(last['items']) == total - 7 * (first['pages'] - 1)
+    assert len(everyone) == len(set(everyone)) == total
+    assert roster(client, page=first['pages'] + 1, per_page=7)['items'] == []
+    assert client.get('/api/roster?per_page=0').status_code == 400
+
+
+def test_roster_filters_by_status(client):
+    login(client, 'admin', 'admin123')
+    app.STORE.put('preferences', 'employee1', PREFS)
+
+    complete = roster(client, status='complete')
+
+    assert [row['username'] for row in complete['items']] == ['employee1']
+    assert complete['summary']['submitted'] == 1